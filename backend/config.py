@@ -1,12 +1,65 @@
+import json
+import os
 from pathlib import Path
 from functools import lru_cache
+from types import MappingProxyType
 
 import yaml
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
-from pydantic import SecretStr, Field
-from typing import List
-
+from pydantic import SecretStr, Field, PrivateAttr
+from typing import List, Mapping, NamedTuple
+
+try:
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:  # PyYAML built without libyaml
+    from yaml import SafeLoader as _YamlLoader
+
+
+def _freeze(value):
+    """Return a read-only deep copy: dicts become mappingproxies, lists tuples."""
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+class _YamlSections(NamedTuple):
+    """Read-only views of settings.yaml, resolved once per Settings.
+
+    Frozen all the way down: the sections are shared by every caller.
+    """
+    models_config: tuple[Mapping, ...]
+    models_by_id: Mapping[str, Mapping]
+    default_model: str
+    rag_config: Mapping
+    voice_config: Mapping
+    pricing_config: Mapping
+    pricing_by_model: Mapping[str, Mapping]
+    embedding_config: Mapping
+
+    @classmethod
+    def from_yaml(cls, yaml_config: dict) -> "_YamlSections":
+        yaml_config = _freeze(yaml_config)
+        models = yaml_config.get("models", {})
+        available = tuple(models.get("available", []))
+        pricing = yaml_config.get("pricing", {})
+        return cls(
+            models_config=available,
+            models_by_id=MappingProxyType({m["id"]: m for m in available}),
+            default_model=models.get("default", "gpt-4o"),
+            rag_config=yaml_config.get("rag", MappingProxyType({})),
+            voice_config=yaml_config.get("voice", MappingProxyType({})),
+            pricing_config=pricing,
+            # Provider-grouped pricing flattened to model id -> rates
+            pricing_by_model=MappingProxyType({
+                model_id: rates
+                for provider_models in pricing.values()
+                for model_id, rates in provider_models.items()
+            }),
+            embedding_config=yaml_config.get("embedding", MappingProxyType({})),
+        )
 
 
 class Settings(BaseSettings):
@@ -25,8 +78,19 @@ class Settings(BaseSettings):
     # Database
     database_url: str = "./data/perplexity.db"
 
-    # ChromaDB
+    # ChromaDB: "persistent" (embedded, on-disk) or "server" (a Chroma
+    # server at chroma_host:chroma_port, which takes concurrent writers)
+    chroma_mode: str = "persistent"
+    chroma_host: str = "localhost"
+    chroma_port: int = 8001
     chroma_persist_dir: str = "./data/vectorstore"
+    # Chunks per collection.add call (one SQLite transaction + index update)
+    chroma_batch_size: int = 128
+    # Switch Chroma's SQLite file to WAL journaling (see VectorStoreManager)
+    chroma_fast_writes: bool = False
+
+    # Derived data that can be rebuilt (e.g. extracted PDF text)
+    cache_dir: str = "./data/cache"
 
     # Server
     backend_port: int = 8000
@@ -42,37 +106,74 @@ class Settings(BaseSettings):
 
     # Loaded from YAML
     yaml_config: dict = {}
+    _sections: _YamlSections = PrivateAttr()
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         yaml_path = Path(__file__).parent.parent / "config" / "settings.yaml"
         if yaml_path.exists():
-            with open(yaml_path, "r", encoding="utf-8") as f:
-                self.yaml_config = yaml.safe_load(f) or {}
+            self.yaml_config = _load_yaml_config(yaml_path)
+        self._sections = _YamlSections.from_yaml(self.yaml_config)
+
+    @property
+    def models_config(self) -> tuple[Mapping, ...]:
+        return self._sections.models_config
 
     @property
-    def models_config(self) -> list[dict]:
-        return self.yaml_config.get("models", {}).get("available", [])
+    def models_by_id(self) -> Mapping[str, Mapping]:
+        return self._sections.models_by_id
 
     @property
     def default_model(self) -> str:
-        return self.yaml_config.get("models", {}).get("default", "gpt-4o")
+        return self._sections.default_model
+
+    @property
+    def rag_config(self) -> Mapping:
+        return self._sections.rag_config
 
     @property
-    def rag_config(self) -> dict:
-        return self.yaml_config.get("rag", {})
+    def voice_config(self) -> Mapping:
+        return self._sections.voice_config
 
     @property
-    def voice_config(self) -> dict:
-        return self.yaml_config.get("voice", {})
+    def pricing_config(self) -> Mapping:
+        return self._sections.pricing_config
 
     @property
-    def pricing_config(self) -> dict:
-        return self.yaml_config.get("pricing", {})
+    def pricing_by_model(self) -> Mapping[str, Mapping]:
+        return self._sections.pricing_by_model
 
     @property
-    def embedding_config(self) -> dict:
-        return self.yaml_config.get("embedding", {})
+    def embedding_config(self) -> Mapping:
+        return self._sections.embedding_config
+
+
+def _load_yaml_config(yaml_path: Path) -> dict:
+    """Load settings.yaml, going through a JSON sidecar cache when fresh.
+
+    The parsed YAML is written next to the source as ``settings.yaml.json``;
+    as long as its mtime is not older than the YAML file it is loaded with
+    the (much faster) json module instead of re-parsing the YAML.
+    """
+    cache_path = yaml_path.with_suffix(".yaml.json")
+    try:
+        if cache_path.stat().st_mtime >= yaml_path.stat().st_mtime:
+            return json.loads(cache_path.read_bytes())
+    except (OSError, ValueError):
+        pass  # Missing or corrupt cache -- fall back to parsing the YAML
+
+    with open(yaml_path, "r", encoding="utf-8") as f:
+        config = yaml.load(f, Loader=_YamlLoader) or {}
+
+    # Write atomically so concurrent workers never read a half-written file
+    tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+    try:
+        tmp_path.write_text(json.dumps(config), encoding="utf-8")
+        os.replace(tmp_path, cache_path)
+    except (OSError, TypeError, ValueError):
+        # Read-only config dir or non-JSON-serializable YAML -- not fatal
+        tmp_path.unlink(missing_ok=True)
+    return config
 
 
 @lru_cache
@@ -1,6 +1,19 @@
+import asyncio
+import itertools
+import logging
+import os
+import time
+import uuid
+
 import aiosqlite
 from contextlib import asynccontextmanager
 
+logger = logging.getLogger(__name__)
+
+# Bump whenever SCHEMA_SQL changes; stored in PRAGMA user_version so an
+# up-to-date database skips the schema script at startup.
+SCHEMA_VERSION = 4
+
 SCHEMA_SQL = """
 CREATE TABLE IF NOT EXISTS conversations (
     id TEXT PRIMARY KEY,
@@ -11,7 +24,8 @@ CREATE TABLE IF NOT EXISTS conversations (
     updated_at TEXT NOT NULL DEFAULT (datetime('now')),
     total_input_tokens INTEGER NOT NULL DEFAULT 0,
     total_output_tokens INTEGER NOT NULL DEFAULT 0,
-    total_cost_usd REAL NOT NULL DEFAULT 0.0
+    total_cost_usd REAL NOT NULL DEFAULT 0.0,
+    message_count INTEGER NOT NULL DEFAULT 0
 );
 
 CREATE TABLE IF NOT EXISTS messages (
@@ -65,9 +79,119 @@ CREATE INDEX IF NOT EXISTS idx_messages_conversation ON messages(conversation_id
 CREATE INDEX IF NOT EXISTS idx_documents_conversation ON documents(conversation_id);
 CREATE INDEX IF NOT EXISTS idx_cost_log_conversation ON cost_log(conversation_id);
 CREATE INDEX IF NOT EXISTS idx_analytics_events_type ON analytics_events(event_type);
+
+-- Analytics: every query is a created_at range scan; the trailing columns
+-- make the indexes covering so grouping never touches the table rows.
+CREATE INDEX IF NOT EXISTS idx_cost_log_created_model ON cost_log(
+    created_at, model_id, operation, cost_usd, input_tokens, output_tokens
+);
+CREATE INDEX IF NOT EXISTS idx_messages_created_role ON messages(created_at, role, used_docs);
+CREATE INDEX IF NOT EXISTS idx_conversations_created ON conversations(created_at);
+CREATE INDEX IF NOT EXISTS idx_documents_uploaded ON documents(uploaded_at);
+CREATE INDEX IF NOT EXISTS idx_analytics_events_created ON analytics_events(created_at, event_type);
+
+-- Conversation list (newest activity first)
+CREATE INDEX IF NOT EXISTS idx_conversations_updated ON conversations(updated_at DESC);
+
+-- Row counts kept by triggers so the health check never runs COUNT(*).
+-- Re-seeded whenever this script runs (i.e. on a schema version bump).
+CREATE TABLE IF NOT EXISTS row_counts (
+    name TEXT PRIMARY KEY,
+    n INTEGER NOT NULL DEFAULT 0
+);
+INSERT OR REPLACE INTO row_counts (name, n)
+    SELECT 'conversations', COUNT(*) FROM conversations
+    UNION ALL SELECT 'documents', COUNT(*) FROM documents;
+
+CREATE TRIGGER IF NOT EXISTS trg_conversations_insert AFTER INSERT ON conversations
+BEGIN UPDATE row_counts SET n = n + 1 WHERE name = 'conversations'; END;
+CREATE TRIGGER IF NOT EXISTS trg_conversations_delete AFTER DELETE ON conversations
+BEGIN UPDATE row_counts SET n = n - 1 WHERE name = 'conversations'; END;
+CREATE TRIGGER IF NOT EXISTS trg_documents_insert AFTER INSERT ON documents
+BEGIN UPDATE row_counts SET n = n + 1 WHERE name = 'documents'; END;
+CREATE TRIGGER IF NOT EXISTS trg_documents_delete AFTER DELETE ON documents
+BEGIN UPDATE row_counts SET n = n - 1 WHERE name = 'documents'; END;
+
+-- Deleting a conversation takes its messages (ON DELETE CASCADE) and its
+-- cost records with it.  cost_log's foreign key is ON DELETE SET NULL, and
+-- SQLite can't alter a constraint without rebuilding the table, so its rows
+-- are removed by this trigger before the key action would null them.
+CREATE TRIGGER IF NOT EXISTS trg_conversations_delete_costs BEFORE DELETE ON conversations
+BEGIN DELETE FROM cost_log WHERE conversation_id = old.id; END;
 """
 
+# Version 2: conversations.message_count, kept up to date by add_message,
+# replaces counting messages per conversation on every list
+_ADD_MESSAGE_COUNT_SQL = """
+ALTER TABLE conversations ADD COLUMN message_count INTEGER NOT NULL DEFAULT 0;
+UPDATE conversations SET message_count = (
+    SELECT COUNT(*) FROM messages m WHERE m.conversation_id = conversations.id
+);
+"""
+
+# Applied once per connection in a single round-trip.  synchronous=NORMAL is
+# durable under WAL (only the last commits can roll back on power loss) and
+# avoids an fsync per transaction; busy_timeout lets concurrent writers wait
+# instead of failing with SQLITE_BUSY.
+CONNECTION_PRAGMAS = """
+PRAGMA journal_mode=WAL;
+PRAGMA synchronous=NORMAL;
+PRAGMA busy_timeout=30000;
+PRAGMA cache_size=-20000;
+PRAGMA temp_store=MEMORY;
+PRAGMA mmap_size=134217728;
+PRAGMA foreign_keys=ON;
+"""
+
+# Bound the work PRAGMA optimize may do so it stays cheap on large tables.
+OPTIMIZE_PRAGMAS = "PRAGMA analysis_limit=400; PRAGMA optimize;"
+
+# Prepared statements kept per connection; comfortably above the number of
+# distinct SQL strings the app issues, so pooled connections never re-prepare.
+STATEMENT_CACHE_SIZE = 256
+
+# Long-lived reader connections shared by all requests.  Under WAL readers
+# never block each other (or the writer), so a handful covers the app's
+# concurrency.  Writes go through one dedicated connection: SQLite allows a
+# single writer anyway, and serializing them in-process avoids busy waits.
+POOL_SIZE = 4
+
+# Most units the background writer commits in one transaction
+WRITE_BATCH_SIZE = 100
+
+# After the first queued write, how long the writer lingers for more before
+# committing, so a burst of chat/voice writes shares one transaction
+WRITE_BATCH_WINDOW = 0.05  # seconds
+
 _db_path: str = ""
+_pool: asyncio.Queue | None = None
+_pool_connections: list[aiosqlite.Connection] = []
+_writer_db: aiosqlite.Connection | None = None
+_writer_lock: asyncio.Lock | None = None
+_write_queue: asyncio.Queue | None = None
+_writer_task: asyncio.Task | None = None
+
+# (sql, params) -- a unit of work is a tuple of these, applied atomically
+Statement = tuple[str, tuple]
+
+
+def uuid7() -> str:
+    """Return a new time-ordered (version 7) UUID string for a primary key.
+
+    The leading 48 bits are the Unix time in milliseconds, so new rows land
+    at the right-hand end of the primary-key index instead of at random
+    pages; the remaining bits are random.
+    """
+    ms = time.time_ns() // 1_000_000
+    rand = int.from_bytes(os.urandom(10), "big")
+    value = (
+        (ms & 0xFFFF_FFFF_FFFF) << 80
+        | 0x7 << 76  # version
+        | (rand >> 68) << 64  # 12 random bits
+        | 0b10 << 62  # variant
+        | rand & 0x3FFF_FFFF_FFFF_FFFF  # 62 random bits
+    )
+    return str(uuid.UUID(int=value))
 
 
 def set_db_path(path: str):
@@ -75,21 +199,224 @@ def set_db_path(path: str):
     _db_path = path
 
 
+def get_db_path() -> str:
+    return _db_path
+
+
+async def _connect() -> aiosqlite.Connection:
+    db = await aiosqlite.connect(_db_path, cached_statements=STATEMENT_CACHE_SIZE)
+    db.row_factory = aiosqlite.Row
+    await db.executescript(CONNECTION_PRAGMAS)
+    return db
+
+
+async def open_pool(size: int = POOL_SIZE):
+    """(Re)create the reader pool and writer connection for the current path."""
+    global _pool, _pool_connections, _writer_db, _writer_lock
+    await close_db()
+    connections = [await _connect() for _ in range(size)]
+    pool: asyncio.Queue = asyncio.Queue()
+    for db in connections:
+        pool.put_nowait(db)
+    _pool, _pool_connections = pool, connections
+    _writer_db, _writer_lock = await _connect(), asyncio.Lock()
+
+
+async def close_db():
+    """Close every pooled connection.  Safe to call when no pool is open."""
+    global _pool, _pool_connections, _writer_db, _writer_lock
+    connections = _pool_connections + ([_writer_db] if _writer_db else [])
+    _pool, _pool_connections = None, []
+    _writer_db, _writer_lock = None, None
+    for db in connections:
+        # Let SQLite refresh planner statistics for tables it saw queried
+        await db.executescript(OPTIMIZE_PRAGMAS)
+        await db.close()
+
+
 @asynccontextmanager
 async def get_db():
-    """Yield an aiosqlite connection with WAL mode and foreign keys."""
-    db = await aiosqlite.connect(_db_path)
-    db.row_factory = aiosqlite.Row
-    await db.execute("PRAGMA journal_mode=WAL")
-    await db.execute("PRAGMA foreign_keys=ON")
+    """Yield an aiosqlite connection with WAL mode, tuned PRAGMAs and foreign keys.
+
+    Connections come from the shared reader pool opened by ``init_db``; use
+    ``get_writer`` for anything that commits.  Before the pool exists (e.g.
+    a health check during startup) a one-off connection is opened and
+    closed instead.
+    """
+    pool = _pool
+    if pool is None:
+        db = await _connect()
+        try:
+            yield db
+        finally:
+            await db.close()
+        return
+
+    db = await pool.get()
     try:
         yield db
     finally:
-        await db.close()
+        # Never hand the next caller a connection mid-transaction
+        if db.in_transaction:
+            await db.rollback()
+        pool.put_nowait(db)
 
 
-async def init_db():
-    """Create all tables if they don't exist."""
+@asynccontextmanager
+async def get_writer():
+    """Yield the dedicated writer connection, held exclusively until exit.
+
+    Falls back to a one-off connection before ``init_db`` has run.
+    """
+    if _writer_db is None:
+        async with get_db() as db:
+            yield db
+        return
+
+    async with _writer_lock:
+        db = _writer_db
+        try:
+            yield db
+        finally:
+            if db.in_transaction:
+                await db.rollback()
+
+
+async def fetch_dicts(db: aiosqlite.Connection, sql: str, params=()) -> list[dict]:
+    """Run a query and return its rows as plain dicts.
+
+    Rows are fetched as tuples and zipped with column names read once per
+    query, which is cheaper than ``dict(row)`` on each ``aiosqlite.Row``.
+    """
+    cursor = await db.execute(sql, params)
+    cursor.row_factory = None
+    rows = await cursor.fetchall()
+    columns = [d[0] for d in cursor.description]
+    return [dict(zip(columns, row)) for row in rows]
+
+
+async def optimize_db():
+    """Refresh query-planner statistics (run periodically while the app is up)."""
     async with get_db() as db:
-        await db.executescript(SCHEMA_SQL)
+        await db.executescript(OPTIMIZE_PRAGMAS)
+
+
+async def init_db():
+    """Open the connection pool and create all tables if they don't exist."""
+    await open_pool()
+    async with get_writer() as db:
+        cursor = await db.execute("PRAGMA user_version")
+        version = (await cursor.fetchone())[0]
+        if version < SCHEMA_VERSION:
+            await _migrate(db)
+            await db.executescript(
+                f"{SCHEMA_SQL}\nPRAGMA user_version = {SCHEMA_VERSION};"
+            )
+            await db.commit()
+
+
+async def _migrate(db: aiosqlite.Connection):
+    """Bring tables created by an older SCHEMA_SQL up to date.
+
+    Databases from before user_version was set report version 0, so look at
+    the actual columns rather than trusting the stored version.
+    """
+    rows = await db.execute_fetchall("PRAGMA table_info(conversations)")
+    columns = {r[1] for r in rows}
+    if columns and "message_count" not in columns:
+        await db.executescript(_ADD_MESSAGE_COUNT_SQL)
+
+
+# --- Background writer ---
+#
+# Writes that callers don't need to observe immediately (chat messages,
+# cost records) are queued and applied by a single task, which commits
+# everything queued so far in one transaction instead of one per row.
+
+
+async def _apply(db: aiosqlite.Connection, statements: list[Statement]):
+    # Take the write lock up front: a deferred transaction would start as a
+    # reader and could hit SQLITE_BUSY upgrading while another writer commits
+    await db.execute("BEGIN IMMEDIATE")
+    # Consecutive statements sharing the same SQL go through executemany
+    for sql, group in itertools.groupby(statements, key=lambda st: st[0]):
+        params = [p for _, p in group]
+        if len(params) == 1:
+            await db.execute(sql, params[0])
+        else:
+            await db.executemany(sql, params)
+
+
+async def _write_batch(units: list[tuple[Statement, ...]]):
+    async with get_writer() as db:
+        try:
+            await _apply(db, [st for unit in units for st in unit])
+            await db.commit()
+            return
+        except Exception:
+            await db.rollback()
+            if len(units) == 1:
+                raise
+        # One bad unit (e.g. a row for a just-deleted conversation) must not
+        # sink the rest of the batch: retry the units one at a time
+        for unit in units:
+            try:
+                await _apply(db, list(unit))
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                logger.exception("Background write failed: %s", unit[0][0])
+
+
+async def _writer_loop(queue: asyncio.Queue):
+    while True:
+        units = [await queue.get()]
+        if queue.qsize() < WRITE_BATCH_SIZE - 1:
+            await asyncio.sleep(WRITE_BATCH_WINDOW)
+        while len(units) < WRITE_BATCH_SIZE and not queue.empty():
+            units.append(queue.get_nowait())
+        try:
+            await _write_batch(units)
+        except Exception:
+            logger.exception("Background write failed: %s", units[0][0][0])
+        finally:
+            for _ in units:
+                queue.task_done()
+
+
+def start_writer():
+    """Start the background writer task (call from the app lifespan)."""
+    global _write_queue, _writer_task
+    _write_queue = asyncio.Queue()
+    _writer_task = asyncio.create_task(_writer_loop(_write_queue))
+
+
+async def flush_writes():
+    """Wait until every queued write has been committed."""
+    if _write_queue is not None:
+        await _write_queue.join()
+
+
+async def stop_writer():
+    """Flush pending writes and stop the background writer."""
+    global _write_queue, _writer_task
+    if _writer_task is None:
+        return
+    await flush_writes()
+    _writer_task.cancel()
+    _write_queue, _writer_task = None, None
+
+
+async def execute_write(*statements: Statement, background: bool = False):
+    """Apply ``statements`` in a single transaction.
+
+    With ``background=True`` they are queued for the background writer and
+    this returns without waiting for the commit.  Without a running writer
+    (tests, scripts) the statements are always applied immediately.
+    """
+    if background and _write_queue is not None:
+        _write_queue.put_nowait(statements)
+        return
+    async with get_writer() as db:
+        await _apply(db, list(statements))
         await db.commit()
@@ -1,16 +1,36 @@
+import asyncio
 import logging
+import os
 from pathlib import Path
 from contextlib import asynccontextmanager
+from functools import lru_cache
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from backend.config import get_settings
-from backend.database import init_db, set_db_path
+from backend.database import (
+    init_db, close_db, optimize_db, set_db_path, start_writer, stop_writer,
+)
+from backend.services.cost_tracker import daily_spend, cost_totals
+from backend.services.http_client import close_http_client
+from backend.services.vectorstore import VectorStoreManager
 from backend.routers import health, conversations, chat, documents, voice, costs, analytics, suggestions
 
 logger = logging.getLogger(__name__)
 
+# How often to refresh SQLite planner statistics as tables grow
+_OPTIMIZE_INTERVAL = 900  # seconds
+
+
+async def _optimize_loop():
+    while True:
+        await asyncio.sleep(_OPTIMIZE_INTERVAL)
+        try:
+            await optimize_db()
+        except Exception:
+            logger.warning("PRAGMA optimize failed", exc_info=True)
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -27,11 +47,51 @@ async def lifespan(app: FastAPI):
     # Initialize database
     set_db_path(settings.database_url)
     await init_db()
+    await daily_spend.get_total()  # warm the budget counter
+    await cost_totals.summary()  # and the cost summary totals
+    start_writer()
+    # Opening the vector store starts its index warm-up, which should finish
+    # before the first RAG query rather than race it
+    await asyncio.to_thread(VectorStoreManager.get_instance, settings)
+    optimize_task = asyncio.create_task(_optimize_loop())
     logger.info("JijnasaAI backend started")
 
     yield
 
     logger.info("JijnasaAI backend shutting down")
+    optimize_task.cancel()
+    await stop_writer()
+    await close_db()
+    await close_http_client()
+
+
+@lru_cache
+def _cors_origins() -> tuple[str, ...]:
+    """Allowed CORS origins: local Streamlit defaults plus configured extras."""
+    origins = [
+        "http://localhost:8501",
+        "http://127.0.0.1:8501",
+    ]
+
+    # Extra comma-separated origins from ALLOWED_ORIGINS (env or .env)
+    origins.extend(
+        o.strip()
+        for o in get_settings().allowed_origins.split(",")
+        if o.strip()
+    )
+
+    # Railway: auto-add the public domain so browser→backend CORS works
+    railway_domain = os.environ.get("RAILWAY_PUBLIC_DOMAIN", "")
+    if railway_domain:
+        origins.append(f"https://{railway_domain}")
+
+    # Railway may assign a custom PORT; add localhost:<PORT> for in-container requests
+    railway_port = os.environ.get("PORT", "")
+    if railway_port and railway_port != "8501":
+        origins.append(f"http://localhost:{railway_port}")
+        origins.append(f"http://127.0.0.1:{railway_port}")
+
+    return tuple(origins)
 
 
 def create_app() -> FastAPI:
@@ -52,36 +112,10 @@ def create_app() -> FastAPI:
     app.include_router(analytics.router)
     app.include_router(suggestions.router)
 
-    # CORS: read allowed origins from env, with sensible defaults
-    import os
-
-    extra_origins = os.environ.get("ALLOWED_ORIGINS", "")
-    origins = [
-        "http://localhost:8501",
-        "http://127.0.0.1:8501",
-    ]
-
-    if extra_origins:
-        origins.extend(
-            o.strip()
-            for o in extra_origins.split(",")
-            if o.strip()
-        )
-
-    # Railway: auto-add the public domain so browser→backend CORS works
-    railway_domain = os.environ.get("RAILWAY_PUBLIC_DOMAIN", "")
-    if railway_domain:
-        origins.append(f"https://{railway_domain}")
-
-    # Railway may assign a custom PORT; add localhost:<PORT> for in-container requests
-    railway_port = os.environ.get("PORT", "")
-    if railway_port and railway_port != "8501":
-        origins.append(f"http://localhost:{railway_port}")
-        origins.append(f"http://127.0.0.1:{railway_port}")
-
+    # CORS: local defaults plus ALLOWED_ORIGINS and Railway origins
     app.add_middleware(
         CORSMiddleware,
-        allow_origins=origins,
+        allow_origins=list(_cors_origins()),
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
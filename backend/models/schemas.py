@@ -11,6 +11,13 @@ class ChatRequest(BaseModel):
     temperature: float = Field(default=0.7, ge=0.0, le=2.0)
 
 
+class CompareRequest(BaseModel):
+    message: str = Field(..., min_length=1, max_length=50000)
+    model_ids: list[str] = Field(..., min_length=2, max_length=3)
+    use_rag: bool = False
+    temperature: float = Field(default=0.7, ge=0.0, le=2.0)
+
+
 class MessageResponse(BaseModel):
     id: str
     conversation_id: str
@@ -69,6 +76,12 @@ class SynthesisRequest(BaseModel):
     voice: str = "nova"
 
 
+# --- Suggestions ---
+class SuggestionsResponse(BaseModel):
+    suggestions: list[str]
+    source: str
+
+
 # --- Health ---
 class HealthResponse(BaseModel):
     status: str = "healthy"
@@ -1,20 +1,150 @@
+import asyncio
 import json
 import logging
+import time
 from datetime import datetime, timedelta
 
 from fastapi import APIRouter, Query
 from pydantic import BaseModel
 from typing import Optional
 
-from backend.database import get_db
+from backend.database import get_db, execute_write, flush_writes
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/analytics", tags=["analytics"])
 
+# The dashboard polls the summary while the data changes slowly, so serve
+# repeat hits from memory.  Entries are keyed by ``days`` and tagged with
+# the cache version; logging an event bumps the version, invalidating them.
+_SUMMARY_TTL = 60.0  # seconds
+_summary_cache: dict[tuple[int, frozenset[str]], tuple[float, int, dict]] = {}
+_summary_cache_version = 0
+
+
+# Query text is kept constant so each pooled connection's prepared-statement
+# cache (see backend.database) compiles every statement only once.
+
+# Totals: one round-trip, each row tagged with its metric name
+_TOTALS_SQL = (
+    "SELECT 'conversations', COUNT(*) FROM conversations "
+    "WHERE created_at >= :cutoff "
+    "UNION ALL SELECT 'messages', COUNT(*) FROM messages "
+    "WHERE created_at >= :cutoff AND role != 'system' "
+    "UNION ALL SELECT 'cost_usd', COALESCE(SUM(cost_usd), 0) FROM cost_log "
+    "WHERE created_at >= :cutoff "
+    "UNION ALL SELECT 'documents_uploaded', COUNT(*) FROM documents "
+    "WHERE uploaded_at >= :cutoff "
+    # RAG usage
+    "UNION ALL SELECT 'rag_messages', COUNT(*) FROM messages "
+    "WHERE created_at >= :cutoff AND used_docs = 1 "
+    # Distinct active days
+    "UNION ALL SELECT 'active_days', COUNT(DISTINCT date(created_at)) "
+    "FROM messages WHERE created_at >= :cutoff"
+)
+
+# Conversations per day
+_CONVERSATIONS_PER_DAY_SQL = (
+    "SELECT date(created_at) AS day, COUNT(*) AS count "
+    "FROM conversations WHERE created_at >= ? "
+    "GROUP BY day ORDER BY day"
+)
+
+# Messages per day
+_MESSAGES_PER_DAY_SQL = (
+    "SELECT date(created_at) AS day, COUNT(*) AS count "
+    "FROM messages WHERE created_at >= ? AND role != 'system' "
+    "GROUP BY day ORDER BY day"
+)
+
+# Model popularity (by message count)
+_MODEL_USAGE_SQL = (
+    "SELECT model_id, COUNT(*) AS count "
+    "FROM cost_log WHERE created_at >= ? AND operation = 'chat' "
+    "GROUP BY model_id ORDER BY count DESC"
+)
+
+# Model cost breakdown
+_MODEL_COSTS_SQL = (
+    "SELECT model_id, "
+    "       COALESCE(SUM(cost_usd), 0) AS total_cost, "
+    "       COALESCE(SUM(input_tokens), 0) AS total_input, "
+    "       COALESCE(SUM(output_tokens), 0) AS total_output, "
+    "       COUNT(*) AS call_count "
+    "FROM cost_log WHERE created_at >= ? "
+    "GROUP BY model_id ORDER BY total_cost DESC"
+)
+
+# Daily spend
+_DAILY_SPEND_SQL = (
+    "SELECT date(created_at) AS day, COALESCE(SUM(cost_usd), 0) AS cost "
+    "FROM cost_log WHERE created_at >= ? "
+    "GROUP BY day ORDER BY day"
+)
+
+# Operations breakdown
+_OPERATIONS_SQL = (
+    "SELECT operation, COUNT(*) AS count, COALESCE(SUM(cost_usd), 0) AS cost "
+    "FROM cost_log WHERE created_at >= ? "
+    "GROUP BY operation ORDER BY cost DESC"
+)
+
+# Feature events (comparison mode, etc.)
+_FEATURE_EVENTS_SQL = (
+    "SELECT event_type, COUNT(*) AS count "
+    "FROM analytics_events WHERE created_at >= ? "
+    "GROUP BY event_type ORDER BY count DESC"
+)
+
+# Breakdown sections of the summary, in response order: name -> (query,
+# row -> item)
+_BREAKDOWNS = {
+    "conversations_per_day": (
+        _CONVERSATIONS_PER_DAY_SQL,
+        lambda r: {"date": r[0], "count": r[1]},
+    ),
+    "messages_per_day": (
+        _MESSAGES_PER_DAY_SQL,
+        lambda r: {"date": r[0], "count": r[1]},
+    ),
+    "daily_spend": (
+        _DAILY_SPEND_SQL,
+        lambda r: {"date": r[0], "cost": r[1]},
+    ),
+    "model_usage": (
+        _MODEL_USAGE_SQL,
+        lambda r: {"model_id": r[0], "count": r[1]},
+    ),
+    "model_costs": (
+        _MODEL_COSTS_SQL,
+        lambda r: {
+            "model_id": r[0],
+            "total_cost": r[1],
+            "total_input_tokens": r[2],
+            "total_output_tokens": r[3],
+            "call_count": r[4],
+        },
+    ),
+    "operations": (
+        _OPERATIONS_SQL,
+        lambda r: {"operation": r[0], "count": r[1], "cost": r[2]},
+    ),
+    "feature_events": (
+        _FEATURE_EVENTS_SQL,
+        lambda r: {"event_type": r[0], "count": r[1]},
+    ),
+}
+
+
+async def _fetch_all(sql: str, params: tuple | dict) -> list:
+    """Run one read query on its own pooled connection."""
+    async with get_db() as db:
+        return list(await db.execute_fetchall(sql, params))
+
 
 @router.get("/summary")
 async def get_analytics_summary(
     days: int = Query(default=30, ge=1, le=365),
+    fields: list[str] = Query(default=["all"]),
 ):
     """Return aggregate analytics for the admin dashboard.
 
@@ -26,147 +156,60 @@ async def get_analytics_summary(
     - Total daily API spend
     - Distinct active days (proxy for retention)
     - Top models by cost
-    """
-    cutoff = (datetime.utcnow() - timedelta(days=days)).strftime("%Y-%m-%d")
 
-    async with get_db() as db:
-        # --- Totals ---
-        row = await (await db.execute(
-            "SELECT COUNT(*) FROM conversations WHERE created_at >= ?", (cutoff,)
-        )).fetchone()
-        total_conversations = row[0]
-
-        row = await (await db.execute(
-            "SELECT COUNT(*) FROM messages WHERE created_at >= ? AND role != 'system'",
-            (cutoff,),
-        )).fetchone()
-        total_messages = row[0]
-
-        row = await (await db.execute(
-            "SELECT COALESCE(SUM(cost_usd), 0) FROM cost_log WHERE created_at >= ?",
-            (cutoff,),
-        )).fetchone()
-        total_cost = row[0]
-
-        row = await (await db.execute(
-            "SELECT COUNT(*) FROM documents WHERE uploaded_at >= ?", (cutoff,)
-        )).fetchone()
-        total_documents = row[0]
-
-        # --- Conversations per day ---
-        rows = await (await db.execute(
-            "SELECT date(created_at) AS day, COUNT(*) AS count "
-            "FROM conversations WHERE created_at >= ? "
-            "GROUP BY day ORDER BY day",
-            (cutoff,),
-        )).fetchall()
-        conversations_per_day = [{"date": r[0], "count": r[1]} for r in rows]
-
-        # --- Messages per day ---
-        rows = await (await db.execute(
-            "SELECT date(created_at) AS day, COUNT(*) AS count "
-            "FROM messages WHERE created_at >= ? AND role != 'system' "
-            "GROUP BY day ORDER BY day",
-            (cutoff,),
-        )).fetchall()
-        messages_per_day = [{"date": r[0], "count": r[1]} for r in rows]
-
-        # --- Model popularity (by message count) ---
-        rows = await (await db.execute(
-            "SELECT model_id, COUNT(*) AS count "
-            "FROM cost_log WHERE created_at >= ? AND operation = 'chat' "
-            "GROUP BY model_id ORDER BY count DESC",
-            (cutoff,),
-        )).fetchall()
-        model_usage = [{"model_id": r[0], "count": r[1]} for r in rows]
-
-        # --- Model cost breakdown ---
-        rows = await (await db.execute(
-            "SELECT model_id, "
-            "       COALESCE(SUM(cost_usd), 0) AS total_cost, "
-            "       COALESCE(SUM(input_tokens), 0) AS total_input, "
-            "       COALESCE(SUM(output_tokens), 0) AS total_output, "
-            "       COUNT(*) AS call_count "
-            "FROM cost_log WHERE created_at >= ? "
-            "GROUP BY model_id ORDER BY total_cost DESC",
-            (cutoff,),
-        )).fetchall()
-        model_costs = [
-            {
-                "model_id": r[0],
-                "total_cost": r[1],
-                "total_input_tokens": r[2],
-                "total_output_tokens": r[3],
-                "call_count": r[4],
-            }
-            for r in rows
-        ]
-
-        # --- Daily spend ---
-        rows = await (await db.execute(
-            "SELECT date(created_at) AS day, COALESCE(SUM(cost_usd), 0) AS cost "
-            "FROM cost_log WHERE created_at >= ? "
-            "GROUP BY day ORDER BY day",
-            (cutoff,),
-        )).fetchall()
-        daily_spend = [{"date": r[0], "cost": r[1]} for r in rows]
-
-        # --- RAG usage ---
-        row = await (await db.execute(
-            "SELECT COUNT(*) FROM messages "
-            "WHERE created_at >= ? AND used_docs = 1",
-            (cutoff,),
-        )).fetchone()
-        rag_message_count = row[0]
-
-        # --- Distinct active days ---
-        row = await (await db.execute(
-            "SELECT COUNT(DISTINCT date(created_at)) "
-            "FROM messages WHERE created_at >= ?",
-            (cutoff,),
-        )).fetchone()
-        active_days = row[0]
-
-        # --- Operations breakdown ---
-        rows = await (await db.execute(
-            "SELECT operation, COUNT(*) AS count, COALESCE(SUM(cost_usd), 0) AS cost "
-            "FROM cost_log WHERE created_at >= ? "
-            "GROUP BY operation ORDER BY cost DESC",
-            (cutoff,),
-        )).fetchall()
-        operations = [
-            {"operation": r[0], "count": r[1], "cost": r[2]} for r in rows
-        ]
-
-        # --- Feature events (comparison mode, etc.) ---
-        rows = await (await db.execute(
-            "SELECT event_type, COUNT(*) AS count "
-            "FROM analytics_events WHERE created_at >= ? "
-            "GROUP BY event_type ORDER BY count DESC",
-            (cutoff,),
-        )).fetchall()
-        feature_events = [{"event_type": r[0], "count": r[1]} for r in rows]
-
-    return {
+    ``totals`` are always returned; pass ``fields`` (repeatable) to compute
+    only some of the per-day/per-model breakdowns, e.g. ``fields=daily_spend``,
+    or ``fields=totals`` for none of them.  Results are cached per
+    ``(days, fields)`` for ``_SUMMARY_TTL`` seconds.
+    """
+    # Unknown names (including "totals") select no breakdowns
+    wanted = frozenset(_BREAKDOWNS) if "all" in fields else frozenset(_BREAKDOWNS) & set(fields)
+    cache_key = (days, wanted)
+
+    version = _summary_cache_version
+    cached = _summary_cache.get(cache_key)
+    if cached:
+        cached_at, cached_version, summary = cached
+        if cached_version == version and time.monotonic() - cached_at < _SUMMARY_TTL:
+            return summary
+
+    # Computed once for every query.  Formatted like the stored created_at
+    # values so the comparison is a plain range over the created_at indexes.
+    cutoff_date = (datetime.utcnow() - timedelta(days=days)).date().isoformat()
+    cutoff = f"{cutoff_date} 00:00:00"
+
+    # Make queued events and chat writes visible to the aggregation
+    await flush_writes()
+
+    # Totals and the requested breakdowns run concurrently, each on its own
+    # pooled connection (WAL readers don't block each other)
+    sections = [name for name in _BREAKDOWNS if name in wanted]
+    total_rows, *results = await asyncio.gather(
+        _fetch_all(_TOTALS_SQL, {"cutoff": cutoff}),
+        *(_fetch_all(_BREAKDOWNS[name][0], (cutoff,)) for name in sections),
+    )
+    totals = {r[0]: r[1] for r in total_rows}
+
+    summary = {
         "period_days": days,
-        "cutoff_date": cutoff,
+        "cutoff_date": cutoff_date,
         "totals": {
-            "conversations": total_conversations,
-            "messages": total_messages,
-            "cost_usd": total_cost,
-            "documents_uploaded": total_documents,
-            "rag_messages": rag_message_count,
-            "active_days": active_days,
+            "conversations": totals["conversations"],
+            "messages": totals["messages"],
+            "cost_usd": totals["cost_usd"],
+            "documents_uploaded": totals["documents_uploaded"],
+            "rag_messages": totals["rag_messages"],
+            "active_days": totals["active_days"],
         },
-        "conversations_per_day": conversations_per_day,
-        "messages_per_day": messages_per_day,
-        "daily_spend": daily_spend,
-        "model_usage": model_usage,
-        "model_costs": model_costs,
-        "operations": operations,
-        "feature_events": feature_events,
     }
 
+    for name, rows in zip(sections, results):
+        to_item = _BREAKDOWNS[name][1]
+        summary[name] = [to_item(r) for r in rows]
+
+    _summary_cache[cache_key] = (time.monotonic(), version, summary)
+    return summary
+
 
 class AnalyticsEvent(BaseModel):
     event_type: str
@@ -176,10 +219,14 @@ class AnalyticsEvent(BaseModel):
 @router.post("/event")
 async def log_analytics_event(event: AnalyticsEvent):
     """Log a feature usage event (e.g. comparison_mode, rag_query)."""
-    async with get_db() as db:
-        await db.execute(
+    global _summary_cache_version
+    # Queued for the background writer, which commits events in batches
+    await execute_write(
+        (
             "INSERT INTO analytics_events (event_type, event_data) VALUES (?, ?)",
             (event.event_type, json.dumps(event.event_data)),
-        )
-        await db.commit()
+        ),
+        background=True,
+    )
+    _summary_cache_version += 1
     return {"status": "ok"}
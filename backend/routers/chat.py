@@ -1,16 +1,18 @@
-import json
+import asyncio
 import logging
+from typing import Mapping
+
+import orjson
 
 from fastapi import APIRouter, Depends
 from sse_starlette.sse import EventSourceResponse
 
-from backend.models.schemas import ChatRequest
+from backend.models.schemas import ChatRequest, CompareRequest
 from backend.services.llm_router import LLMRouter
 from backend.services.rag_engine import RAGEngine
 from backend.services.cost_tracker import CostTracker
 from backend.services.conversation_service import ConversationService
 from backend.config import get_settings
-from backend.database import get_db
 from backend.dependencies import (
     get_llm_router, get_rag_engine,
     get_cost_tracker, get_conversation_service,
@@ -25,13 +27,23 @@ DEFAULT_SYSTEM_PROMPT = (
     "and cite the source documents. If you are unsure, say so."
 )
 
+# The system prompt and history form a prefix that stays identical from turn
+# to turn, so providers can serve it from their prompt cache.  Retrieved
+# context changes with every question, so it goes in the new user turn.
 RAG_SYSTEM_PROMPT = (
-    "You are an assistant answering questions using ONLY the following documents as context. "
+    "You are an assistant answering questions using ONLY the documents given "
+    "as context with the user's message. "
     "If the answer is not found in the documents, say so clearly. "
-    "Cite the source document and chunk when referencing information.\n\n"
-    "--- DOCUMENT CONTEXT ---\n{context}\n--- END CONTEXT ---"
+    "Cite the source document and chunk when referencing information."
+)
+
+RAG_USER_TEMPLATE = (
+    "--- DOCUMENT CONTEXT ---\n{context}\n--- END CONTEXT ---\n\n{message}"
 )
 
+# Prior messages sent back to the model each turn; older ones are dropped
+_HISTORY_LIMIT = 40
+
 
 @router.post("/completions")
 async def chat_completions(
@@ -46,84 +58,91 @@ async def chat_completions(
     async def event_generator():
         try:
             # Check daily spend cap
-            settings = get_settings()
-            if settings.max_daily_spend_usd > 0:
-                async with get_db() as db:
-                    cursor = await db.execute(
-                        "SELECT COALESCE(SUM(cost_usd), 0) FROM cost_log "
-                        "WHERE created_at >= date('now')"
-                    )
-                    row = await cursor.fetchone()
-                    today_spend = row[0] if row else 0.0
-                if today_spend >= settings.max_daily_spend_usd:
+            budget_error = await _budget_error(cost_tracker)
+            if budget_error:
+                yield budget_error
+                return
+
+            # Load an existing conversation and its recent history concurrently
+            conversation_id = request.conversation_id
+            conv = None
+            history: list[dict] = []
+            if conversation_id:
+                conv, history = await asyncio.gather(
+                    conv_service.get_conversation(conversation_id),
+                    conv_service.get_conversation_messages(
+                        conversation_id, limit=_HISTORY_LIMIT
+                    ),
+                )
+                # Checked up front: the messages below are queued, and the
+                # writer would only log their foreign key failure
+                if conv is None:
                     yield {
                         "event": "error",
-                        "data": json.dumps({
-                            "error": f"Daily budget of ${settings.max_daily_spend_usd:.2f} "
-                                     f"reached (${today_spend:.2f} spent today). "
-                                     f"Try again tomorrow."
-                        }),
+                        "data": _dumps({"error": "Conversation not found"}),
                     }
                     return
 
-            # Create or load conversation
-            conversation_id = request.conversation_id
+            # Create conversation if needed
             is_new = False
             if not conversation_id:
-                result = await conv_service.create_conversation(request.model_id)
-                conversation_id = result["id"]
+                conv = await conv_service.create_conversation(request.model_id)
+                conversation_id = conv["id"]
                 is_new = True
                 yield {
                     "event": "conversation",
-                    "data": json.dumps({"conversation_id": conversation_id}),
+                    "data": _dumps({"conversation_id": conversation_id}),
                 }
 
-            # Get conversation for system prompt
-            conv = await conv_service.get_conversation(conversation_id)
             custom_system_prompt = conv.get("system_prompt", "") if conv else ""
 
-            # Save user message
+            # Save user message (queued -- the prompt below is built from the
+            # history loaded above plus this message)
             await conv_service.add_message(
-                conversation_id, "user", request.message, used_docs=request.use_rag
+                conversation_id, "user", request.message,
+                used_docs=request.use_rag, background=True,
             )
 
             # Build messages list from conversation history
             system_prompt = custom_system_prompt or DEFAULT_SYSTEM_PROMPT
             messages = []
 
-            # If RAG is enabled, retrieve context and augment system prompt
+            # If RAG is enabled, retrieve context and add it to the user turn
             sources = []
+            user_content = request.message
             if request.use_rag:
                 context, sources = await rag_engine.retrieve_context(
                     request.message, conversation_id
                 )
                 if context:
-                    system_prompt = RAG_SYSTEM_PROMPT.format(context=context)
+                    system_prompt = RAG_SYSTEM_PROMPT
+                    user_content = RAG_USER_TEMPLATE.format(
+                        context=context, message=request.message
+                    )
                 if sources:
                     yield {
                         "event": "sources",
-                        "data": json.dumps(sources),
+                        "data": _dumps(sources),
                     }
 
             messages.append({"role": "system", "content": system_prompt})
 
-            # Add conversation history
-            history = await conv_service.get_conversation_messages(conversation_id)
+            # Add recent conversation history, then the new user message
             for msg in history:
                 if msg["role"] in ("user", "assistant"):
                     messages.append({
                         "role": msg["role"],
                         "content": msg["content"],
                     })
+            messages.append({"role": "user", "content": user_content})
 
-            # Get max_tokens from model config
-            model_cfg = _get_model_config(llm_router, request.model_id)
-            max_tokens = model_cfg.get("max_tokens", 4096) if model_cfg else 4096
+            max_tokens = _max_tokens(llm_router, request.model_id)
 
             # Stream LLM response
             full_response = ""
             input_tokens = 0
             output_tokens = 0
+            cached_tokens = 0
             web_citations = []
 
             async for chunk in llm_router.stream_chat(
@@ -134,22 +153,20 @@ async def chat_completions(
             ):
                 if chunk.text:
                     full_response += chunk.text
-                    yield {
-                        "event": "token",
-                        "data": json.dumps({"text": chunk.text}),
-                    }
+                    yield {"event": "token", "data": _token_data(chunk.text)}
                 if chunk.citations:
                     web_citations.extend(chunk.citations)
                 if chunk.is_final:
                     input_tokens = chunk.input_tokens
                     output_tokens = chunk.output_tokens
+                    cached_tokens = chunk.cached_tokens
 
             # Log stream results for debugging
             logger.info(
                 "Chat stream complete: model=%s response_len=%d citations=%d "
-                "input_tokens=%d output_tokens=%d",
+                "input_tokens=%d cached_tokens=%d output_tokens=%d",
                 request.model_id, len(full_response), len(web_citations),
-                input_tokens, output_tokens,
+                input_tokens, cached_tokens, output_tokens,
             )
             if not full_response:
                 logger.warning(
@@ -159,22 +176,14 @@ async def chat_completions(
 
             # Emit web search sources if any provider returned citations
             if web_citations:
-                # Deduplicate by URL
-                seen_urls = set()
-                unique_citations = []
-                for c in web_citations:
-                    url = c.get("url", "")
-                    if url and url not in seen_urls:
-                        seen_urls.add(url)
-                        unique_citations.append(c)
                 yield {
                     "event": "web_sources",
-                    "data": json.dumps(unique_citations),
+                    "data": _dumps(_unique_citations(web_citations)),
                 }
 
             # Calculate cost
             cost = cost_tracker.calculate_chat_cost(
-                request.model_id, input_tokens, output_tokens
+                request.model_id, input_tokens, output_tokens, cached_tokens
             )
 
             # Save assistant message
@@ -185,6 +194,7 @@ async def chat_completions(
                 output_tokens=output_tokens,
                 cost_usd=cost,
                 used_docs=request.use_rag and bool(sources),
+                background=True,
             )
 
             # Log cost
@@ -196,10 +206,11 @@ async def chat_completions(
                 input_tokens=input_tokens,
                 output_tokens=output_tokens,
                 cost_usd=cost,
+                background=True,
             )
 
             # Auto-title new conversations after first exchange
-            if is_new or (await conv_service.get_message_count(conversation_id)) <= 2:
+            if is_new or not history:
                 try:
                     await _auto_title(
                         conv_service, llm_router, conversation_id,
@@ -211,8 +222,9 @@ async def chat_completions(
             # Send usage summary
             yield {
                 "event": "usage",
-                "data": json.dumps({
+                "data": _dumps({
                     "input_tokens": input_tokens,
+                    "cached_tokens": cached_tokens,
                     "output_tokens": output_tokens,
                     "cost_usd": cost,
                     "model_id": request.model_id,
@@ -220,26 +232,190 @@ async def chat_completions(
                 }),
             }
 
-            yield {"event": "done", "data": json.dumps({"status": "complete"})}
+            yield {"event": "done", "data": _dumps({"status": "complete"})}
 
         except Exception as e:
             logger.exception("Chat streaming failed")
             yield {
                 "event": "error",
-                "data": json.dumps({"error": str(e)}),
+                "data": _dumps({"error": str(e)}),
             }
 
     return EventSourceResponse(event_generator())
 
 
-def _get_model_config(llm_router: LLMRouter, model_id: str) -> dict | None:
-    """Look up model config from settings."""
-    for m in llm_router._settings.models_config:
-        if m["id"] == model_id:
-            return m
+@router.post("/compare")
+async def chat_compare(
+    request: CompareRequest,
+    llm_router: LLMRouter = Depends(get_llm_router),
+    rag_engine: RAGEngine = Depends(get_rag_engine),
+    cost_tracker: CostTracker = Depends(get_cost_tracker),
+):
+    """Stream several models' answers to one message over a single SSE stream.
+
+    Comparisons are not saved to a conversation, only to the cost log.  Per-
+    model events (``token``, ``web_sources``, ``usage``, ``error``, ``done``)
+    carry the model's position in ``model_ids`` as ``idx`` in their data;
+    ``sources`` is shared, and a final ``done`` without ``idx`` ends the stream.
+    """
+
+    async def event_generator():
+        tasks: list[asyncio.Task] = []
+        try:
+            budget_error = await _budget_error(cost_tracker)
+            if budget_error:
+                yield budget_error
+                return
+
+            # Retrieval runs once for every model
+            system_prompt = DEFAULT_SYSTEM_PROMPT
+            user_content = request.message
+            if request.use_rag:
+                context, sources = await rag_engine.retrieve_context(request.message, None)
+                if context:
+                    system_prompt = RAG_SYSTEM_PROMPT
+                    user_content = RAG_USER_TEMPLATE.format(
+                        context=context, message=request.message
+                    )
+                if sources:
+                    yield {"event": "sources", "data": _dumps(sources)}
+            messages = [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_content},
+            ]
+
+            # Models stream concurrently into one queue of ready SSE events;
+            # None marks a model as finished
+            events: asyncio.Queue[dict | None] = asyncio.Queue()
+
+            async def _run(idx: int, model_id: str):
+                try:
+                    input_tokens = output_tokens = cached_tokens = 0
+                    citations = []
+                    async for chunk in llm_router.stream_chat(
+                        messages=messages,
+                        model_id=model_id,
+                        temperature=request.temperature,
+                        max_tokens=_max_tokens(llm_router, model_id),
+                    ):
+                        if chunk.text:
+                            events.put_nowait({
+                                "event": "token",
+                                "data": _dumps({"idx": idx, "text": chunk.text}),
+                            })
+                        if chunk.citations:
+                            citations.extend(chunk.citations)
+                        if chunk.is_final:
+                            input_tokens = chunk.input_tokens
+                            output_tokens = chunk.output_tokens
+                            cached_tokens = chunk.cached_tokens
+
+                    if citations:
+                        events.put_nowait({
+                            "event": "web_sources",
+                            "data": _dumps({
+                                "idx": idx, "sources": _unique_citations(citations),
+                            }),
+                        })
+                    cost = cost_tracker.calculate_chat_cost(
+                        model_id, input_tokens, output_tokens, cached_tokens
+                    )
+                    await cost_tracker.log_cost(
+                        model_id=model_id,
+                        operation="chat",
+                        input_tokens=input_tokens,
+                        output_tokens=output_tokens,
+                        cost_usd=cost,
+                        background=True,
+                    )
+                    events.put_nowait({
+                        "event": "usage",
+                        "data": _dumps({
+                            "idx": idx,
+                            "input_tokens": input_tokens,
+                            "cached_tokens": cached_tokens,
+                            "output_tokens": output_tokens,
+                            "cost_usd": cost,
+                            "model_id": model_id,
+                        }),
+                    })
+                    events.put_nowait({"event": "done", "data": _dumps({"idx": idx})})
+                except Exception as e:
+                    logger.exception("Comparison stream failed: model=%s", model_id)
+                    events.put_nowait({
+                        "event": "error", "data": _dumps({"idx": idx, "error": str(e)}),
+                    })
+                finally:
+                    events.put_nowait(None)
+
+            tasks = [
+                asyncio.create_task(_run(idx, model_id))
+                for idx, model_id in enumerate(request.model_ids)
+            ]
+            running = len(tasks)
+            while running:
+                event = await events.get()
+                if event is None:
+                    running -= 1
+                else:
+                    yield event
+
+            yield {"event": "done", "data": _dumps({"status": "complete"})}
+
+        except Exception as e:
+            logger.exception("Comparison streaming failed")
+            yield {"event": "error", "data": _dumps({"error": str(e)})}
+        finally:
+            # Client went away mid-stream: stop the remaining models
+            for task in tasks:
+                task.cancel()
+
+    return EventSourceResponse(event_generator())
+
+
+async def _budget_error(cost_tracker: CostTracker) -> dict | None:
+    """Return an SSE error event if today's spend has reached the daily cap."""
+    settings = get_settings()
+    if settings.max_daily_spend_usd > 0:
+        today_spend = await cost_tracker.get_today_spend()
+        if today_spend >= settings.max_daily_spend_usd:
+            return {
+                "event": "error",
+                "data": _dumps({
+                    "error": f"Daily budget of ${settings.max_daily_spend_usd:.2f} "
+                             f"reached (${today_spend:.2f} spent today). "
+                             f"Try again tomorrow."
+                }),
+            }
     return None
 
 
+def _unique_citations(citations: list[dict]) -> list[dict]:
+    """Deduplicate citations by URL (dicts keep first-seen order)."""
+    return list({c["url"]: c for c in citations if c.get("url")}.values())
+
+
+def _max_tokens(llm_router: LLMRouter, model_id: str) -> int:
+    """Output token limit from the model's config."""
+    model_cfg = _get_model_config(llm_router, model_id)
+    return model_cfg.get("max_tokens", 4096) if model_cfg else 4096
+
+
+def _dumps(data) -> str:
+    """Serialize an SSE payload (orjson is several times faster than json)."""
+    return orjson.dumps(data).decode()
+
+
+def _token_data(text: str) -> str:
+    # Hot path: one call per streamed token
+    return orjson.dumps({"text": text}).decode()
+
+
+def _get_model_config(llm_router: LLMRouter, model_id: str) -> Mapping | None:
+    """Look up model config from settings."""
+    return llm_router._settings.models_by_id.get(model_id)
+
+
 async def _auto_title(
     conv_service: ConversationService,
     llm_router: LLMRouter,
@@ -3,6 +3,7 @@ from backend.models.schemas import (
     ConversationCreate,
     ConversationResponse,
     ConversationListResponse,
+    MessageResponse,
 )
 from backend.services.conversation_service import ConversationService
 from backend.dependencies import get_conversation_service
@@ -42,7 +43,7 @@ async def get_conversation(
     return conv
 
 
-@router.get("/{conversation_id}/messages")
+@router.get("/{conversation_id}/messages", response_model=list[MessageResponse])
 async def get_messages(
     conversation_id: str,
     service: ConversationService = Depends(get_conversation_service),
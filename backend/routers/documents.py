@@ -1,4 +1,6 @@
+import asyncio
 import logging
+import os
 import tempfile
 from pathlib import Path
 
@@ -7,13 +9,14 @@ from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException
 from backend.models.schemas import DocumentUploadResponse, DocumentListResponse
 from backend.services.rag_engine import RAGEngine
 from backend.dependencies import get_rag_engine
-from backend.database import get_db
+from backend.database import get_db, fetch_dicts
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/documents", tags=["documents"])
 
 SUPPORTED_EXTENSIONS = {".pdf", ".txt", ".md"}
 UPLOAD_DIR = Path("data/uploads")
+UPLOAD_CHUNK_SIZE = 256 * 1024  # bytes read/written per step
 
 
 @router.post("/upload", response_model=DocumentUploadResponse)
@@ -36,15 +39,18 @@ async def upload_document(
     UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
     tmp_path = None
     try:
-        content = await file.read()
-        with tempfile.NamedTemporaryFile(
-            delete=False, suffix=ext, dir=str(UPLOAD_DIR)
-        ) as tmp:
-            tmp.write(content)
-            tmp_path = Path(tmp.name)
+        fd, name = tempfile.mkstemp(suffix=ext, dir=str(UPLOAD_DIR))
+        tmp_path = Path(name)
+        # Copy in fixed-size chunks so memory stays O(chunk) whatever the
+        # upload size; disk writes run off the event loop
+        size = 0
+        with os.fdopen(fd, "wb") as out:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                await asyncio.to_thread(out.write, chunk)
+                size += len(chunk)
 
         result = await rag_engine.ingest_document(
-            tmp_path, file.filename, len(content), conversation_id
+            tmp_path, file.filename, size, conversation_id
         )
         return DocumentUploadResponse(**result)
     except ValueError as e:
@@ -64,13 +70,11 @@ async def upload_document(
 async def list_documents(conversation_id: str = None):
     async with get_db() as db:
         if conversation_id:
-            cursor = await db.execute(
+            rows = await fetch_dicts(
+                db,
                 "SELECT * FROM documents WHERE conversation_id = ? ORDER BY uploaded_at DESC",
                 (conversation_id,),
             )
         else:
-            cursor = await db.execute(
-                "SELECT * FROM documents ORDER BY uploaded_at DESC"
-            )
-        rows = await cursor.fetchall()
-        return DocumentListResponse(documents=[dict(r) for r in rows])
+            rows = await fetch_dicts(db, "SELECT * FROM documents ORDER BY uploaded_at DESC")
+        return DocumentListResponse(documents=rows)
@@ -14,15 +14,17 @@ async def health_check():
     container startup before lifespan runs), return a 200 with
     status="starting" so Railway/Docker healthchecks don't fail."""
     try:
+        # Trigger-maintained counts: O(1) however large the tables get
         async with get_db() as db:
-            docs = await db.execute("SELECT COUNT(*) FROM documents")
-            doc_count = (await docs.fetchone())[0]
-            convos = await db.execute("SELECT COUNT(*) FROM conversations")
-            conv_count = (await convos.fetchone())[0]
+            rows = await db.execute_fetchall(
+                "SELECT name, n FROM row_counts "
+                "WHERE name IN ('documents', 'conversations')"
+            )
+        counts = dict(rows)
         return HealthResponse(
             status="healthy",
-            document_count=doc_count,
-            conversation_count=conv_count,
+            document_count=counts["documents"],
+            conversation_count=counts["conversations"],
         )
     except Exception as exc:
         logger.warning("Health check: DB not ready yet (%s)", exc)
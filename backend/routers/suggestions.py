@@ -3,10 +3,14 @@
 import asyncio
 import json
 import logging
+import time
+from contextlib import aclosing
 
 from fastapi import APIRouter, Depends
+from sse_starlette.sse import EventSourceResponse
 
 from backend.dependencies import get_conversation_service, get_llm_router
+from backend.models.schemas import SuggestionsResponse
 from backend.services.conversation_service import ConversationService
 from backend.services.llm_router import LLMRouter
 
@@ -18,6 +22,15 @@ _SUGGESTION_MODEL = "gpt-4o-mini"
 _SUGGESTION_TIMEOUT = 3.0  # hard timeout — landing page must never hang
 _NUM_SUGGESTIONS = 6
 _NUM_CONVERSATIONS = 5  # look at the last N conversations
+_KEEPALIVE_INTERVAL = 1.0  # seconds between keepalives on /suggestions/stream
+
+# Suggestions generated for a set of recent topics are reused for a while,
+# so refreshing the landing page doesn't re-query the LLM.  Keyed by the
+# (title, model_id) pairs of the recent conversations.
+_CACHE_TTL = 90.0  # seconds
+_suggestions_cache: dict[tuple[tuple[str, str], ...], tuple[float, list[str]]] = {}
+# Generation tasks in progress, by the same key
+_inflight: dict[tuple[tuple[str, str], ...], asyncio.Task] = {}
 
 _SYSTEM_PROMPT = (
     "You generate short, engaging suggested questions for an AI chat app. "
@@ -27,6 +40,12 @@ _SYSTEM_PROMPT = (
     "Return ONLY a JSON array of {n} strings, no markdown, no explanation."
 )
 
+# Constant across requests: formatted once, shared by every prompt
+_SYSTEM_MESSAGE = {
+    "role": "system",
+    "content": _SYSTEM_PROMPT.format(n=_NUM_SUGGESTIONS),
+}
+
 _FALLBACK_PROMPTS = [
     "What are the biggest tech stories this week?",
     "Write a Python function to merge two sorted lists",
@@ -37,23 +56,23 @@ _FALLBACK_PROMPTS = [
 ]
 
 
-@router.get("")
-async def get_suggestions(
-    conv_service: ConversationService = Depends(get_conversation_service),
-    llm_router: LLMRouter = Depends(get_llm_router),
-):
-    """Return 6 suggested prompts, personalised if the user has chat history."""
+def _parse_suggestions(text: str) -> list | None:
+    """Parse the model's JSON array, or None if it isn't complete/valid yet."""
+    raw = text.strip()
+    # Strip markdown fences if the model wraps the JSON
+    if raw.startswith("```"):
+        raw = raw.split("\n", 1)[-1].rsplit("```", 1)[0].strip()
     try:
-        conversations = await conv_service.list_conversations()
-    except Exception:
-        logger.debug("Could not fetch conversations, returning fallback prompts")
-        return {"suggestions": _FALLBACK_PROMPTS, "source": "fallback"}
+        suggestions = json.loads(raw)
+    except ValueError:
+        return None
+    return suggestions if isinstance(suggestions, list) else None
 
-    # Need at least some history to personalise
-    recent = conversations[:_NUM_CONVERSATIONS]
-    if len(recent) < 2:
-        return {"suggestions": _FALLBACK_PROMPTS, "source": "fallback"}
 
+async def _generate_suggestions(
+    llm_router: LLMRouter, recent: list[dict], cache_key: tuple
+) -> dict:
+    """Ask the LLM for suggestions about ``recent``; cache a good answer."""
     # Build a compact summary of recent topics for the LLM
     topic_lines = []
     for c in recent:
@@ -63,10 +82,7 @@ async def get_suggestions(
     topics_text = "\n".join(topic_lines)
 
     messages = [
-        {
-            "role": "system",
-            "content": _SYSTEM_PROMPT.format(n=_NUM_SUGGESTIONS),
-        },
+        _SYSTEM_MESSAGE,
         {
             "role": "user",
             "content": (
@@ -76,45 +92,124 @@ async def get_suggestions(
         },
     ]
 
-    try:
-        # Collect the full text from the streaming provider within the timeout
-        text_parts: list[str] = []
-
-        async def _generate():
-            async for chunk in llm_router.stream_chat(
-                messages=messages,
-                model_id=_SUGGESTION_MODEL,
-                temperature=0.9,
-                max_tokens=300,
-            ):
-                if chunk.text:
-                    text_parts.append(chunk.text)
-
-        await asyncio.wait_for(_generate(), timeout=_SUGGESTION_TIMEOUT)
-
-        raw = "".join(text_parts).strip()
-        # Strip markdown fences if the model wraps the JSON
-        if raw.startswith("```"):
-            raw = raw.split("\n", 1)[-1].rsplit("```", 1)[0].strip()
+    async def _generate() -> tuple[str, list | None]:
+        # Parse as soon as the array can be complete rather than waiting for
+        # the end of the stream; returning closes the stream, which stops the
+        # upstream request (and its token spend) early.
+        text = ""
+        stream = llm_router.stream_chat(
+            messages=messages,
+            model_id=_SUGGESTION_MODEL,
+            temperature=0.9,
+            max_tokens=300,
+        )
+        async with aclosing(stream):
+            async for chunk in stream:
+                if not chunk.text:
+                    continue
+                text += chunk.text
+                if "]" in chunk.text:
+                    suggestions = _parse_suggestions(text)
+                    if suggestions is not None:
+                        return text, suggestions
+        return text, _parse_suggestions(text)
 
-        suggestions = json.loads(raw)
+    try:
+        async with asyncio.timeout(_SUGGESTION_TIMEOUT):
+            raw, suggestions = await _generate()
 
         if (
             isinstance(suggestions, list)
             and len(suggestions) >= _NUM_SUGGESTIONS
             and all(isinstance(s, str) for s in suggestions)
         ):
-            return {
-                "suggestions": suggestions[:_NUM_SUGGESTIONS],
-                "source": "llm",
-            }
+            suggestions = suggestions[:_NUM_SUGGESTIONS]
+            now = time.monotonic()
+            # Topic sets only move forward, so drop expired entries as we go
+            for key in [k for k, (ts, _) in _suggestions_cache.items() if now - ts >= _CACHE_TTL]:
+                del _suggestions_cache[key]
+            _suggestions_cache[cache_key] = (now, suggestions)
+            return {"suggestions": suggestions, "source": "llm"}
 
         logger.warning("LLM returned unexpected format: %s", raw[:200])
         return {"suggestions": _FALLBACK_PROMPTS, "source": "fallback"}
 
-    except asyncio.TimeoutError:
+    except TimeoutError:
         logger.info("Suggestions LLM call timed out after %.1fs", _SUGGESTION_TIMEOUT)
         return {"suggestions": _FALLBACK_PROMPTS, "source": "fallback"}
     except Exception as e:
         logger.warning("Suggestions generation failed: %s", e)
         return {"suggestions": _FALLBACK_PROMPTS, "source": "fallback"}
+
+
+async def _resolve_suggestions(
+    conv_service: ConversationService, llm_router: LLMRouter
+) -> dict | asyncio.Task:
+    """Return a response that is ready now, or the task generating one."""
+    try:
+        recent = await conv_service.list_conversations(limit=_NUM_CONVERSATIONS)
+    except Exception:
+        logger.debug("Could not fetch conversations, returning fallback prompts")
+        return {"suggestions": _FALLBACK_PROMPTS, "source": "fallback"}
+
+    # Need at least some history to personalise
+    if len(recent) < 2:
+        return {"suggestions": _FALLBACK_PROMPTS, "source": "fallback"}
+
+    cache_key = tuple((c.get("title") or "", c.get("model_id", "")) for c in recent)
+    cached = _suggestions_cache.get(cache_key)
+    if cached and time.monotonic() - cached[0] < _CACHE_TTL:
+        return {"suggestions": cached[1], "source": "llm"}
+
+    # Concurrent misses for the same topics share one LLM call
+    task = _inflight.get(cache_key)
+    if task is None:
+        task = asyncio.create_task(_generate_suggestions(llm_router, recent, cache_key))
+        _inflight[cache_key] = task
+        task.add_done_callback(lambda _: _inflight.pop(cache_key, None))
+    return task
+
+
+@router.get("", response_model=SuggestionsResponse)
+async def get_suggestions(
+    conv_service: ConversationService = Depends(get_conversation_service),
+    llm_router: LLMRouter = Depends(get_llm_router),
+):
+    """Return 6 suggested prompts, personalised if the user has chat history."""
+    result = await _resolve_suggestions(conv_service, llm_router)
+    if isinstance(result, dict):
+        return result
+    # Shielded so one client disconnecting doesn't cancel the call for the rest
+    return await asyncio.shield(result)
+
+
+@router.get("/stream")
+async def stream_suggestions(
+    conv_service: ConversationService = Depends(get_conversation_service),
+    llm_router: LLMRouter = Depends(get_llm_router),
+):
+    """Stream suggestions over SSE so the landing page never waits on the LLM.
+
+    A ``suggestions`` event with the fallback prompts (or cached/ready
+    suggestions) is sent at once.  If personalised ones are still being
+    generated, ``keepalive`` events follow until a second ``suggestions``
+    event replaces the first.
+    """
+    result = await _resolve_suggestions(conv_service, llm_router)
+
+    async def event_generator():
+        if isinstance(result, dict):
+            yield {"event": "suggestions", "data": json.dumps(result)}
+            return
+        yield {
+            "event": "suggestions",
+            "data": json.dumps({"suggestions": _FALLBACK_PROMPTS, "source": "fallback"}),
+        }
+        # asyncio.wait never cancels the (shared) generation task
+        while not (await asyncio.wait({result}, timeout=_KEEPALIVE_INTERVAL))[0]:
+            yield {"event": "keepalive", "data": "{}"}
+        final = result.result()
+        if final["source"] != "fallback":
+            yield {"event": "suggestions", "data": json.dumps(final)}
+
+    return EventSourceResponse(event_generator())
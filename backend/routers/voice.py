@@ -1,7 +1,10 @@
 import logging
+from contextlib import aclosing
 
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException
-from fastapi.responses import Response
+import orjson
+
+from fastapi import APIRouter, BackgroundTasks, UploadFile, File, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 
 from backend.models.schemas import TranscriptionResponse, SynthesisRequest
 from backend.services.voice_service import VoiceService
@@ -14,6 +17,7 @@ router = APIRouter(prefix="/voice", tags=["voice"])
 
 @router.post("/transcribe", response_model=TranscriptionResponse)
 async def transcribe_audio(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     voice_service: VoiceService = Depends(get_voice_service),
     cost_tracker: CostTracker = Depends(get_cost_tracker),
@@ -21,15 +25,18 @@ async def transcribe_audio(
     """Transcribe audio file to text using Whisper."""
     try:
         audio_bytes = await file.read()
-        result = voice_service.transcribe(audio_bytes, file.filename or "audio.wav")
+        result = await voice_service.transcribe(audio_bytes, file.filename or "audio.wav")
 
         duration_minutes = result.get("audio_duration_seconds", 0) / 60.0
         cost = cost_tracker.calculate_stt_cost(duration_minutes)
-        await cost_tracker.log_cost(
+        # Logged after the response is sent; the user doesn't wait on it
+        background_tasks.add_task(
+            cost_tracker.log_cost,
             model_id="whisper-1",
             operation="stt",
             audio_minutes=duration_minutes,
             cost_usd=cost,
+            background=True,
         )
 
         return TranscriptionResponse(**result)
@@ -38,26 +45,85 @@ async def transcribe_audio(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/transcribe/stream")
+async def transcribe_audio_stream(
+    file: UploadFile = File(...),
+    voice_service: VoiceService = Depends(get_voice_service),
+    cost_tracker: CostTracker = Depends(get_cost_tracker),
+):
+    """Transcribe audio, streaming partial text as newline-delimited JSON.
+
+    Each line is ``{"text": ..., "final": false}`` for the next stretch of
+    the recording; the last line has ``"final": true`` with the full text
+    and duration.  A failure mid-stream ends it with an ``{"error": ...}`` line.
+    """
+    try:
+        audio_bytes = await file.read()
+        stream = voice_service.transcribe_stream(audio_bytes, file.filename or "audio.wav")
+        # As in /synthesize: upstream errors before the first result are a 500
+        first_event = await anext(stream)
+    except Exception as e:
+        logger.exception("Transcription failed")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def _lines():
+        async with aclosing(stream):
+            event = first_event
+            try:
+                while True:
+                    yield orjson.dumps(event) + b"\n"
+                    if event["final"]:
+                        break
+                    event = await anext(stream)
+            except Exception as e:
+                logger.exception("Transcription failed mid-stream")
+                yield orjson.dumps({"error": str(e)}) + b"\n"
+                return
+
+        duration_minutes = event.get("audio_duration_seconds", 0) / 60.0
+        await cost_tracker.log_cost(
+            model_id="whisper-1",
+            operation="stt",
+            audio_minutes=duration_minutes,
+            cost_usd=cost_tracker.calculate_stt_cost(duration_minutes),
+            background=True,
+        )
+
+    return StreamingResponse(_lines(), media_type="application/x-ndjson")
+
+
 @router.post("/synthesize")
 async def synthesize_speech(
     request: SynthesisRequest,
+    background_tasks: BackgroundTasks,
     voice_service: VoiceService = Depends(get_voice_service),
     cost_tracker: CostTracker = Depends(get_cost_tracker),
 ):
-    """Convert text to speech. Returns audio bytes."""
+    """Convert text to speech.  The audio is streamed as it is generated."""
     try:
-        audio_bytes = voice_service.synthesize(request.text, request.voice)
+        stream = voice_service.synthesize_stream(request.text, request.voice)
+        # Wait for the first chunk so upstream errors still become a 500
+        # instead of a truncated 200
+        first_chunk = await anext(stream, b"")
 
         cost = cost_tracker.calculate_tts_cost(len(request.text))
-        await cost_tracker.log_cost(
+        background_tasks.add_task(
+            cost_tracker.log_cost,
             model_id="tts-1",
             operation="tts",
             tts_characters=len(request.text),
             cost_usd=cost,
+            background=True,
         )
 
-        return Response(
-            content=audio_bytes,
+        async def _audio():
+            async with aclosing(stream):
+                yield first_chunk
+                async for chunk in stream:
+                    yield chunk
+
+        return StreamingResponse(
+            _audio(),
             media_type="audio/mpeg",
             headers={"Content-Disposition": "inline; filename=speech.mp3"},
         )
@@ -1,5 +1,57 @@
-import uuid
-from backend.database import get_db
+from backend.database import (
+    get_db, get_writer, execute_write, fetch_dicts, flush_writes, uuid7,
+)
+from backend.services.cost_tracker import cost_totals
+
+# All SQL lives here as constants: each string is prepared once per pooled
+# connection and then served from its statement cache.
+
+_INSERT_CONVERSATION_SQL = (
+    "INSERT INTO conversations (id, title, model_id, system_prompt) VALUES (?, ?, ?, ?)"
+)
+
+_GET_CONVERSATION_SQL = "SELECT * FROM conversations WHERE id = ?"
+
+# LIMIT -1 means no limit
+_LIST_CONVERSATIONS_SQL = "SELECT * FROM conversations ORDER BY updated_at DESC LIMIT ?"
+
+# created_at has one-second resolution; rowid breaks ties in insertion order
+_LIST_MESSAGES_SQL = (
+    "SELECT * FROM messages WHERE conversation_id = ? "
+    "ORDER BY created_at ASC, rowid ASC"
+)
+
+_RECENT_MESSAGES_SQL = """SELECT * FROM messages WHERE rowid IN (
+       SELECT rowid FROM messages WHERE conversation_id = ?
+       ORDER BY created_at DESC, rowid DESC LIMIT ?
+   )
+   ORDER BY created_at ASC, rowid ASC"""
+
+_INSERT_MESSAGE_SQL = """INSERT INTO messages
+   (id, conversation_id, role, content, model_id,
+    input_tokens, output_tokens, cost_usd, used_docs)
+   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"""
+
+_UPDATE_CONVERSATION_TOTALS_SQL = """UPDATE conversations SET
+   updated_at = datetime('now'),
+   total_input_tokens = total_input_tokens + ?,
+   total_output_tokens = total_output_tokens + ?,
+   total_cost_usd = total_cost_usd + ?,
+   message_count = message_count + 1
+   WHERE id = ?"""
+
+_UPDATE_TITLE_SQL = (
+    "UPDATE conversations SET title = ?, updated_at = datetime('now') WHERE id = ?"
+)
+
+_UPDATE_SYSTEM_PROMPT_SQL = (
+    "UPDATE conversations SET system_prompt = ?, updated_at = datetime('now') WHERE id = ?"
+)
+
+# Messages and cost records go with it (see SCHEMA_SQL)
+_DELETE_CONVERSATION_SQL = "DELETE FROM conversations WHERE id = ?"
+
+_MESSAGE_COUNT_SQL = "SELECT message_count FROM conversations WHERE id = ?"
 
 
 class ConversationService:
@@ -7,47 +59,42 @@ class ConversationService:
     async def create_conversation(
         self, model_id: str, title: str = "New Conversation", system_prompt: str = ""
     ) -> dict:
-        conv_id = str(uuid.uuid4())
-        async with get_db() as db:
+        conv_id = uuid7()
+        async with get_writer() as db:
             await db.execute(
-                "INSERT INTO conversations (id, title, model_id, system_prompt) VALUES (?, ?, ?, ?)",
-                (conv_id, title, model_id, system_prompt),
+                _INSERT_CONVERSATION_SQL, (conv_id, title, model_id, system_prompt)
             )
             await db.commit()
-            cursor = await db.execute(
-                "SELECT * FROM conversations WHERE id = ?", (conv_id,)
-            )
+            cursor = await db.execute(_GET_CONVERSATION_SQL, (conv_id,))
             row = await cursor.fetchone()
             return dict(row)
 
-    async def list_conversations(self) -> list[dict]:
+    async def list_conversations(self, limit: int | None = None) -> list[dict]:
+        """Return conversations, most recently active first."""
+        # Queued message writes move updated_at and the totals
+        await flush_writes()
         async with get_db() as db:
-            cursor = await db.execute(
-                """SELECT c.*, COUNT(m.id) as message_count
-                   FROM conversations c
-                   LEFT JOIN messages m ON m.conversation_id = c.id
-                   GROUP BY c.id
-                   ORDER BY c.updated_at DESC"""
+            return await fetch_dicts(
+                db, _LIST_CONVERSATIONS_SQL, (-1 if limit is None else limit,)
             )
-            rows = await cursor.fetchall()
-            return [dict(row) for row in rows]
 
     async def get_conversation(self, conversation_id: str) -> dict | None:
+        await flush_writes()
         async with get_db() as db:
-            cursor = await db.execute(
-                "SELECT * FROM conversations WHERE id = ?", (conversation_id,)
-            )
+            cursor = await db.execute(_GET_CONVERSATION_SQL, (conversation_id,))
             row = await cursor.fetchone()
             return dict(row) if row else None
 
-    async def get_conversation_messages(self, conversation_id: str) -> list[dict]:
+    async def get_conversation_messages(
+        self, conversation_id: str, limit: int | None = None
+    ) -> list[dict]:
+        """Return messages oldest-first; with ``limit``, only the most recent ones."""
+        # Include messages still queued for the background writer
+        await flush_writes()
         async with get_db() as db:
-            cursor = await db.execute(
-                "SELECT * FROM messages WHERE conversation_id = ? ORDER BY created_at ASC",
-                (conversation_id,),
-            )
-            rows = await cursor.fetchall()
-            return [dict(row) for row in rows]
+            if limit is None:
+                return await fetch_dicts(db, _LIST_MESSAGES_SQL, (conversation_id,))
+            return await fetch_dicts(db, _RECENT_MESSAGES_SQL, (conversation_id, limit))
 
     async def add_message(
         self,
@@ -59,57 +106,51 @@ class ConversationService:
         output_tokens: int = 0,
         cost_usd: float = 0.0,
         used_docs: bool = False,
+        background: bool = False,
     ) -> str:
-        msg_id = str(uuid.uuid4())
-        async with get_db() as db:
-            await db.execute(
-                """INSERT INTO messages
-                   (id, conversation_id, role, content, model_id,
-                    input_tokens, output_tokens, cost_usd, used_docs)
-                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+        """Insert a message and roll its usage into the conversation totals.
+
+        Both statements run in one ``BEGIN IMMEDIATE`` transaction.  The id
+        is generated up front, so with ``background=True`` the write is queued
+        for the background writer and the id returned immediately.
+        """
+        msg_id = uuid7()
+        await execute_write(
+            (
+                _INSERT_MESSAGE_SQL,
+                # sqlite3 stores bools as 0/1
                 (msg_id, conversation_id, role, content, model_id,
-                 input_tokens, output_tokens, cost_usd, 1 if used_docs else 0),
-            )
-            await db.execute(
-                """UPDATE conversations SET
-                   updated_at = datetime('now'),
-                   total_input_tokens = total_input_tokens + ?,
-                   total_output_tokens = total_output_tokens + ?,
-                   total_cost_usd = total_cost_usd + ?
-                   WHERE id = ?""",
+                 input_tokens, output_tokens, cost_usd, used_docs),
+            ),
+            (
+                _UPDATE_CONVERSATION_TOTALS_SQL,
                 (input_tokens, output_tokens, cost_usd, conversation_id),
-            )
-            await db.commit()
+            ),
+            background=background,
+        )
         return msg_id
 
     async def update_conversation_title(self, conversation_id: str, title: str):
-        async with get_db() as db:
-            await db.execute(
-                "UPDATE conversations SET title = ?, updated_at = datetime('now') WHERE id = ?",
-                (title, conversation_id),
-            )
+        async with get_writer() as db:
+            await db.execute(_UPDATE_TITLE_SQL, (title, conversation_id))
             await db.commit()
 
     async def update_system_prompt(self, conversation_id: str, system_prompt: str):
-        async with get_db() as db:
-            await db.execute(
-                "UPDATE conversations SET system_prompt = ?, updated_at = datetime('now') WHERE id = ?",
-                (system_prompt, conversation_id),
-            )
+        async with get_writer() as db:
+            await db.execute(_UPDATE_SYSTEM_PROMPT_SQL, (system_prompt, conversation_id))
             await db.commit()
 
     async def delete_conversation(self, conversation_id: str):
-        async with get_db() as db:
-            await db.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
-            await db.execute("DELETE FROM cost_log WHERE conversation_id = ?", (conversation_id,))
-            await db.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,))
+        # Queued messages and costs for it must land first, or they'd be
+        # applied after the delete and miss its cleanup
+        await flush_writes()
+        async with get_writer() as db:
+            await db.execute(_DELETE_CONVERSATION_SQL, (conversation_id,))
             await db.commit()
+        cost_totals.invalidate()
 
     async def get_message_count(self, conversation_id: str) -> int:
         async with get_db() as db:
-            cursor = await db.execute(
-                "SELECT COUNT(*) FROM messages WHERE conversation_id = ?",
-                (conversation_id,),
-            )
+            cursor = await db.execute(_MESSAGE_COUNT_SQL, (conversation_id,))
             row = await cursor.fetchone()
             return row[0] if row else 0
@@ -1,40 +1,201 @@
 import logging
+from datetime import datetime, timezone
+
 from backend.config import Settings
-from backend.database import get_db
+from backend.database import get_db, get_db_path, execute_write, flush_writes
 
 logger = logging.getLogger(__name__)
 
+_NO_PRICING: dict = {}
+_PER_MILLION = 1e-6
+
+_TODAY_SPEND_SQL = "SELECT COALESCE(SUM(cost_usd), 0) FROM cost_log WHERE created_at >= ?"
+
+_INSERT_COST_SQL = """INSERT INTO cost_log
+   (conversation_id, message_id, model_id, operation,
+    input_tokens, output_tokens, audio_minutes,
+    tts_characters, cost_usd)
+   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"""
+
+# The in-memory totals below are loaded from cost_log and then advanced by
+# log_cost.  A log_cost that overlaps a load may or may not be in the rows
+# read, so a load retries until none was running or finished meanwhile.
+_log_cost_in_flight = 0
+_log_cost_seq = 0
+
+
+async def _load_cost_rows(sql: str, params: tuple = ()) -> list:
+    """Read cost_log with no log_cost call overlapping the read."""
+    while True:
+        seq = _log_cost_seq
+        # Queued cost records must be in the table before it is read
+        await flush_writes()
+        async with get_db() as db:
+            rows = await db.execute_fetchall(sql, params)
+        if seq == _log_cost_seq and not _log_cost_in_flight:
+            return rows
+
+
+class DailySpend:
+    """Today's (UTC) spend, kept in memory for the chat budget check.
+
+    The total is loaded from cost_log once per day (and per database) and
+    then advanced by ``CostTracker.log_cost``, so checking the cap costs no
+    query.  Updates happen without awaiting in between, which makes them
+    atomic on the event loop.
+    """
+
+    def __init__(self):
+        self._key: tuple[str, str] | None = None  # (db path, UTC date)
+        self._total = 0.0
+
+    def invalidate(self):
+        self._key = None
+
+    @staticmethod
+    def _current_key() -> tuple[str, str]:
+        return get_db_path(), datetime.now(timezone.utc).date().isoformat()
+
+    async def get_total(self) -> float:
+        key = self._current_key()
+        if key != self._key:
+            # First use today (or a different database): load from the log
+            rows = await _load_cost_rows(_TODAY_SPEND_SQL, (key[1],))
+            self._key, self._total = key, (rows[0][0] if rows else 0.0)
+        return self._total
+
+    def add(self, cost_usd: float):
+        # A stale total is reloaded on next read, so only track the live day
+        if self._key == self._current_key():
+            self._total += cost_usd
+
+
+daily_spend = DailySpend()
+
+
+class CostTotals:
+    """Per-(operation, model) cost totals, overall and per conversation.
+
+    Built from cost_log once per database and then advanced by
+    ``CostTracker.log_cost``, so the cost summary is a dict lookup instead
+    of a scan of the whole log.  Deleting a conversation (which deletes its
+    cost rows) calls ``invalidate`` to force a reload.
+    """
+
+    _LOAD_SQL = (
+        "SELECT conversation_id, operation, model_id, "
+        "       COALESCE(SUM(cost_usd), 0), COALESCE(SUM(input_tokens), 0), "
+        "       COALESCE(SUM(output_tokens), 0) "
+        "FROM cost_log GROUP BY conversation_id, operation, model_id"
+    )
+
+    def __init__(self):
+        self._db_path: str | None = None
+        # (operation, model_id) -> [cost_usd, input_tokens, output_tokens]
+        self._all: dict[tuple[str, str], list] = {}
+        self._by_conversation: dict[str, dict[tuple[str, str], list]] = {}
+
+    def invalidate(self):
+        self._db_path = None
+
+    async def _ensure_loaded(self):
+        db_path = get_db_path()
+        if db_path == self._db_path:
+            return
+        rows = await _load_cost_rows(self._LOAD_SQL)
+        self._all, self._by_conversation = {}, {}
+        for conversation_id, operation, model_id, *amounts in rows:
+            self._add(conversation_id, operation, model_id, *amounts)
+        self._db_path = db_path
+
+    def add(
+        self,
+        conversation_id: str | None,
+        operation: str,
+        model_id: str,
+        cost_usd: float,
+        input_tokens: int,
+        output_tokens: int,
+    ):
+        # Until loaded, the record is picked up by the load query instead
+        if self._db_path == get_db_path():
+            self._add(conversation_id, operation, model_id,
+                      cost_usd, input_tokens, output_tokens)
+
+    def _add(self, conversation_id, operation, model_id,
+             cost_usd, input_tokens, output_tokens):
+        buckets = [self._all]
+        if conversation_id is not None:
+            buckets.append(self._by_conversation.setdefault(conversation_id, {}))
+        for bucket in buckets:
+            totals = bucket.setdefault((operation, model_id), [0.0, 0, 0])
+            totals[0] += cost_usd
+            totals[1] += input_tokens
+            totals[2] += output_tokens
+
+    async def summary(self, conversation_id: str | None = None) -> dict:
+        await self._ensure_loaded()
+        if conversation_id is None:
+            bucket = self._all
+        else:
+            bucket = self._by_conversation.get(conversation_id, {})
+        breakdown = [
+            {
+                "operation": operation,
+                "model_id": model_id,
+                "cost": cost,
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+            }
+            for (operation, model_id), (cost, input_tokens, output_tokens)
+            in sorted(bucket.items())
+        ]
+        return {
+            "conversation_id": conversation_id,
+            "total_cost_usd": sum(b["cost"] for b in breakdown),
+            "total_input_tokens": sum(b["input_tokens"] for b in breakdown),
+            "total_output_tokens": sum(b["output_tokens"] for b in breakdown),
+            "breakdown": breakdown,
+        }
+
+
+cost_totals = CostTotals()
+
 
 class CostTracker:
     def __init__(self, settings: Settings):
-        self._pricing = settings.pricing_config
+        self._pricing = settings.pricing_by_model
 
     def _get_model_pricing(self, model_id: str) -> dict:
-        """Look up pricing for a model across all providers."""
-        for provider, models in self._pricing.items():
-            if model_id in models:
-                return models[model_id]
-        return {}
+        """Look up pricing for a model (any provider)."""
+        return self._pricing.get(model_id, _NO_PRICING)
 
     def calculate_chat_cost(
-        self, model_id: str, input_tokens: int, output_tokens: int
+        self, model_id: str, input_tokens: int, output_tokens: int,
+        cached_tokens: int = 0,
     ) -> float:
-        """Calculate cost in USD for a chat completion (per 1M tokens)."""
+        """Calculate cost in USD for a chat completion (per 1M tokens).
+
+        ``cached_tokens`` of the ``input_tokens`` are billed at the model's
+        ``cached_input`` rate.
+        """
         pricing = self._get_model_pricing(model_id)
         if not pricing:
             return 0.0
         input_cost_per_m = pricing.get("input", 0.0)
+        cached_cost_per_m = pricing.get("cached_input", input_cost_per_m)
         output_cost_per_m = pricing.get("output", 0.0)
         cost = (
-            (input_tokens / 1_000_000) * input_cost_per_m
-            + (output_tokens / 1_000_000) * output_cost_per_m
-        )
+            (input_tokens - cached_tokens) * input_cost_per_m
+            + cached_tokens * cached_cost_per_m
+            + output_tokens * output_cost_per_m
+        ) * _PER_MILLION
         return round(cost, 8)
 
     def calculate_embedding_cost(self, token_count: int) -> float:
         pricing = self._get_model_pricing("text-embedding-3-small")
         input_cost_per_m = pricing.get("input", 0.02)
-        return round((token_count / 1_000_000) * input_cost_per_m, 8)
+        return round(token_count * input_cost_per_m * _PER_MILLION, 8)
 
     def calculate_stt_cost(self, audio_minutes: float) -> float:
         pricing = self._get_model_pricing("whisper-1")
@@ -44,7 +205,7 @@ class CostTracker:
     def calculate_tts_cost(self, character_count: int) -> float:
         pricing = self._get_model_pricing("tts-1")
         per_m_chars = pricing.get("per_million_chars", 15.0)
-        return round((character_count / 1_000_000) * per_m_chars, 8)
+        return round(character_count * per_m_chars * _PER_MILLION, 8)
 
     async def log_cost(
         self,
@@ -57,69 +218,38 @@ class CostTracker:
         audio_minutes: float = 0.0,
         tts_characters: int = 0,
         cost_usd: float = 0.0,
+        background: bool = False,
     ):
-        """Persist a cost record to the cost_log table."""
-        async with get_db() as db:
-            await db.execute(
-                """INSERT INTO cost_log
-                   (conversation_id, message_id, model_id, operation,
-                    input_tokens, output_tokens, audio_minutes,
-                    tts_characters, cost_usd)
-                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                (conversation_id, message_id, model_id, operation,
-                 input_tokens, output_tokens, audio_minutes,
-                 tts_characters, cost_usd),
+        """Persist a cost record to the cost_log table.
+
+        With ``background=True`` the insert is queued for the background
+        writer, which commits queued records together in one transaction
+        (consecutive inserts go through a single ``executemany``); today's
+        in-memory spend total is updated right away.
+        """
+        global _log_cost_in_flight, _log_cost_seq
+        _log_cost_in_flight += 1
+        try:
+            await execute_write(
+                (
+                    _INSERT_COST_SQL,
+                    (conversation_id, message_id, model_id, operation,
+                     input_tokens, output_tokens, audio_minutes,
+                     tts_characters, cost_usd),
+                ),
+                background=background,
             )
-            await db.commit()
+        finally:
+            _log_cost_in_flight -= 1
+            _log_cost_seq += 1
+        daily_spend.add(cost_usd)
+        cost_totals.add(conversation_id, operation, model_id,
+                        cost_usd, input_tokens, output_tokens)
+
+    async def get_today_spend(self) -> float:
+        """Total cost logged today (UTC), served from memory."""
+        return await daily_spend.get_total()
 
     async def get_cost_summary(self, conversation_id: str | None = None) -> dict:
         """Get cost summary, optionally filtered by conversation."""
-        async with get_db() as db:
-            if conversation_id:
-                cursor = await db.execute(
-                    """SELECT
-                        COALESCE(SUM(cost_usd), 0) as total_cost_usd,
-                        COALESCE(SUM(input_tokens), 0) as total_input_tokens,
-                        COALESCE(SUM(output_tokens), 0) as total_output_tokens
-                       FROM cost_log WHERE conversation_id = ?""",
-                    (conversation_id,),
-                )
-            else:
-                cursor = await db.execute(
-                    """SELECT
-                        COALESCE(SUM(cost_usd), 0) as total_cost_usd,
-                        COALESCE(SUM(input_tokens), 0) as total_input_tokens,
-                        COALESCE(SUM(output_tokens), 0) as total_output_tokens
-                       FROM cost_log"""
-                )
-            row = await cursor.fetchone()
-
-            # Breakdown by operation
-            if conversation_id:
-                breakdown_cursor = await db.execute(
-                    """SELECT operation, model_id,
-                              COALESCE(SUM(cost_usd), 0) as cost,
-                              COALESCE(SUM(input_tokens), 0) as input_tokens,
-                              COALESCE(SUM(output_tokens), 0) as output_tokens
-                       FROM cost_log WHERE conversation_id = ?
-                       GROUP BY operation, model_id""",
-                    (conversation_id,),
-                )
-            else:
-                breakdown_cursor = await db.execute(
-                    """SELECT operation, model_id,
-                              COALESCE(SUM(cost_usd), 0) as cost,
-                              COALESCE(SUM(input_tokens), 0) as input_tokens,
-                              COALESCE(SUM(output_tokens), 0) as output_tokens
-                       FROM cost_log
-                       GROUP BY operation, model_id"""
-                )
-            breakdown_rows = await breakdown_cursor.fetchall()
-
-            return {
-                "conversation_id": conversation_id,
-                "total_cost_usd": row["total_cost_usd"] if row else 0.0,
-                "total_input_tokens": row["total_input_tokens"] if row else 0,
-                "total_output_tokens": row["total_output_tokens"] if row else 0,
-                "breakdown": [dict(r) for r in breakdown_rows],
-            }
+        return await cost_totals.summary(conversation_id)
@@ -0,0 +1,30 @@
+import httpx
+
+# One connection pool shared by the OpenAI SDK clients (chat, Perplexity,
+# embeddings, voice).  Routers build providers per request, so without it
+# each request would open -- and TLS-handshake -- its own connections.  The
+# SDKs pass their own per-request timeouts.
+_LIMITS = httpx.Limits(
+    max_connections=64,
+    max_keepalive_connections=32,
+    keepalive_expiry=30.0,
+)
+_TIMEOUT = httpx.Timeout(60.0, connect=10.0)
+
+_client: httpx.AsyncClient | None = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the shared client, creating it on first use."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(limits=_LIMITS, timeout=_TIMEOUT)
+    return _client
+
+
+async def close_http_client():
+    """Close the shared client's connections (app shutdown)."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -1,5 +1,10 @@
+import hashlib
 import logging
-from typing import AsyncGenerator
+import time
+from collections import OrderedDict
+from typing import AsyncGenerator, Mapping
+
+import orjson
 
 from backend.config import Settings
 from backend.services.providers.base import BaseLLMProvider, StreamChunk
@@ -10,6 +15,27 @@ from backend.services.providers.perplexity_provider import PerplexityProvider
 
 logger = logging.getLogger(__name__)
 
+# Completions at (near-)zero temperature are deterministic enough to reuse:
+# identical requests (regenerate, the same question twice) are replayed from
+# memory instead of calling the API.  Keyed by a hash of provider, model,
+# sampling settings and messages; LRU-evicted, entries expire after a day.
+_RESPONSE_CACHE_MAX_TEMPERATURE = 0.1
+_RESPONSE_CACHE_SIZE = 256
+_RESPONSE_CACHE_TTL = 24 * 3600  # seconds
+_REPLAY_CHUNK_CHARS = 64
+# Answers grounded in live web search go stale within the day; never cached
+_UNCACHED_PROVIDERS = frozenset({"perplexity", "google"})
+# key -> (stored_at, text, citations)
+_response_cache: OrderedDict[bytes, tuple[float, str, list[dict]]] = OrderedDict()
+
+
+def _response_cache_key(
+    provider: str, model_id: str, temperature: float, max_tokens: int,
+    messages: list[dict],
+) -> bytes:
+    payload = [provider, model_id, round(temperature, 2), max_tokens, messages]
+    return hashlib.sha256(orjson.dumps(payload)).digest()
+
 
 class LLMRouter:
     """Routes chat requests to the appropriate LLM provider based on model_id."""
@@ -55,7 +81,7 @@ class LLMRouter:
     def get_provider_name(self, model_id: str) -> str:
         return self._model_provider_map.get(model_id, "unknown")
 
-    def get_available_models(self) -> list[dict]:
+    def get_available_models(self) -> list[Mapping]:
         """Return models whose providers have API keys configured."""
         available = []
         for model_cfg in self._settings.models_config:
@@ -72,11 +98,49 @@ class LLMRouter:
         max_tokens: int = 4096,
     ) -> AsyncGenerator[StreamChunk, None]:
         provider = self._get_provider(model_id)
-        logger.info(f"Routing to {provider.get_provider_name()} for model {model_id}")
+        provider_name = provider.get_provider_name()
+
+        key = None
+        if (
+            temperature <= _RESPONSE_CACHE_MAX_TEMPERATURE
+            and provider_name not in _UNCACHED_PROVIDERS
+        ):
+            key = _response_cache_key(
+                provider_name, model_id, temperature, max_tokens, messages
+            )
+            cached = _response_cache.get(key)
+            if cached and time.monotonic() - cached[0] < _RESPONSE_CACHE_TTL:
+                _response_cache.move_to_end(key)
+                logger.info(f"Replaying cached {model_id} response")
+                _, text, citations = cached
+                for i in range(0, len(text), _REPLAY_CHUNK_CHARS):
+                    yield StreamChunk(text=text[i:i + _REPLAY_CHUNK_CHARS])
+                # No API call was made, so no tokens are billed
+                yield StreamChunk(is_final=True, citations=list(citations))
+                return
+
+        logger.info(f"Routing to {provider_name} for model {model_id}")
+        parts: list[str] = []
+        citations: list[dict] = []
+        complete = False
         async for chunk in provider.stream_chat(
             messages=messages,
             model=model_id,
             temperature=temperature,
             max_tokens=max_tokens,
         ):
+            if key is not None:
+                if chunk.text:
+                    parts.append(chunk.text)
+                citations.extend(chunk.citations)
+                # Error replies carry no output tokens; don't cache those
+                if chunk.is_final and chunk.output_tokens:
+                    complete = True
             yield chunk
+
+        # Only responses the consumer read to the end are stored
+        if complete and parts:
+            _response_cache[key] = (time.monotonic(), "".join(parts), citations)
+            _response_cache.move_to_end(key)
+            if len(_response_cache) > _RESPONSE_CACHE_SIZE:
+                _response_cache.popitem(last=False)
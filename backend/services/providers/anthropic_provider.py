@@ -3,6 +3,10 @@ from anthropic import AsyncAnthropic
 
 from backend.services.providers.base import BaseLLMProvider, StreamChunk
 
+# Prompt-cache breakpoint: Anthropic caches the prompt up to and including
+# the marked block (ignored below the model's minimum cacheable length)
+_CACHE_CONTROL = {"type": "ephemeral"}
+
 
 class AnthropicProvider(BaseLLMProvider):
     def __init__(self, api_key: str):
@@ -18,12 +22,14 @@ class AnthropicProvider(BaseLLMProvider):
         temperature: float = 0.7,
         max_tokens: int = 8192,
     ) -> AsyncGenerator[StreamChunk, None]:
-        # Anthropic requires system message extracted from the messages list
-        system_msg = ""
+        # Anthropic requires system message extracted from the messages list;
+        # each system message becomes its own block, in order
+        system_blocks = []
         chat_messages = []
         for m in messages:
             if m["role"] == "system":
-                system_msg = (system_msg + "\n" + m["content"]).strip()
+                if m["content"].strip():
+                    system_blocks.append({"type": "text", "text": m["content"]})
             else:
                 chat_messages.append({"role": m["role"], "content": m["content"]})
 
@@ -31,22 +37,40 @@ class AnthropicProvider(BaseLLMProvider):
         # If first message isn't from user, this will cause an API error,
         # but that's an upstream issue to handle in the chat router.
 
+        # Two cache breakpoints: after the system prompt, and after the
+        # history preceding the new turn.  Both prefixes are identical on the
+        # next turn, which then reads them from the cache.
+        if system_blocks:
+            system_blocks[-1]["cache_control"] = _CACHE_CONTROL
+        if len(chat_messages) > 1:
+            last_history = chat_messages[-2]
+            last_history["content"] = [{
+                "type": "text",
+                "text": last_history["content"],
+                "cache_control": _CACHE_CONTROL,
+            }]
+
         kwargs = {
             "model": model,
             "max_tokens": max_tokens,
             "temperature": temperature,
             "messages": chat_messages,
         }
-        if system_msg:
-            kwargs["system"] = system_msg
+        if system_blocks:
+            kwargs["system"] = system_blocks
 
         async with self._client.messages.stream(**kwargs) as stream:
             async for text in stream.text_stream:
                 yield StreamChunk(text=text)
 
             final = await stream.get_final_message()
+            # usage.input_tokens counts only the uncached part of the prompt
+            usage = final.usage
+            cache_read = usage.cache_read_input_tokens or 0
+            cache_write = usage.cache_creation_input_tokens or 0
             yield StreamChunk(
                 is_final=True,
-                input_tokens=final.usage.input_tokens,
-                output_tokens=final.usage.output_tokens,
+                input_tokens=usage.input_tokens + cache_read + cache_write,
+                output_tokens=usage.output_tokens,
+                cached_tokens=cache_read,
             )
@@ -3,13 +3,17 @@ from typing import AsyncGenerator
 from dataclasses import dataclass, field
 
 
-@dataclass
+# One is allocated per streamed piece of text: slots keep instances small
+# (no per-instance __dict__).  Not frozen -- frozen dataclasses construct via
+# object.__setattr__, roughly 3x slower.
+@dataclass(slots=True)
 class StreamChunk:
     """Normalized token chunk from any LLM provider."""
     text: str = ""
     is_final: bool = False
     input_tokens: int = 0
     output_tokens: int = 0
+    cached_tokens: int = 0  # Part of input_tokens served from the prompt cache
     finish_reason: str | None = None
     citations: list[dict] = field(default_factory=list)  # Web search sources
 
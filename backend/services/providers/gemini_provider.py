@@ -1,5 +1,6 @@
 import asyncio
 import logging
+import threading
 from typing import AsyncGenerator
 from google import genai
 from google.genai import types
@@ -8,6 +9,14 @@ from backend.services.providers.base import BaseLLMProvider, StreamChunk
 
 logger = logging.getLogger(__name__)
 
+# Chunks buffered between the SDK's worker thread and the event loop; a full
+# queue pauses the worker until the consumer catches up
+_STREAM_QUEUE_SIZE = 32
+_STREAM_DONE = object()
+
+# OpenAI message roles -> Gemini content roles
+_ROLE_MAP = {"user": "user", "assistant": "model"}
+
 
 class GeminiProvider(BaseLLMProvider):
     def __init__(self, api_key: str):
@@ -24,22 +33,17 @@ class GeminiProvider(BaseLLMProvider):
         max_tokens: int = 8192,
     ) -> AsyncGenerator[StreamChunk, None]:
         # Convert OpenAI-format messages to Gemini contents format
+        Content, Part = types.Content, types.Part
         contents = []
-        system_instruction = None
+        system_parts = []
         for m in messages:
-            if m["role"] == "system":
-                if system_instruction:
-                    system_instruction += "\n" + m["content"]
-                else:
-                    system_instruction = m["content"]
-            elif m["role"] == "user":
-                contents.append(
-                    types.Content(role="user", parts=[types.Part(text=m["content"])])
-                )
-            elif m["role"] == "assistant":
-                contents.append(
-                    types.Content(role="model", parts=[types.Part(text=m["content"])])
-                )
+            role = m["role"]
+            if role == "system":
+                system_parts.append(m["content"])
+            elif role in _ROLE_MAP:
+                contents.append(Content(role=_ROLE_MAP[role], parts=[Part(text=m["content"])]))
+        # Kept as separate parts, in order, rather than joined into one string
+        system_instruction = system_parts or None
 
         # Enable Google Search grounding so Gemini can access real-time info
         grounding_tool = types.Tool(
@@ -54,61 +58,83 @@ class GeminiProvider(BaseLLMProvider):
         if system_instruction:
             config.system_instruction = system_instruction
 
-        # google-genai generate_content_stream is synchronous --
-        # run in executor to avoid blocking the event loop
-        loop = asyncio.get_event_loop()
+        # google-genai generate_content_stream is synchronous -- iterate it in
+        # an executor thread and hand each chunk to the event loop as it
+        # arrives, so text is yielded while the model is still generating
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=_STREAM_QUEUE_SIZE)
+        stop = threading.Event()
 
-        def _sync_stream():
-            chunks = []
+        def _put(item) -> None:
+            # Blocks the worker thread while the queue is full
+            asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+        def _produce_stream():
             try:
                 for chunk in self._client.models.generate_content_stream(
                     model=model,
                     contents=contents,
                     config=config,
                 ):
-                    chunks.append(chunk)
+                    if stop.is_set():
+                        break
+                    _put(chunk)
             except Exception as e:
                 logger.error("Gemini streaming error: %s", e, exc_info=True)
-                raise
-            return chunks
+                _put(e)
+            finally:
+                _put(_STREAM_DONE)
 
-        chunks = await loop.run_in_executor(None, _sync_stream)
+        loop.run_in_executor(None, _produce_stream)
 
         total_input = 0
         total_output = 0
+        # Grounding metadata normally arrives only on the last chunk; collect it
+        # here and extract the sources once the stream is done
+        grounding_metadata = []
+
+        try:
+            while (chunk := await queue.get()) is not _STREAM_DONE:
+                if isinstance(chunk, Exception):
+                    raise chunk
+                if chunk.text:
+                    yield StreamChunk(text=chunk.text)
+                usage = chunk.usage_metadata
+                if usage:
+                    total_input = usage.prompt_token_count or 0
+                    total_output = usage.candidates_token_count or 0
+                if chunk.candidates:
+                    for candidate in chunk.candidates:
+                        if candidate.grounding_metadata:
+                            grounding_metadata.append(candidate.grounding_metadata)
+        finally:
+            # Consumer gone early: tell the worker to stop and free any put
+            # it is blocked on
+            stop.set()
+            while not queue.empty():
+                queue.get_nowait()
+
+        # Extract grounding chunks (the actual web sources)
         grounding_citations = []
-
-        for chunk in chunks:
-            if chunk.text:
-                yield StreamChunk(text=chunk.text)
-            if hasattr(chunk, "usage_metadata") and chunk.usage_metadata:
-                total_input = getattr(chunk.usage_metadata, "prompt_token_count", 0) or 0
-                total_output = getattr(chunk.usage_metadata, "candidates_token_count", 0) or 0
-
-            # Extract grounding metadata (search sources) from candidates
-            if hasattr(chunk, "candidates") and chunk.candidates:
-                for candidate in chunk.candidates:
-                    gm = getattr(candidate, "grounding_metadata", None)
-                    if gm:
-                        # Extract grounding chunks (the actual web sources)
-                        g_chunks = getattr(gm, "grounding_chunks", None)
-                        if g_chunks:
-                            for gc in g_chunks:
-                                web = getattr(gc, "web", None)
-                                if web:
-                                    citation = {
-                                        "url": getattr(web, "uri", "") or "",
-                                        "title": getattr(web, "title", "") or "",
-                                        "source": "google_search",
-                                    }
-                                    # Deduplicate by URL
-                                    if citation["url"] and citation not in grounding_citations:
-                                        grounding_citations.append(citation)
-
-                        # Log search queries used
-                        queries = getattr(gm, "web_search_queries", None)
-                        if queries:
-                            logger.info("Gemini grounding search queries: %s", queries)
+        seen_urls: set[str] = set()
+        for gm in grounding_metadata:
+            for gc in gm.grounding_chunks or ():
+                web = gc.web
+                if not web:
+                    continue
+                url = web.uri or ""
+                # Deduplicate by URL
+                if url and url not in seen_urls:
+                    seen_urls.add(url)
+                    grounding_citations.append({
+                        "url": url,
+                        "title": web.title or "",
+                        "source": "google_search",
+                    })
+
+            # Log search queries used
+            if gm.web_search_queries:
+                logger.info("Gemini grounding search queries: %s", gm.web_search_queries)
 
         yield StreamChunk(
             is_final=True,
@@ -1,12 +1,22 @@
+import asyncio
 from typing import AsyncGenerator
 from openai import AsyncOpenAI
 
+from backend.services.http_client import get_http_client
 from backend.services.providers.base import BaseLLMProvider, StreamChunk
 
+# Token deltas are coalesced before being yielded: a buffer is flushed once
+# it holds _FLUSH_CHARS characters, ends a sentence or line, or _FLUSH_INTERVAL
+# seconds have passed since the last flush (so the first token goes out
+# immediately and slow models still stream smoothly).
+_FLUSH_CHARS = 64
+_FLUSH_INTERVAL = 0.04
+_FLUSH_ENDINGS = (".", "!", "?", "\n")
+
 
 class OpenAIProvider(BaseLLMProvider):
     def __init__(self, api_key: str):
-        self._client = AsyncOpenAI(api_key=api_key)
+        self._client = AsyncOpenAI(api_key=api_key, http_client=get_http_client())
 
     def get_provider_name(self) -> str:
         return "openai"
@@ -26,14 +36,45 @@ class OpenAIProvider(BaseLLMProvider):
             stream=True,
             stream_options={"include_usage": True},
         )
+        clock = asyncio.get_running_loop().time
+        buf: list[str] = []
+        buf_len = 0
+        last_flush = float("-inf")
+
         async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content is not None and not chunk.usage:
+                content = chunk.choices[0].delta.content
+                buf.append(content)
+                buf_len += len(content)
+                now = clock()
+                if (
+                    buf_len >= _FLUSH_CHARS
+                    or content.endswith(_FLUSH_ENDINGS)
+                    or now - last_flush >= _FLUSH_INTERVAL
+                ):
+                    yield StreamChunk(text="".join(buf))
+                    buf.clear()
+                    buf_len = 0
+                    last_flush = now
+                continue
+
+            # Anything else ends the text: flush what's buffered first
+            if buf:
+                yield StreamChunk(text="".join(buf))
+                buf.clear()
+                buf_len = 0
             if chunk.usage:
+                # Prompt prefixes OpenAI has seen recently are cached
+                # automatically and billed at a discount
+                details = chunk.usage.prompt_tokens_details
                 yield StreamChunk(
                     is_final=True,
                     input_tokens=chunk.usage.prompt_tokens,
                     output_tokens=chunk.usage.completion_tokens,
+                    cached_tokens=(details.cached_tokens or 0) if details else 0,
                 )
-            elif chunk.choices and chunk.choices[0].delta.content is not None:
-                yield StreamChunk(text=chunk.choices[0].delta.content)
             elif chunk.choices and chunk.choices[0].finish_reason:
                 yield StreamChunk(finish_reason=chunk.choices[0].finish_reason)
+
+        if buf:
+            yield StreamChunk(text="".join(buf))
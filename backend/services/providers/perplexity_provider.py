@@ -1,9 +1,12 @@
 import asyncio
+import hashlib
 import logging
 from typing import AsyncGenerator
 
+import orjson
 from openai import AsyncOpenAI
 
+from backend.services.http_client import get_http_client
 from backend.services.providers.base import BaseLLMProvider, StreamChunk
 
 logger = logging.getLogger(__name__)
@@ -12,6 +15,30 @@ logger = logging.getLogger(__name__)
 # Perplexity does web search before answering, so allow generous time.
 _REQUEST_TIMEOUT = 60.0
 
+# Identical requests in flight at the same time (double submits, the same
+# question from several tabs) share one API call.  Keyed by a hash of the
+# request parameters.  Only the caller that made the call reports its usage,
+# so it is billed once.
+_inflight: dict[bytes, asyncio.Task] = {}
+
+
+def _collect_citations(raw_citations: list, seen: set[str], out: list[dict]) -> None:
+    """Append citations from a Perplexity response to ``out``, skipping URLs in ``seen``.
+
+    Items are plain URL strings or ``{"url", "title"}`` dicts.
+    """
+    for i, item in enumerate(raw_citations):
+        if isinstance(item, str):
+            url, title = item, f"Source {i + 1}"
+        elif isinstance(item, dict):
+            url = item.get("url", "")
+            title = item.get("title", f"Source {i + 1}")
+        else:
+            continue
+        if url and url not in seen:
+            seen.add(url)
+            out.append({"url": url, "title": title, "source": "perplexity"})
+
 
 class PerplexityProvider(BaseLLMProvider):
     """Perplexity Sonar models via OpenAI-compatible API.
@@ -31,11 +58,36 @@ class PerplexityProvider(BaseLLMProvider):
             api_key=api_key,
             base_url="https://api.perplexity.ai",
             timeout=_REQUEST_TIMEOUT,
+            http_client=get_http_client(),
         )
 
     def get_provider_name(self) -> str:
         return "perplexity"
 
+    def _create(
+        self, model: str, messages: list[dict], temperature: float, max_tokens: int,
+    ) -> tuple[asyncio.Task, bool]:
+        """Start the completion request, or join an identical one in flight.
+
+        Returns the task and whether this call started it.
+        """
+        key = hashlib.sha256(
+            orjson.dumps([model, messages, temperature, max_tokens])
+        ).digest()
+        task = _inflight.get(key)
+        if task is not None:
+            return task, False
+        task = asyncio.ensure_future(self._client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=False,
+        ))
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+        return task, True
+
     async def stream_chat(
         self,
         messages: list[dict],
@@ -56,17 +108,14 @@ class PerplexityProvider(BaseLLMProvider):
         is minimal.
         """
         citations: list[dict] = []
+        seen_urls: set[str] = set()
 
         try:
+            task, owner = self._create(model, messages, temperature, max_tokens)
+            # Shielded: one caller timing out doesn't cancel the call for
+            # the others (the client's own timeout still bounds it)
             response = await asyncio.wait_for(
-                self._client.chat.completions.create(
-                    model=model,
-                    messages=messages,
-                    temperature=temperature,
-                    max_tokens=max_tokens,
-                    stream=False,
-                ),
-                timeout=_REQUEST_TIMEOUT,
+                asyncio.shield(task), timeout=_REQUEST_TIMEOUT,
             )
 
             logger.info(
@@ -94,24 +143,7 @@ class PerplexityProvider(BaseLLMProvider):
                 or (getattr(response, "model_extra", None) or {}).get("citations")
             )
             if raw_citations and isinstance(raw_citations, list):
-                for i, item in enumerate(raw_citations):
-                    if isinstance(item, str):
-                        url = item
-                        if url and url not in [c["url"] for c in citations]:
-                            citations.append({
-                                "url": url,
-                                "title": f"Source {i + 1}",
-                                "source": "perplexity",
-                            })
-                    elif isinstance(item, dict):
-                        url = item.get("url", "")
-                        title = item.get("title", f"Source {i + 1}")
-                        if url and url not in [c["url"] for c in citations]:
-                            citations.append({
-                                "url": url,
-                                "title": title,
-                                "source": "perplexity",
-                            })
+                _collect_citations(raw_citations, seen_urls, citations)
 
             logger.info(
                 "Perplexity result: model=%s text_len=%d citations=%d",
@@ -121,7 +153,8 @@ class PerplexityProvider(BaseLLMProvider):
             # --- Extract usage ---
             input_tokens = 0
             output_tokens = 0
-            if response.usage:
+            # Callers that joined another's request aren't billed for it
+            if owner and response.usage:
                 input_tokens = response.usage.prompt_tokens or 0
                 output_tokens = response.usage.completion_tokens or 0
 
@@ -1,58 +1,147 @@
+import asyncio
+import hashlib
+import io
 import logging
-import uuid
+import os
+from collections import OrderedDict
 from pathlib import Path
 
-from openai import OpenAI
+import numpy as np
+from openai import AsyncOpenAI
 from pypdf import PdfReader
 
 from backend.config import Settings
+from backend.services.http_client import get_http_client
 from backend.services.vectorstore import VectorStoreManager
-from backend.database import get_db
+from backend.database import get_writer, uuid7
 
 logger = logging.getLogger(__name__)
 
+# The embeddings API accepts up to 2048 inputs and 300k tokens per request;
+# texts are packed into as few requests as fit, sent concurrently, at most
+# _EMBED_CONCURRENCY at a time to stay clear of rate limits.  A text's token
+# count is bounded by its UTF-8 length (every token covers at least one
+# byte), which keeps batches under the limit without a tokenizer.
+_EMBED_BATCH_SIZE = 2048
+_EMBED_BATCH_TOKENS = 250_000
+_EMBED_CONCURRENCY = 8
+
+# Chunks are embedded and written to ChromaDB in shards of this size, so no
+# single add_chunks payload holds a whole large document
+_ADD_SHARD_SIZE = 256
+
+# Query embeddings, LRU-evicted: repeated questions (regenerate, follow-ups)
+# skip the API round trip.  Shared across RAGEngine instances, which are
+# created per request.
+_QUERY_CACHE_SIZE = 1024
+_query_embedding_cache: OrderedDict[tuple[str, bytes], np.ndarray] = OrderedDict()
+
+
+def _embedding_batches(texts: list[str]):
+    """Yield consecutive slices of ``texts`` within the per-request limits."""
+    start = 0
+    budget = 0
+    for i, text in enumerate(texts):
+        # isascii() is O(1) on CPython; only non-ASCII text needs encoding
+        size = len(text) if text.isascii() else len(text.encode())
+        if i > start and (
+            i - start >= _EMBED_BATCH_SIZE or budget + size > _EMBED_BATCH_TOKENS
+        ):
+            yield texts[start:i]
+            start, budget = i, 0
+        budget += size
+    if texts:
+        yield texts[start:]
+
 
 class RAGEngine:
     def __init__(self, settings: Settings, vs_manager: VectorStoreManager):
         self._settings = settings
         self._vs = vs_manager
-        self._openai = OpenAI(api_key=settings.openai_api_key.get_secret_value())
+        self._openai = AsyncOpenAI(
+            api_key=settings.openai_api_key.get_secret_value(),
+            http_client=get_http_client(),
+        )
         self._embedding_model = settings.embedding_config.get("model", "text-embedding-3-small")
         self._chunk_size = settings.rag_config.get("chunk_size", 1000)
         self._chunk_overlap = settings.rag_config.get("chunk_overlap", 200)
         self._retrieval_k = settings.rag_config.get("retrieval_k", 5)
+        # Extracted PDF text, keyed by a hash of the file contents
+        self._pdf_text_cache_dir = Path(settings.cache_dir) / "pdf_text"
+        # Shared by every _embed call on this engine, so concurrent shards
+        # of one ingest stay within the limit together
+        self._embed_semaphore = asyncio.Semaphore(_EMBED_CONCURRENCY)
 
     # --- Embedding ---
-    def _embed(self, texts: list[str]) -> list[list[float]]:
-        """Embed a batch of texts via OpenAI embedding API."""
-        # OpenAI embeddings API has a limit of ~8000 tokens per input;
-        # chunk into batches of 100 texts at a time
-        all_embeddings = []
-        batch_size = 100
-        for i in range(0, len(texts), batch_size):
-            batch = texts[i:i + batch_size]
-            response = self._openai.embeddings.create(
-                model=self._embedding_model,
-                input=batch,
-            )
-            all_embeddings.extend(item.embedding for item in response.data)
-        return all_embeddings
-
-    def _embed_query(self, text: str) -> list[float]:
-        return self._embed([text])[0]
+    async def _embed(self, texts: list[str]) -> np.ndarray:
+        """Embed a batch of texts via OpenAI embedding API.
+
+        Returns one float32 row per text -- what ChromaDB stores anyway, at
+        ~6 KB per 1536-d vector instead of ~50 KB as a list of Python floats.
+        """
+        async def _embed_batch(batch: list[str]) -> np.ndarray:
+            async with self._embed_semaphore:
+                response = await self._openai.embeddings.create(
+                    model=self._embedding_model,
+                    input=batch,
+                )
+            return np.array([item.embedding for item in response.data], dtype=np.float32)
+
+        # gather keeps results in batch order
+        results = await asyncio.gather(
+            *(_embed_batch(batch) for batch in _embedding_batches(texts))
+        )
+        return np.concatenate(results)
+
+    async def _embed_query(self, text: str) -> np.ndarray:
+        """Embed a query; the (read-only) array is shared with the cache."""
+        key = (self._embedding_model, hashlib.sha1(text.encode()).digest())
+        cached = _query_embedding_cache.get(key)
+        if cached is not None:
+            _query_embedding_cache.move_to_end(key)
+            return cached
+
+        embedding = (await self._embed([text]))[0]
+        embedding.flags.writeable = False
+        _query_embedding_cache[key] = embedding
+        if len(_query_embedding_cache) > _QUERY_CACHE_SIZE:
+            _query_embedding_cache.popitem(last=False)
+        return embedding
 
     # --- Document Loading ---
     def _load_file(self, file_path: Path) -> str:
         """Load text from PDF, TXT, or MD files."""
         ext = file_path.suffix.lower()
         if ext == ".pdf":
-            reader = PdfReader(str(file_path))
+            # pypdf extraction is slow, so re-ingesting the same file reuses
+            # the text from last time
+            data = file_path.read_bytes()
+            digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+            cache_path = self._pdf_text_cache_dir / f"{digest}.txt"
+            try:
+                return cache_path.read_text(encoding="utf-8")
+            except FileNotFoundError:
+                pass
+
+            reader = PdfReader(io.BytesIO(data))
             pages = []
             for page in reader.pages:
                 text = page.extract_text()
                 if text:
                     pages.append(text)
-            return "\n\n".join(pages)
+            text = "\n\n".join(pages)
+
+            # Written under a temp name and renamed, so a concurrent ingest
+            # never reads a partial file
+            tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+            try:
+                cache_path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path.write_text(text, encoding="utf-8")
+                os.replace(tmp_path, cache_path)
+            except OSError:
+                # Read-only data dir -- not fatal
+                tmp_path.unlink(missing_ok=True)
+            return text
         elif ext in (".txt", ".md"):
             return file_path.read_text(encoding="utf-8")
         else:
@@ -82,23 +171,35 @@ class RAGEngine:
             sep = separators[sep_idx]
             parts = text.split(sep)
             result = []
-            current = ""
 
-            for part in parts:
-                candidate = current + sep + part if current else part
-                if len(candidate) <= self._chunk_size:
-                    current = candidate
+            # The current chunk is parts[first:i] joined by sep.  Only its
+            # length is tracked while packing; the string is built once, when
+            # the chunk is emitted.
+            first = 0
+            current_len = 0
+
+            for i, part in enumerate(parts):
+                if current_len:
+                    candidate_len = current_len + len(sep) + len(part)
+                else:
+                    first, candidate_len = i, len(part)
+                if candidate_len <= self._chunk_size:
+                    current_len = candidate_len
+                    continue
+                if current_len:
+                    current = sep.join(parts[first:i]).strip()
+                    if current:
+                        result.append(current)
+                if len(part) > self._chunk_size:
+                    result.extend(_split(part, sep_idx + 1))
+                    current_len = 0
                 else:
-                    if current.strip():
-                        result.append(current.strip())
-                    if len(part) > self._chunk_size:
-                        result.extend(_split(part, sep_idx + 1))
-                        current = ""
-                    else:
-                        current = part
-
-            if current.strip():
-                result.append(current.strip())
+                    first, current_len = i, len(part)
+
+            if current_len:
+                current = sep.join(parts[first:]).strip()
+                if current:
+                    result.append(current)
             return result
 
         raw_chunks = _split(text)
@@ -119,54 +220,74 @@ class RAGEngine:
         file_size: int = 0, conversation_id: str | None = None,
     ) -> dict:
         """Full pipeline: load -> chunk -> embed -> store."""
-        text = self._load_file(file_path)
-        chunks = self._chunk_text(text)
+        # PDF parsing, chunking and the ChromaDB calls are blocking; run
+        # them in worker threads so other requests keep being served
+        text = await asyncio.to_thread(self._load_file, file_path)
+        chunks = await asyncio.to_thread(self._chunk_text, text)
 
         if not chunks:
             raise ValueError("No text content found in file")
 
-        doc_id = str(uuid.uuid4())
-
-        # Embed all chunks in batch
-        embeddings = self._embed(chunks)
-
-        # Prepare ChromaDB data
-        chunk_ids = [f"{doc_id}_chunk_{i}" for i in range(len(chunks))]
-        metadatas = [
-            {
-                "document_id": doc_id,
-                "filename": original_filename,
-                "chunk_index": i,
-                "total_chunks": len(chunks),
-                "conversation_id": conversation_id or "",
-            }
-            for i in range(len(chunks))
-        ]
-
-        self._vs.add_chunks(
-            ids=chunk_ids,
-            embeddings=embeddings,
-            documents=chunks,
-            metadatas=metadatas,
-        )
+        doc_id = uuid7()
+        # Repeated chunks (page headers, boilerplate) are embedded and stored
+        # once; the unique chunks are numbered in order of first occurrence
+        unique = list(dict.fromkeys(chunks))
+
+        async def _embed_and_store(start: int):
+            indices = range(start, min(start + _ADD_SHARD_SIZE, len(unique)))
+            shard = unique[start:start + _ADD_SHARD_SIZE]
+            embeddings = await self._embed(shard)
+            await asyncio.to_thread(
+                self._vs.add_chunks,
+                ids=[f"{doc_id}_chunk_{i}" for i in indices],
+                embeddings=embeddings,
+                documents=shard,
+                metadatas=[
+                    {
+                        "document_id": doc_id,
+                        "filename": original_filename,
+                        "chunk_index": i,
+                        "total_chunks": len(unique),
+                        "conversation_id": conversation_id or "",
+                    }
+                    for i in indices
+                ],
+            )
+
+        # Shards run concurrently: one shard's ChromaDB insert overlaps the
+        # embedding requests of the next
+        try:
+            async with asyncio.TaskGroup() as tg:
+                for start in range(0, len(unique), _ADD_SHARD_SIZE):
+                    tg.create_task(_embed_and_store(start))
+        except BaseException as e:
+            # Don't leave the shards that did make it orphaned in the index
+            await asyncio.to_thread(self._vs.delete_by_document_id, doc_id)
+            # Surface the first failure itself, as callers expect
+            if isinstance(e, BaseExceptionGroup):
+                raise e.exceptions[0] from None
+            raise
 
         # Record in SQLite
-        async with get_db() as db:
+        async with get_writer() as db:
             await db.execute(
                 """INSERT INTO documents
                    (id, filename, file_type, file_size, chunk_count, conversation_id)
                    VALUES (?, ?, ?, ?, ?, ?)""",
                 (doc_id, original_filename, file_path.suffix.lower(),
-                 file_size, len(chunks), conversation_id),
+                 file_size, len(unique), conversation_id),
             )
             await db.commit()
 
-        logger.info(f"Ingested {original_filename}: {len(chunks)} chunks, doc_id={doc_id}")
+        logger.info(
+            f"Ingested {original_filename}: {len(unique)} chunks "
+            f"({len(chunks) - len(unique)} duplicates skipped), doc_id={doc_id}"
+        )
 
         return {
             "id": doc_id,
             "filename": original_filename,
-            "chunk_count": len(chunks),
+            "chunk_count": len(unique),
             "file_size": file_size,
         }
 
@@ -175,7 +296,10 @@ class RAGEngine:
         self, query: str, conversation_id: str | None = None,
     ) -> tuple[str, list[dict]]:
         """Retrieve relevant chunks for a query. Returns (context_text, sources)."""
-        query_embedding = self._embed_query(query)
+        # The embedding request is awaited on the loop and both ChromaDB
+        # queries run in worker threads; the float32 vector is handed to
+        # Chroma as is, which would otherwise convert a list back to an array
+        query_embedding = await self._embed_query(query)
 
         # Search all documents (optionally could filter by conversation_id)
         where_filter = None
@@ -183,14 +307,16 @@ class RAGEngine:
             where_filter = {"conversation_id": conversation_id}
 
         try:
-            results = self._vs.query(
+            results = await asyncio.to_thread(
+                self._vs.query,
                 query_embedding=query_embedding,
                 n_results=self._retrieval_k,
                 where=where_filter,
             )
         except Exception:
             # If no documents match the filter, try without filter
-            results = self._vs.query(
+            results = await asyncio.to_thread(
+                self._vs.query,
                 query_embedding=query_embedding,
                 n_results=self._retrieval_k,
             )
@@ -206,13 +332,17 @@ class RAGEngine:
         sources = []
         threshold = self._settings.rag_config.get("similarity_threshold", 0.3)
 
-        for i, (doc, meta) in enumerate(zip(documents, metadatas)):
-            distance = distances[i] if i < len(distances) else 1.0
-            # ChromaDB cosine distance: 0 = identical, 2 = opposite
-            similarity = 1.0 - distance
-            if similarity < threshold:
-                continue
-
+        # ChromaDB cosine distance: 0 = identical, 2 = opposite.  Results
+        # without a distance count as 1.0 (similarity 0).  float64, so the
+        # threshold test and the reported values match Python float math
+        dists = np.ones(len(documents), dtype=np.float64)
+        known = min(len(distances), len(documents))
+        dists[:known] = distances[:known]
+        sims = 1.0 - dists
+
+        for i in np.flatnonzero(sims >= threshold).tolist():
+            doc, meta = documents[i], metadatas[i]
+            similarity = round(float(sims[i]), 3)
             context_parts.append(
                 f"[Source: {meta.get('filename', 'Unknown')}, "
                 f"Chunk {meta.get('chunk_index', '?')}]\n{doc}"
@@ -221,7 +351,7 @@ class RAGEngine:
                 "filename": meta.get("filename", "Unknown"),
                 "chunk_index": meta.get("chunk_index"),
                 "content_preview": doc[:200],
-                "similarity": round(similarity, 3),
+                "similarity": similarity,
             })
 
         context = "\n\n---\n\n".join(context_parts)
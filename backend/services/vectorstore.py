@@ -1,6 +1,32 @@
+import logging
+import sqlite3
+import threading
+from pathlib import Path
+
 import chromadb
+import numpy as np
 from backend.config import Settings
 
+logger = logging.getLogger(__name__)
+
+
+def _enable_wal(persist_dir: str) -> str:
+    """Put Chroma's SQLite database in WAL mode; returns the resulting mode.
+
+    Chroma's Rust core owns its connections, so per-connection pragmas
+    (synchronous, cache_size, mmap_size) can't be set from here -- but the
+    journal mode is stored in the database file and applies to every later
+    connection.  Must run before the client opens the file; creates it if
+    missing (Chroma initialises an empty database as usual).
+    """
+    path = Path(persist_dir)
+    path.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path / "chroma.sqlite3")
+    try:
+        return conn.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+    finally:
+        conn.close()
+
 
 class VectorStoreManager:
     """Manages ChromaDB PersistentClient — singleton pattern."""
@@ -9,13 +35,47 @@ class VectorStoreManager:
 
     def __init__(self, settings: Settings):
         self._settings = settings
-        self._client = chromadb.PersistentClient(
-            path=settings.chroma_persist_dir,
-        )
+        if settings.chroma_mode == "server":
+            # The embedded client funnels every write through one SQLite
+            # writer; a server lets the ingest shards write concurrently
+            self._client = chromadb.HttpClient(
+                host=settings.chroma_host, port=settings.chroma_port,
+            )
+        else:
+            if settings.chroma_fast_writes:
+                # Appends commits to a log instead of rewriting a rollback
+                # journal, and lets queries read while an ingest is writing
+                mode = _enable_wal(settings.chroma_persist_dir)
+                logger.info("ChromaDB journal_mode=%s", mode)
+            self._client = chromadb.PersistentClient(
+                path=settings.chroma_persist_dir,
+            )
         self._collection = self._client.get_or_create_collection(
             name="documents",
             metadata={"hnsw:space": "cosine"},
         )
+        self._batch_size = settings.chroma_batch_size
+        # Chunks queued by add_chunk_streaming, as (id, embedding, document,
+        # metadata); the manager is shared across worker threads
+        self._pending: list[tuple] = []
+        self._pending_lock = threading.Lock()
+        # The HNSW index is loaded from disk on first query; take that hit
+        # off the first user's request
+        self._warm_up_thread = threading.Thread(
+            target=self._warm_up, name="chroma-warmup", daemon=True
+        )
+        self._warm_up_thread.start()
+
+    def _warm_up(self):
+        """Run one throwaway query so the index is resident before it's needed."""
+        try:
+            sample = self._collection.peek(1)
+            if len(sample["ids"]) == 0:
+                return
+            self._collection.query(query_embeddings=sample["embeddings"][:1], n_results=1)
+        except Exception:
+            # Only an optimisation; a real query will surface real problems
+            logger.warning("ChromaDB warm-up query failed", exc_info=True)
 
     @classmethod
     def get_instance(cls, settings: Settings) -> "VectorStoreManager":
@@ -30,25 +90,82 @@ class VectorStoreManager:
     def add_chunks(
         self,
         ids: list[str],
-        embeddings: list[list[float]],
+        embeddings: np.ndarray | list[list[float]],
         documents: list[str],
         metadatas: list[dict],
+        batch_size: int | None = None,
     ):
-        self._collection.add(
-            ids=ids,
-            embeddings=embeddings,
-            documents=documents,
-            metadatas=metadatas,
-        )
+        """Add chunks in windows of ``batch_size`` (default: the configured size).
+
+        Each window is one collection.add call -- a single SQLite transaction
+        and index update -- so per-call overhead is amortised without one
+        huge payload.
+        """
+        batch_size = batch_size or self._batch_size
+        # One contiguous float32 buffer rather than N x D Python floats (the
+        # RAG engine already hands over arrays; this covers other callers)
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        for start in range(0, len(ids), batch_size):
+            end = start + batch_size
+            try:
+                self._collection.add(
+                    ids=ids[start:end],
+                    embeddings=embeddings[start:end],
+                    documents=documents[start:end],
+                    metadatas=metadatas[start:end],
+                )
+            except Exception:
+                # Re-raised: callers remove the partial document on failure
+                logger.error(
+                    "Adding chunks %d-%d of %d failed", start, min(end, len(ids)), len(ids)
+                )
+                raise
+
+    def add_chunk_streaming(
+        self, chunk_id: str, embedding, document: str, metadata: dict,
+    ):
+        """Queue one chunk; a full batch is written out. Call flush() when done."""
+        with self._pending_lock:
+            self._pending.append((chunk_id, embedding, document, metadata))
+            if len(self._pending) < self._batch_size:
+                return
+            batch, self._pending = self._pending, []
+        self._add_pending(batch)
+
+    def flush(self):
+        """Write out chunks queued by add_chunk_streaming."""
+        with self._pending_lock:
+            batch, self._pending = self._pending, []
+        if batch:
+            self._add_pending(batch)
+
+    def _add_pending(self, batch: list[tuple]):
+        ids, embeddings, documents, metadatas = map(list, zip(*batch))
+        self.add_chunks(ids, embeddings, documents, metadatas)
 
     def query(
         self,
-        query_embedding: list[float],
+        query_embedding: np.ndarray | list[float],
         n_results: int = 5,
         where: dict | None = None,
     ) -> dict:
+        """Query with one vector; results are lists of one, as from Chroma."""
+        return self.query_batch(
+            np.asarray(query_embedding, dtype=np.float32)[None, :], n_results, where,
+        )
+
+    def query_batch(
+        self,
+        query_embeddings: np.ndarray | list[list[float]],
+        n_results: int = 5,
+        where: dict | None = None,
+    ) -> dict:
+        """Query with several vectors in one call; results are per vector.
+
+        All vectors share ``where``; one index search serves the batch.
+        """
         kwargs = {
-            "query_embeddings": [query_embedding],
+            "query_embeddings": np.ascontiguousarray(query_embeddings, dtype=np.float32),
             "n_results": n_results,
         }
         if where:
@@ -60,4 +177,15 @@ class VectorStoreManager:
 
     def delete_by_document_id(self, document_id: str):
         """Delete all chunks belonging to a document."""
-        self._collection.delete(where={"document_id": document_id})
+        self.delete_by_document_ids([document_id])
+
+    def delete_by_document_ids(self, document_ids: list[str]):
+        """Delete all chunks belonging to any of the documents in one call."""
+        document_ids = list(dict.fromkeys(document_ids))
+        if not document_ids:
+            return
+        if len(document_ids) == 1:
+            where = {"document_id": document_ids[0]}
+        else:
+            where = {"document_id": {"$in": document_ids}}
+        self._collection.delete(where=where)
@@ -1,29 +1,118 @@
+import asyncio
 import io
 import logging
+import re
+import wave
+from itertools import pairwise
+from typing import AsyncIterator
 
-from openai import OpenAI
+import numpy as np
+from openai import AsyncOpenAI
 
 from backend.config import Settings
+from backend.services.http_client import get_http_client
 
 logger = logging.getLogger(__name__)
 
+# Long recordings are transcribed in windows of about this many seconds
+_STREAM_WINDOW_SECONDS = 20
+# Window ends move back to the quietest 20 ms within this many seconds,
+# so cuts land in pauses rather than mid-word
+_SPLIT_SEARCH_SECONDS = 2
+# Whisper rejects clips under 0.1 s; a remainder shorter than this stays in
+# the window before it instead of becoming a window of its own
+_MIN_WINDOW_SECONDS = 1
+# Whisper requests in flight per recording
+_STREAM_CONCURRENCY = 4
+
+# Long TTS input is synthesized as phrases of up to this many characters
+_TTS_PHRASE_CHARS = 200
+# Phrases synthesized ahead of the one being streamed
+_TTS_CONCURRENCY = 3
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def _split_wav(audio_bytes: bytes) -> list[bytes] | None:
+    """Split a WAV recording into standalone WAV windows.
+
+    Returns None for non-WAV input or recordings that fit in one window.
+    """
+    try:
+        with wave.open(io.BytesIO(audio_bytes)) as w:
+            params = w.getparams()
+            frames = w.readframes(params.nframes)
+    except (wave.Error, EOFError):
+        return None
+
+    rate = params.framerate
+    nframes = len(frames) // (params.sampwidth * params.nchannels)
+    window = _STREAM_WINDOW_SECONDS * rate
+    # Split only while more than a minimal window would be left after the cut
+    limit = window + _MIN_WINDOW_SECONDS * rate
+    if nframes <= limit:
+        return None
+
+    energy = None
+    if params.sampwidth == 2:
+        samples = np.frombuffer(frames, "<i2", count=nframes * params.nchannels)
+        energy = np.abs(samples.reshape(-1, params.nchannels).astype(np.int32)).sum(axis=1)
+
+    hop = max(rate // 50, 1)
+    cuts = [0]
+    while nframes - cuts[-1] > limit:
+        end = cuts[-1] + window
+        if energy is not None:
+            start = end - _SPLIT_SEARCH_SECONDS * rate
+            blocks = energy[start:start + (end - start) // hop * hop].reshape(-1, hop).sum(axis=1)
+            end = start + int(np.argmin(blocks)) * hop + hop // 2
+        cuts.append(end)
+    cuts.append(nframes)
+
+    frame_size = params.sampwidth * params.nchannels
+    segments = []
+    for a, b in pairwise(cuts):
+        buf = io.BytesIO()
+        with wave.open(buf, "wb") as w:
+            w.setparams(params)
+            w.writeframes(frames[a * frame_size:b * frame_size])
+        segments.append(buf.getvalue())
+    return segments
+
+
+def _split_phrases(text: str) -> list[str]:
+    """Group sentences into phrases of up to ``_TTS_PHRASE_CHARS`` characters.
+
+    A single sentence longer than the limit stays whole.
+    """
+    phrases = []
+    current = ""
+    for sentence in _SENTENCE_END.split(text.strip()):
+        if current and len(current) + 1 + len(sentence) > _TTS_PHRASE_CHARS:
+            phrases.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        phrases.append(current)
+    return phrases
+
 
 class VoiceService:
     def __init__(self, settings: Settings):
-        self._client = OpenAI(api_key=settings.openai_api_key.get_secret_value())
+        api_key = settings.openai_api_key.get_secret_value()
+        self._async_client = AsyncOpenAI(api_key=api_key, http_client=get_http_client())
         self._stt_model = settings.voice_config.get("stt_model", "whisper-1")
         self._tts_model = settings.voice_config.get("tts_model", "tts-1")
         self._tts_voice = settings.voice_config.get("tts_voice", "nova")
         self._tts_format = settings.voice_config.get("tts_response_format", "mp3")
 
-    def transcribe(self, audio_bytes: bytes, filename: str = "recording.wav") -> dict:
+    async def transcribe(self, audio_bytes: bytes, filename: str = "recording.wav") -> dict:
         """Transcribe audio bytes using OpenAI Whisper."""
-        audio_file = io.BytesIO(audio_bytes)
-        audio_file.name = filename
-
-        transcript = self._client.audio.transcriptions.create(
+        transcript = await self._async_client.audio.transcriptions.create(
             model=self._stt_model,
-            file=audio_file,
+            # (name, bytes) goes into the multipart body as is; wrapping the
+            # bytes in a BytesIO first would copy the whole recording
+            file=(filename, audio_bytes),
             response_format="verbose_json",
         )
 
@@ -32,15 +121,98 @@ class VoiceService:
             "audio_duration_seconds": getattr(transcript, "duration", 0.0),
         }
 
-    def synthesize(self, text: str, voice: str | None = None) -> bytes:
-        """Convert text to speech using OpenAI TTS. Returns audio bytes."""
+    async def transcribe_stream(
+        self, audio_bytes: bytes, filename: str = "recording.wav"
+    ) -> AsyncIterator[dict]:
+        """Transcribe a recording window by window, yielding text as it is ready.
+
+        Windows are transcribed concurrently and yielded in order as
+        ``{"text": ..., "final": False}``.  The last event carries the full
+        text and duration with ``"final": True``.
+        """
+        segments = _split_wav(audio_bytes)
+        if segments is None:
+            result = await self.transcribe(audio_bytes, filename)
+            yield {"text": result["text"].strip(), "final": False}
+            yield {**result, "final": True}
+            return
+
+        semaphore = asyncio.Semaphore(_STREAM_CONCURRENCY)
+
+        async def _transcribe_segment(segment: bytes) -> dict:
+            async with semaphore:
+                return await self.transcribe(segment, "recording.wav")
+
+        tasks = [asyncio.create_task(_transcribe_segment(s)) for s in segments]
+        texts = []
+        duration = 0.0
+        try:
+            for task in tasks:
+                result = await task
+                text = result["text"].strip()
+                texts.append(text)
+                duration += result["audio_duration_seconds"] or 0.0
+                yield {"text": text, "final": False}
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        yield {
+            "text": " ".join(t for t in texts if t),
+            "audio_duration_seconds": duration,
+            "final": True,
+        }
+
+    async def synthesize_stream(
+        self, text: str, voice: str | None = None, chunk_size: int = 4096
+    ) -> AsyncIterator[bytes]:
+        """Convert text to speech using OpenAI TTS, yielding the audio as it
+        is generated.
+
+        Long MP3 input is split into phrases: the first is streamed while the
+        following ones are synthesized concurrently, then yielded in order.
+        MP3 frames concatenate cleanly; other formats use a single request.
+        """
         voice = voice or self._tts_voice
+        phrases = _split_phrases(text) if self._tts_format == "mp3" else [text]
+        if len(phrases) <= 1:
+            async for chunk in self._stream_phrase(text, voice, chunk_size):
+                yield chunk
+            return
+
+        semaphore = asyncio.Semaphore(_TTS_CONCURRENCY)
+
+        async def _prefetch(phrase: str) -> bytes:
+            async with semaphore:
+                return await self._fetch_phrase(phrase, voice)
 
-        response = self._client.audio.speech.create(
+        tasks = [asyncio.create_task(_prefetch(p)) for p in phrases[1:]]
+        try:
+            async for chunk in self._stream_phrase(phrases[0], voice, chunk_size):
+                yield chunk
+            for task in tasks:
+                yield await task
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _stream_phrase(
+        self, text: str, voice: str, chunk_size: int
+    ) -> AsyncIterator[bytes]:
+        async with self._async_client.audio.speech.with_streaming_response.create(
             model=self._tts_model,
             voice=voice,
             input=text,
             response_format=self._tts_format,
-        )
+        ) as response:
+            async for chunk in response.iter_bytes(chunk_size):
+                yield chunk
 
+    async def _fetch_phrase(self, text: str, voice: str) -> bytes:
+        response = await self._async_client.audio.speech.create(
+            model=self._tts_model,
+            voice=voice,
+            input=text,
+            response_format=self._tts_format,
+        )
         return response.content
@@ -1,16 +1,96 @@
-import json
+import atexit
 import os
-from typing import Optional
+import queue
+import threading
+import time
+from typing import IO, Optional
 
 import httpx
+import orjson
 from httpx_sse import connect_sse
 
 BACKEND_URL = os.environ.get("BACKEND_URL", "http://127.0.0.1:8000")
 
+# Whisper rejects uploads over 25 MB; larger WAV recordings are split into
+# windows by the backend's streaming endpoint, anything else can't be sent
+_MAX_AUDIO_BYTES = 24 * 1024 * 1024
+
+# Per client.  Streamlit serves every session from one process (the client
+# is shared via st.cache_resource), so concurrent users share these pools
+_LIMITS = httpx.Limits(max_connections=32, max_keepalive_connections=16)
+
+
+def _check_audio_size(audio_bytes: bytes) -> bool:
+    """Return whether the audio must go through the splitting endpoint.
+
+    Raises ValueError for oversize audio that can't be split, before any
+    upload is attempted.
+    """
+    if len(audio_bytes) <= _MAX_AUDIO_BYTES:
+        return False
+    if audio_bytes[:4] == b"RIFF" and audio_bytes[8:12] == b"WAVE":
+        return True
+    raise ValueError(
+        f"Audio is {len(audio_bytes) / 2**20:.0f} MB; only WAV recordings "
+        f"over {_MAX_AUDIO_BYTES // 2**20} MB can be transcribed"
+    )
+
+# Pending analytics events as (client, payload); full queue drops new events
+_ANALYTICS_Q: queue.Queue = queue.Queue(maxsize=1024)
+
+
+def _analytics_worker():
+    while True:
+        client, event = _ANALYTICS_Q.get()
+        try:
+            client.post("/analytics/event", json=event, timeout=5.0)
+        except Exception:
+            pass  # Non-critical — analytics must never surface errors
+
+
+threading.Thread(target=_analytics_worker, name="analytics", daemon=True).start()
+
 
 class APIClient:
+    """Backend client.  Connections are pooled and reused across calls (and,
+    via the cached instance in app.py, across Streamlit sessions)."""
+
     def __init__(self, base_url: str = BACKEND_URL):
         self.base_url = base_url
+        # Short REST calls
+        self._client = httpx.Client(
+            base_url=base_url, timeout=httpx.Timeout(10.0), limits=_LIMITS
+        )
+        # Chat streams, uploads and voice: long-held connections kept apart
+        # so they don't crowd out quick calls
+        self._long_client = httpx.Client(
+            base_url=base_url, timeout=httpx.Timeout(120.0), limits=_LIMITS
+        )
+        # Short-lived GET responses: (path, params) -> (expires_at, json).
+        # Streamlit reruns the script on every interaction, re-requesting
+        # data that changes at most every few seconds
+        self._cache: dict[tuple, tuple[float, object]] = {}
+        atexit.register(self.close)
+
+    def close(self):
+        self._client.close()
+        self._long_client.close()
+
+    def invalidate(self):
+        """Drop cached GET responses (called after writes)."""
+        self._cache.clear()
+
+    def _cached_get(self, path: str, ttl: float, params: dict | None = None, **kwargs):
+        key = (path, tuple(sorted((params or {}).items())))
+        hit = self._cache.get(key)
+        now = time.monotonic()
+        if hit and hit[0] > now:
+            return hit[1]
+        r = self._client.get(path, params=params, **kwargs)
+        r.raise_for_status()
+        data = r.json()
+        self._cache[key] = (now + ttl, data)
+        return data
 
     # --- Streaming chat (synchronous for Streamlit) ---
 
@@ -30,148 +110,184 @@ class APIClient:
             "use_rag": use_rag,
             "temperature": temperature,
         }
-        with httpx.Client(timeout=httpx.Timeout(300.0)) as client:
-            with connect_sse(
-                client, "POST", f"{self.base_url}/chat/completions",
-                json=payload,
-            ) as event_source:
-                for sse in event_source.iter_sse():
-                    try:
-                        data = json.loads(sse.data) if sse.data else {}
-                    except json.JSONDecodeError:
-                        data = {"raw": sse.data}
-                    yield {
-                        "event": sse.event,
-                        "data": data,
-                    }
+        try:
+            yield from self._iter_sse("/chat/completions", payload)
+        finally:
+            # The exchange was saved to the conversation, possibly a new one
+            self.invalidate()
+
+    def stream_compare(
+        self,
+        message: str,
+        model_ids: list[str],
+        use_rag: bool = False,
+        temperature: float = 0.7,
+    ):
+        """Stream several models' replies over one SSE connection.
+
+        Per-model events carry the model's position in ``model_ids`` as
+        ``data["idx"]``.
+        """
+        payload = {
+            "message": message,
+            "model_ids": model_ids,
+            "use_rag": use_rag,
+            "temperature": temperature,
+        }
+        yield from self._iter_sse("/chat/compare", payload)
+
+    def _iter_sse(self, path: str, payload: dict):
+        with connect_sse(
+            self._long_client, "POST", path,
+            # Generous read timeout: the gap between events can be long
+            # while a model thinks or RAG retrieval runs
+            json=payload, timeout=httpx.Timeout(300.0, connect=10.0),
+        ) as event_source:
+            for sse in event_source.iter_sse():
+                try:
+                    # One parse per token event; orjson is several times
+                    # faster than json here
+                    data = orjson.loads(sse.data) if sse.data else {}
+                except orjson.JSONDecodeError:
+                    data = {"raw": sse.data}
+                yield {
+                    "event": sse.event,
+                    "data": data,
+                }
 
     # --- REST calls ---
 
     def list_conversations(self) -> list[dict]:
-        with httpx.Client(timeout=10.0) as client:
-            r = client.get(f"{self.base_url}/conversations")
-            r.raise_for_status()
-            return r.json()["conversations"]
+        # Rendered by the sidebar on every rerun
+        return self._cached_get("/conversations", 5)["conversations"]
 
     def create_conversation(self, model_id: str, title: str = "New Conversation") -> dict:
-        with httpx.Client(timeout=10.0) as client:
-            r = client.post(
-                f"{self.base_url}/conversations",
-                json={"model_id": model_id, "title": title},
-            )
-            r.raise_for_status()
-            return r.json()
+        r = self._client.post(
+            "/conversations",
+            json={"model_id": model_id, "title": title},
+        )
+        r.raise_for_status()
+        self.invalidate()
+        return r.json()
 
     def get_conversation(self, conversation_id: str) -> dict:
-        with httpx.Client(timeout=10.0) as client:
-            r = client.get(f"{self.base_url}/conversations/{conversation_id}")
-            r.raise_for_status()
-            return r.json()
+        r = self._client.get(f"/conversations/{conversation_id}")
+        r.raise_for_status()
+        return r.json()
 
     def get_messages(self, conversation_id: str) -> list[dict]:
-        with httpx.Client(timeout=10.0) as client:
-            r = client.get(f"{self.base_url}/conversations/{conversation_id}/messages")
-            r.raise_for_status()
-            return r.json()
+        # Only changes through stream_chat, which invalidates the cache
+        return self._cached_get(f"/conversations/{conversation_id}/messages", 300)
 
     def delete_conversation(self, conversation_id: str):
-        with httpx.Client(timeout=10.0) as client:
-            r = client.delete(f"{self.base_url}/conversations/{conversation_id}")
-            r.raise_for_status()
+        r = self._client.delete(f"/conversations/{conversation_id}")
+        r.raise_for_status()
+        self.invalidate()
 
     def update_system_prompt(self, conversation_id: str, system_prompt: str):
-        with httpx.Client(timeout=10.0) as client:
-            r = client.put(
-                f"{self.base_url}/conversations/{conversation_id}/system-prompt",
-                json={"system_prompt": system_prompt},
-            )
-            r.raise_for_status()
+        r = self._client.put(
+            f"/conversations/{conversation_id}/system-prompt",
+            json={"system_prompt": system_prompt},
+        )
+        r.raise_for_status()
+        self.invalidate()
 
     def upload_document(
-        self, file_bytes: bytes, filename: str, conversation_id: str | None = None
+        self,
+        file: bytes | IO[bytes],
+        filename: str,
+        conversation_id: str | None = None,
+        content_type: str | None = None,
     ) -> dict:
-        with httpx.Client(timeout=120.0) as client:
-            files = {"file": (filename, file_bytes)}
-            data = {}
-            if conversation_id:
-                data["conversation_id"] = conversation_id
-            r = client.post(
-                f"{self.base_url}/documents/upload", files=files, data=data
-            )
-            r.raise_for_status()
-            return r.json()
+        """Upload a document for ingestion.
+
+        ``file`` may be an open binary file, which httpx streams in chunks
+        instead of building the whole multipart body in memory.
+        """
+        files = {"file": (filename, file, content_type)}
+        data = {}
+        if conversation_id:
+            data["conversation_id"] = conversation_id
+        r = self._long_client.post("/documents/upload", files=files, data=data)
+        r.raise_for_status()
+        self.invalidate()
+        return r.json()
 
     def list_documents(self, conversation_id: str | None = None) -> list[dict]:
-        with httpx.Client(timeout=10.0) as client:
-            params = {}
-            if conversation_id:
-                params["conversation_id"] = conversation_id
-            r = client.get(f"{self.base_url}/documents", params=params)
-            r.raise_for_status()
-            return r.json()["documents"]
+        params = {}
+        if conversation_id:
+            params["conversation_id"] = conversation_id
+        # Rendered by the sidebar on every rerun; uploads invalidate the cache
+        return self._cached_get("/documents", 5, params=params)["documents"]
 
     def transcribe_audio(
         self, audio_bytes: bytes, filename: str = "recording.wav"
     ) -> dict:
-        with httpx.Client(timeout=60.0) as client:
-            files = {"file": (filename, audio_bytes)}
-            r = client.post(f"{self.base_url}/voice/transcribe", files=files)
+        if _check_audio_size(audio_bytes):
+            for event in self.transcribe_audio_stream(audio_bytes, filename):
+                if "error" in event:
+                    raise RuntimeError(event["error"])
+                if event["final"]:
+                    return {
+                        "text": event["text"],
+                        "audio_duration_seconds": event["audio_duration_seconds"],
+                    }
+            raise RuntimeError("Transcription stream ended early")
+        files = {"file": (filename, audio_bytes)}
+        r = self._long_client.post("/voice/transcribe", files=files, timeout=60.0)
+        r.raise_for_status()
+        return r.json()
+
+    def transcribe_audio_stream(
+        self, audio_bytes: bytes, filename: str = "recording.wav"
+    ):
+        """Yield transcription events as the backend produces them."""
+        _check_audio_size(audio_bytes)
+        files = {"file": (filename, audio_bytes)}
+        with self._long_client.stream(
+            "POST", "/voice/transcribe/stream", files=files, timeout=60.0
+        ) as r:
             r.raise_for_status()
-            return r.json()
+            for line in r.iter_lines():
+                if line:
+                    yield orjson.loads(line)
 
     def synthesize_speech(self, text: str, voice: str = "nova") -> bytes:
-        with httpx.Client(timeout=60.0) as client:
-            r = client.post(
-                f"{self.base_url}/voice/synthesize",
-                json={"text": text, "voice": voice},
-            )
-            r.raise_for_status()
-            return r.content
+        r = self._long_client.post(
+            "/voice/synthesize",
+            json={"text": text, "voice": voice},
+            timeout=60.0,
+        )
+        r.raise_for_status()
+        return r.content
 
     def get_cost_summary(self, conversation_id: str | None = None) -> dict:
-        with httpx.Client(timeout=10.0) as client:
-            params = {}
-            if conversation_id:
-                params["conversation_id"] = conversation_id
-            r = client.get(f"{self.base_url}/costs/summary", params=params)
-            r.raise_for_status()
-            return r.json()
+        params = {}
+        if conversation_id:
+            params["conversation_id"] = conversation_id
+        r = self._client.get("/costs/summary", params=params)
+        r.raise_for_status()
+        return r.json()
 
     def log_analytics_event(self, event_type: str, event_data: dict | None = None):
-        """Fire-and-forget analytics event."""
+        """Fire-and-forget analytics event, posted by a background thread."""
         try:
-            with httpx.Client(timeout=5.0) as client:
-                client.post(
-                    f"{self.base_url}/analytics/event",
-                    json={
-                        "event_type": event_type,
-                        "event_data": event_data or {},
-                    },
-                )
-        except Exception:
+            _ANALYTICS_Q.put_nowait((
+                self._client,
+                {"event_type": event_type, "event_data": event_data or {}},
+            ))
+        except queue.Full:
             pass  # Non-critical — never block the UI
 
     def get_analytics_summary(self, days: int = 30) -> dict:
-        with httpx.Client(timeout=10.0) as client:
-            r = client.get(
-                f"{self.base_url}/analytics/summary",
-                params={"days": days},
-            )
-            r.raise_for_status()
-            return r.json()
+        return self._cached_get("/analytics/summary", 60, params={"days": days})
 
     def get_suggestions(self) -> list[str]:
         """Fetch dynamic suggested prompts (3s timeout, fallback on failure)."""
         try:
-            with httpx.Client(timeout=5.0) as client:
-                r = client.get(f"{self.base_url}/suggestions")
-                r.raise_for_status()
-                return r.json().get("suggestions", [])
+            return self._cached_get("/suggestions", 300, timeout=5.0).get("suggestions", [])
         except Exception:
             return []
 
     def health_check(self) -> dict:
-        with httpx.Client(timeout=5.0) as client:
-            r = client.get(f"{self.base_url}/health")
-            r.raise_for_status()
-            return r.json()
+        return self._cached_get("/health", 30, timeout=5.0)
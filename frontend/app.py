@@ -1,4 +1,6 @@
 import os
+import re
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -22,120 +24,17 @@ st.set_page_config(
 )
 
 # --- Custom CSS ---
-st.markdown("""
-<style>
-    /* Gradient header */
-    .stApp > header { background: linear-gradient(90deg, #667eea 0%, #764ba2 100%); }
+@st.cache_data
+def _load_css() -> str:
+    """Read and minify the stylesheet once per process, not on every rerun."""
+    css = (Path(__file__).parent / "static" / "app.css").read_text(encoding="utf-8")
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    return re.sub(r"\s+", " ", css).strip()
 
-    /* Sidebar styling */
-    section[data-testid="stSidebar"] {
-        background: linear-gradient(180deg, #1a1a2e 0%, #16213e 100%);
-    }
-    section[data-testid="stSidebar"] .stMarkdown { color: #e0e0e0; }
 
-    /* Chat message styling */
-    .stChatMessage { border-radius: 12px; margin-bottom: 8px; }
-
-    /* Provider badges */
-    .provider-badge {
-        display: inline-block;
-        padding: 2px 8px;
-        border-radius: 12px;
-        font-size: 0.7em;
-        font-weight: 600;
-        margin-left: 4px;
-    }
-    .provider-openai { background: #10a37f20; color: #10a37f; border: 1px solid #10a37f40; }
-    .provider-anthropic { background: #d4a27420; color: #d4a274; border: 1px solid #d4a27440; }
-    .provider-google { background: #4285f420; color: #4285f4; border: 1px solid #4285f440; }
-    .provider-perplexity { background: #1fb8cd20; color: #1fb8cd; border: 1px solid #1fb8cd40; }
-
-    /* Suggested prompt buttons */
-    .stButton > button[kind="secondary"] {
-        border-radius: 20px;
-        border: 1px solid #667eea40;
-        transition: all 0.2s;
-    }
-    .stButton > button[kind="secondary"]:hover {
-        border-color: #667eea;
-        background: #667eea10;
-    }
-
-    /* Cost progress bar */
-    .stProgress > div > div { background: linear-gradient(90deg, #10a37f, #667eea); }
-
-    /* Hide Streamlit branding */
-    #MainMenu { visibility: hidden; }
-    footer { visibility: hidden; }
-
-    /* Landing page styles */
-    .landing-hero {
-        text-align: center;
-        padding: 2rem 0 1rem 0;
-    }
-    .landing-logo {
-        background: linear-gradient(90deg, #667eea, #764ba2);
-        -webkit-background-clip: text;
-        -webkit-text-fill-color: transparent;
-        font-size: 3em;
-        font-weight: 800;
-        margin-bottom: 0.2em;
-        letter-spacing: -0.02em;
-    }
-    .landing-tagline {
-        color: #999;
-        font-size: 0.95em;
-        margin-bottom: 1.5em;
-        font-style: italic;
-    }
-    .landing-headline {
-        font-size: 1.6em;
-        font-weight: 700;
-        color: #e0e0e0;
-        line-height: 1.3;
-        margin-bottom: 0.3em;
-    }
-    .landing-subheadline {
-        font-size: 1.05em;
-        color: #aaa;
-        margin-bottom: 2em;
-    }
-    .landing-card {
-        background: #1a1a2e;
-        border: 1px solid #2a2a4a;
-        border-radius: 12px;
-        padding: 1.5rem;
-        text-align: center;
-        min-height: 180px;
-    }
-    .landing-card-icon {
-        font-size: 2em;
-        margin-bottom: 0.5em;
-    }
-    .landing-card h3 {
-        color: #e0e0e0;
-        font-size: 1.05em;
-        margin-bottom: 0.5em;
-    }
-    .landing-card p {
-        color: #999;
-        font-size: 0.9em;
-        line-height: 1.5;
-    }
-    .landing-audience {
-        text-align: center;
-        color: #888;
-        font-size: 0.95em;
-        padding: 1rem 0;
-    }
-    .landing-footer {
-        text-align: center;
-        color: #555;
-        font-size: 0.8em;
-        padding-top: 2rem;
-    }
-</style>
-""", unsafe_allow_html=True)
+# Streamlit rebuilds the page on every rerun, so the style element has to be
+# emitted each time; caching keeps that to one small pre-built string
+st.markdown(f"<style>{_load_css()}</style>", unsafe_allow_html=True)
 
 # --- Access Gate / Landing Page ---
 ACCESS_CODE = os.environ.get("ACCESS_CODE", "")
@@ -238,8 +137,21 @@ if ACCESS_CODE:
         st.stop()
 
 # --- Initialize session state ---
-if "api_client" not in st.session_state:
-    st.session_state.api_client = APIClient()
+@st.cache_resource
+def get_api_client() -> APIClient:
+    """One APIClient (and connection pool) per Streamlit process."""
+    return APIClient()
+
+
+@st.cache_resource
+def get_prefetch_pool() -> ThreadPoolExecutor:
+    """Threads for fetching a rerun's sidebar data concurrently."""
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="prefetch")
+
+
+# Re-read on every rerun (a cache lookup) so sessions follow the process-wide
+# client if the resource cache is cleared, instead of keeping an old one
+st.session_state.api_client = get_api_client()
 if "messages" not in st.session_state:
     st.session_state.messages = []
 if "conversation_id" not in st.session_state:
@@ -265,10 +177,17 @@ if st.query_params.get("admin") == "1":
     st.stop()
 
 # --- Sidebar ---
+# Start the sidebar's backend calls together so their round trips overlap;
+# each section waits on its own result where it is rendered
+_api = st.session_state.api_client
+_pool = get_prefetch_pool()
+conversations = _pool.submit(_api.list_conversations)
+documents = _pool.submit(_api.list_documents, st.session_state.conversation_id)
+
 with st.sidebar:
-    render_sidebar()
+    render_sidebar(conversations)
     st.divider()
-    render_document_upload()
+    render_document_upload(documents)
 
 # --- Main area ---
 render_voice_controls()
@@ -92,13 +92,15 @@ def render_admin_dashboard():
         st.markdown("### Model Usage (by message count)")
         model_usage = data.get("model_usage", [])
         if model_usage:
+            # One element per section rather than per row: each Streamlit
+            # element is a separate message to the browser on every rerun
             total_model_msgs = sum(m["count"] for m in model_usage)
-            for m in model_usage:
-                pct = m["count"] / total_model_msgs * 100 if total_model_msgs > 0 else 0
-                st.markdown(
-                    f"**{m['model_id']}**: {m['count']} calls ({pct:.1f}%)"
-                )
-                st.progress(pct / 100)
+            st.markdown("\n".join(
+                f"- **{m['model_id']}**: {m['count']} calls "
+                f"({m['count'] / total_model_msgs * 100 if total_model_msgs else 0:.1f}%)"
+                for m in model_usage
+            ))
+            st.bar_chart({m["model_id"]: m["count"] for m in model_usage})
         else:
             st.caption("No model usage data yet")
 
@@ -106,15 +108,13 @@ def render_admin_dashboard():
         st.markdown("### Model Costs")
         model_costs = data.get("model_costs", [])
         if model_costs:
-            for m in model_costs:
-                st.markdown(
-                    f"**{m['model_id']}**: ${m['total_cost']:.4f} "
-                    f"({m['call_count']} calls)"
-                )
-                st.caption(
-                    f"  {m['total_input_tokens']:,} in / "
-                    f"{m['total_output_tokens']:,} out tokens"
-                )
+            st.markdown("\n".join(
+                f"- **{m['model_id']}**: ${m['total_cost']:.4f} "
+                f"({m['call_count']} calls)  \n"
+                f"  <small>{m['total_input_tokens']:,} in / "
+                f"{m['total_output_tokens']:,} out tokens</small>"
+                for m in model_costs
+            ), unsafe_allow_html=True)
         else:
             st.caption("No cost data yet")
 
@@ -124,18 +124,18 @@ def render_admin_dashboard():
     operations = data.get("operations", [])
     if operations:
         st.markdown("### Operations Breakdown")
-        for op in operations:
-            st.markdown(
-                f"**{op['operation']}**: {op['count']} calls, "
-                f"${op['cost']:.4f}"
-            )
+        st.markdown("\n".join(
+            f"- **{op['operation']}**: {op['count']} calls, ${op['cost']:.4f}"
+            for op in operations
+        ))
 
     # --- Feature events ---
     feature_events = data.get("feature_events", [])
     if feature_events:
         st.markdown("### Feature Usage Events")
-        for fe in feature_events:
-            st.markdown(f"**{fe['event_type']}**: {fe['count']} times")
+        st.markdown("\n".join(
+            f"- **{fe['event_type']}**: {fe['count']} times" for fe in feature_events
+        ))
 
     st.divider()
 
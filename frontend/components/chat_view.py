@@ -1,9 +1,11 @@
-import threading
+import html
+import re
 import time as _time
+from concurrent.futures import ThreadPoolExecutor
 
 import streamlit as st
 
-from frontend.components.sidebar import MODELS
+from frontend.components.sidebar import MODELS_BY_ID
 
 _FALLBACK_PROMPTS = [
     "What are the biggest tech stories this week?",
@@ -20,9 +22,26 @@ _CARD_ICONS = ["\u26a1", "\U0001f4bb", "\U0001f4c4", "\U0001f50d", "\u270f\ufe0f
 # How long (seconds) before we re-fetch personalised suggestions
 _SUGGESTIONS_TTL = 300  # 5 minutes
 
+# Past messages drawn on each rerun; older ones wait behind a button
+_HISTORY_WINDOW = 40
+
 # Models that have built-in web search
 WEB_SEARCH_PROVIDERS = {"Perplexity", "Google"}
 
+# A streaming reply is repainted once this many new characters have arrived
+# or this many seconds have passed; each repaint re-sends the whole message
+_RENDER_MIN_CHARS = 24
+_RENDER_INTERVAL = 0.05  # seconds
+# Appended to the live tail while a reply is still streaming
+_CURSOR = " |"
+
+# Read-aloud: replies are synthesized in sentence groups of at least
+# _TTS_MIN_SEGMENT characters while they stream, up to the TTS input limit
+_TTS_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="tts")
+_TTS_MAX_CHARS = 4096
+_TTS_MIN_SEGMENT = 200
+_SENTENCE_END = re.compile(r"[.!?]\s")
+
 # ---------------------------------------------------------------------------
 # Glassmorphic suggestion cards CSS
 # ---------------------------------------------------------------------------
@@ -150,17 +169,144 @@ def _get_suggested_prompts() -> list[str]:
 
 
 def _get_model_display_name(model_id: str) -> str:
-    for m in MODELS:
-        if m["id"] == model_id:
-            return m["name"]
-    return model_id
+    return MODELS_BY_ID.get(model_id, {}).get("name", model_id)
 
 
 def _get_model_provider(model_id: str) -> str:
-    for m in MODELS:
-        if m["id"] == model_id:
-            return m["provider"]
-    return ""
+    return MODELS_BY_ID.get(model_id, {}).get("provider", "")
+
+
+_FENCE_RE = re.compile(r" {0,3}(`{3,}|~{3,})")
+
+
+def _stable_prefix_len(text: str) -> int:
+    """Length of the leading run of complete markdown blocks in ``text``.
+
+    A block ends at a blank line outside a code fence or ``$$`` math block,
+    but only once the next non-blank line turns out not to be indented —
+    an indented line continues the block above it (e.g. a list item's
+    second paragraph). What follows the last boundary may still change as
+    tokens arrive.
+    """
+    end = pos = 0
+    fence = ""  # opening fence marker while inside a code fence
+    in_math = False
+    pending = None  # offset just after a blank line, awaiting the next line
+    for line in text.splitlines(keepends=True):
+        stripped = line.strip()
+        if pending is not None and stripped:
+            if not line[0].isspace():
+                end = pending
+            pending = None
+        if not line.endswith("\n"):
+            break  # still being written
+        pos += len(line)
+        match = _FENCE_RE.match(line)
+        if fence:
+            if match and match.group(1)[0] == fence[0] and len(match.group(1)) >= len(fence) \
+                    and not line[match.end():].strip():
+                fence = ""
+        elif match:
+            fence = match.group(1)
+        elif in_math:
+            in_math = not stripped.endswith("$$")
+        elif stripped.startswith("$$"):
+            in_math = stripped == "$$" or not stripped.endswith("$$")
+        elif not stripped:
+            pending = pos
+    return end
+
+
+class _StreamingMarkdown:
+    """A streaming reply painted as finished blocks plus a live tail.
+
+    Complete blocks are appended to a container once; only the unfinished
+    tail is re-rendered on each repaint, so a long reply isn't re-parsed
+    from the start every time.
+    """
+
+    def __init__(self):
+        self._blocks = st.container()
+        self.tail = st.empty()
+        self._committed = 0
+
+    def paint(self, text: str, cursor: bool = True):
+        # Block boundaries always lie outside code fences, so scanning can
+        # resume from the last one
+        stable = self._committed + _stable_prefix_len(text[self._committed:])
+        if stable > self._committed:
+            self._blocks.markdown(text[self._committed:stable])
+            self._committed = stable
+        self.tail.markdown(text[self._committed:] + (_CURSOR if cursor else ""))
+
+
+# Source lists are built into one markdown string each and cached: every
+# message in the history renders its sources again on every rerun
+
+@st.cache_data(max_entries=512, show_spinner=False)
+def _web_sources_markdown(web_sources: list[dict]) -> str:
+    entries = []
+    for src in web_sources:
+        url = src.get("url", "")
+        title = src.get("title", "Source")
+        source_type = src.get("source", "web")
+        badge = "Perplexity" if source_type == "perplexity" else "Google"
+        if url:
+            entries.append(
+                f"[{title}]({url})  \n"
+                f"<small style='color: #888;'>{badge} | {url[:80]}{'...' if len(url) > 80 else ''}</small>"
+            )
+        else:
+            entries.append(f"<small style='color: #888;'>{html.escape(title)} ({badge})</small>")
+    return "\n\n".join(entries)
+
+
+@st.cache_data(max_entries=512, show_spinner=False)
+def _rag_sources_markdown(sources: list[dict]) -> str:
+    return "\n\n".join(
+        f"<small style='color: #888;'><b>{html.escape(str(src.get('filename', 'Unknown')))}</b> "
+        f"(chunk {src.get('chunk_index', '?')}, "
+        f"similarity: {src.get('similarity', '?')})</small>\n\n"
+        f"<pre style='white-space: pre-wrap;'>"
+        f"{html.escape(src.get('content_preview', '')[:200])}</pre>"
+        for src in sources
+    )
+
+
+class _SpeechPrefetch:
+    """Synthesizes a reply piece by piece while it is still streaming.
+
+    Finished sentences are sent for synthesis in the background as they
+    arrive, so when the stream ends only the last piece is still pending.
+    The MP3 pieces concatenate into one playable clip.
+    """
+
+    def __init__(self, api_client):
+        self._api_client = api_client
+        self._sent = 0
+        self._futures = []
+
+    def feed(self, text: str):
+        text = text[:_TTS_MAX_CHARS]
+        if len(text) - self._sent < _TTS_MIN_SEGMENT:
+            return
+        last = None
+        for last in _SENTENCE_END.finditer(text, self._sent):
+            pass
+        if last is not None and last.end() - self._sent >= _TTS_MIN_SEGMENT:
+            self._submit(text[self._sent:last.end()])
+            self._sent = last.end()
+
+    def finish(self, text: str) -> bytes:
+        rest = text[:_TTS_MAX_CHARS][self._sent:]
+        if rest.strip():
+            self._submit(rest)
+        return b"".join(f.result() for f in self._futures)
+
+    def _submit(self, segment: str):
+        self._futures.append(
+            _TTS_EXECUTOR.submit(self._api_client.synthesize_speech, segment)
+        )
 
 
 def _render_web_sources(web_sources: list[dict]):
@@ -168,19 +314,7 @@ def _render_web_sources(web_sources: list[dict]):
     if not web_sources:
         return
     with st.expander(f"Web Sources ({len(web_sources)})"):
-        for src in web_sources:
-            url = src.get("url", "")
-            title = src.get("title", "Source")
-            source_type = src.get("source", "web")
-            badge = "Perplexity" if source_type == "perplexity" else "Google"
-            if url:
-                st.markdown(
-                    f"[{title}]({url})  \n"
-                    f"<small style='color: #888;'>{badge} | {url[:80]}{'...' if len(url) > 80 else ''}</small>",
-                    unsafe_allow_html=True,
-                )
-            else:
-                st.caption(f"{title} ({badge})")
+        st.markdown(_web_sources_markdown(web_sources), unsafe_allow_html=True)
 
 
 def _render_rag_sources(sources: list[dict]):
@@ -188,13 +322,30 @@ def _render_rag_sources(sources: list[dict]):
     if not sources:
         return
     with st.expander("Document Sources"):
-        for src in sources:
-            st.caption(
-                f"**{src.get('filename', 'Unknown')}** "
-                f"(chunk {src.get('chunk_index', '?')}, "
-                f"similarity: {src.get('similarity', '?')})"
-            )
-            st.text(src.get("content_preview", "")[:200])
+        st.markdown(_rag_sources_markdown(sources), unsafe_allow_html=True)
+
+
+def _render_history_message(msg: dict):
+    """Render one past message with as few elements as possible.
+
+    The whole history is re-sent to the browser on every rerun, so each
+    element saved here is saved once per message per interaction.
+    """
+    with st.chat_message(msg["role"]):
+        st.markdown(msg["content"])
+        # Show RAG document sources
+        if msg.get("sources"):
+            _render_rag_sources(msg["sources"])
+        # Show web search sources
+        if msg.get("web_sources"):
+            _render_web_sources(msg["web_sources"])
+        notes = []
+        if msg.get("used_docs"):
+            notes.append("Used document context")
+        if msg.get("web_grounded"):
+            notes.append("Grounded in web search")
+        if notes:
+            st.caption(" · ".join(notes))
 
 
 def render_chat():
@@ -230,20 +381,18 @@ def render_chat():
 
         st.markdown('<hr class="jijnasa-divider">', unsafe_allow_html=True)
 
-    # Display existing messages
-    for msg in st.session_state.messages:
-        with st.chat_message(msg["role"]):
-            st.markdown(msg["content"])
-            # Show RAG document sources
-            if msg.get("sources"):
-                _render_rag_sources(msg["sources"])
-            # Show web search sources
-            if msg.get("web_sources"):
-                _render_web_sources(msg["web_sources"])
-            if msg.get("used_docs"):
-                st.caption("Used document context")
-            if msg.get("web_grounded"):
-                st.caption("Grounded in web search")
+    # Display existing messages.  Streamlit can't keep elements from an
+    # earlier run, so every message shown is re-sent on each rerun; long
+    # conversations show only the latest _HISTORY_WINDOW unless expanded
+    messages = st.session_state.messages
+    hidden = len(messages) - _HISTORY_WINDOW
+    if hidden > 0 and st.session_state.get("history_expanded") != st.session_state.conversation_id:
+        if st.button(f"Show {hidden} earlier messages", key="show_history"):
+            st.session_state.history_expanded = st.session_state.conversation_id
+            st.rerun()
+        messages = messages[hidden:]
+    for msg in messages:
+        _render_history_message(msg)
 
     # Check for voice transcription
     if st.session_state.get("voice_transcription"):
@@ -276,22 +425,33 @@ def _handle_single_model(prompt: str):
     model_provider = _get_model_provider(st.session_state.model_id)
 
     with st.chat_message("assistant"):
-        response_placeholder = st.empty()
+        response = _StreamingMarkdown()
         status_area = st.container()
 
         # Show thinking indicator with web search hint
         if model_provider in WEB_SEARCH_PROVIDERS:
-            response_placeholder.markdown(f"*{model_name} is searching the web...*")
+            response.tail.markdown(f"*{model_name} is searching the web...*")
         else:
-            response_placeholder.markdown(f"*{model_name} is thinking...*")
+            response.tail.markdown(f"*{model_name} is thinking...*")
 
+        # Tokens are collected and joined only when painting: with batched
+        # repaints that is far fewer copies than growing a string per token
+        parts: list[str] = []
         full_response = ""
         sources = []
         web_sources = []
         usage = {}
         conversation_id = st.session_state.conversation_id
+        speech = (
+            _SpeechPrefetch(st.session_state.api_client)
+            if st.session_state.get("tts_enabled") else None
+        )
+        unpainted = 0
+        last_paint = _time.monotonic()
 
         try:
+            append = parts.append
+            monotonic = _time.monotonic
             for event in st.session_state.api_client.stream_chat(
                 message=prompt,
                 model_id=st.session_state.model_id,
@@ -302,13 +462,22 @@ def _handle_single_model(prompt: str):
                 evt_type = event["event"]
                 data = event["data"]
 
-                if evt_type == "conversation":
+                if evt_type == "token":
+                    text = data.get("text", "")
+                    append(text)
+                    unpainted += len(text)
+                    now = monotonic()
+                    if unpainted >= _RENDER_MIN_CHARS or now - last_paint >= _RENDER_INTERVAL:
+                        full_response = "".join(parts)
+                        response.paint(full_response)
+                        if speech:
+                            speech.feed(full_response)
+                        unpainted = 0
+                        last_paint = now
+
+                elif evt_type == "conversation":
                     st.session_state.conversation_id = data.get("conversation_id")
 
-                elif evt_type == "token":
-                    full_response += data.get("text", "")
-                    response_placeholder.markdown(full_response + " |")
-
                 elif evt_type == "sources":
                     sources = data if isinstance(data, list) else []
 
@@ -321,6 +490,9 @@ def _handle_single_model(prompt: str):
                         st.session_state.conversation_id = data["conversation_id"]
 
                 elif evt_type == "error":
+                    full_response = "".join(parts)
+                    if full_response:
+                        response.paint(full_response, cursor=False)
                     st.error(f"Error: {data.get('error', 'Unknown error')}")
                     return
 
@@ -328,10 +500,11 @@ def _handle_single_model(prompt: str):
                     break
 
             # Finalize display -- never show silent emptiness
+            full_response = "".join(parts)
             if full_response:
-                response_placeholder.markdown(full_response)
+                response.paint(full_response, cursor=False)
             else:
-                response_placeholder.markdown(
+                response.tail.markdown(
                     "*No response received from the model. Please try again.*"
                 )
 
@@ -366,10 +539,9 @@ def _handle_single_model(prompt: str):
     st.session_state.messages.append(msg_data)
 
     # Play TTS if enabled
-    if st.session_state.get("tts_enabled") and full_response:
+    if speech and full_response:
         try:
-            audio_bytes = st.session_state.api_client.synthesize_speech(full_response[:4096])
-            st.audio(audio_bytes, format="audio/mp3", autoplay=True)
+            st.audio(speech.finish(full_response), format="audio/mp3", autoplay=True)
         except Exception:
             pass
 
@@ -388,7 +560,10 @@ def _handle_comparison(prompt: str):
     # Create side-by-side columns
     cols = st.columns(num_models)
     placeholders = []
-    results = [{"text": "", "usage": {}, "error": None, "web_sources": []} for _ in compare_models]
+    results = [
+        {"parts": [], "text": "", "usage": {}, "error": None, "web_sources": []}
+        for _ in compare_models
+    ]
 
     for i, model_id in enumerate(compare_models):
         model_name = _get_model_display_name(model_id)
@@ -397,65 +572,64 @@ def _handle_comparison(prompt: str):
             st.markdown(f"**{model_name}**")
             if provider in WEB_SEARCH_PROVIDERS:
                 st.caption("Web search enabled")
-            placeholders.append(st.empty())
-            placeholders[-1].markdown(f"*{model_name} is thinking...*")
-
-    def _stream_model(idx, model_id):
-        """Stream a single model response (runs in a thread)."""
-        try:
-            for event in st.session_state.api_client.stream_chat(
-                message=prompt,
-                model_id=model_id,
-                conversation_id=None,  # Don't save comparison chats
-                use_rag=st.session_state.use_rag,
-                temperature=st.session_state.temperature,
-            ):
-                evt_type = event["event"]
-                data = event["data"]
-                if evt_type == "token":
-                    results[idx]["text"] += data.get("text", "")
-                elif evt_type == "usage":
-                    results[idx]["usage"] = data
-                elif evt_type == "web_sources":
-                    results[idx]["web_sources"] = data if isinstance(data, list) else []
-                elif evt_type == "error":
-                    results[idx]["error"] = data.get("error", "Unknown error")
-                    return
-                elif evt_type == "done":
-                    return
-        except Exception as e:
-            results[idx]["error"] = str(e)
-
-    # Launch threads for each model
-    threads = []
-    for i, model_id in enumerate(compare_models):
-        t = threading.Thread(target=_stream_model, args=(i, model_id))
-        t.start()
-        threads.append(t)
-
-    # Poll results and update display until all threads complete
-    import time
-    all_done = False
-    while not all_done:
-        all_done = all(not t.is_alive() for t in threads)
-        for i in range(num_models):
-            with cols[i]:
-                if results[i]["error"]:
-                    placeholders[i].error(results[i]["error"])
-                elif results[i]["text"]:
-                    placeholders[i].markdown(results[i]["text"] + (" |" if not all_done else ""))
-        if not all_done:
-            time.sleep(0.1)
+            placeholders.append(_StreamingMarkdown())
+            placeholders[-1].tail.markdown(f"*{model_name} is thinking...*")
+
+    # One SSE stream carries every model's events, tagged with its index;
+    # a column is repainted when it has news (text batched as in
+    # _handle_single_model)
+    unpainted = [0] * num_models
+    last_paint = [_time.monotonic()] * num_models
+    monotonic = _time.monotonic
+    try:
+        for event in st.session_state.api_client.stream_compare(
+            message=prompt,
+            model_ids=compare_models,
+            use_rag=st.session_state.use_rag,
+            temperature=st.session_state.temperature,
+        ):
+            evt_type = event["event"]
+            data = event["data"]
+            i = data.get("idx")
+            if i is None:
+                if evt_type == "error":
+                    for r in results:
+                        r["error"] = r["error"] or data.get("error", "Unknown error")
+                continue
+            if evt_type == "token":
+                text = data.get("text", "")
+                result = results[i]
+                result["parts"].append(text)
+                unpainted[i] += len(text)
+                now = monotonic()
+                if unpainted[i] >= _RENDER_MIN_CHARS or now - last_paint[i] >= _RENDER_INTERVAL:
+                    result["text"] = "".join(result["parts"])
+                    with cols[i]:
+                        placeholders[i].paint(result["text"])
+                    unpainted[i] = 0
+                    last_paint[i] = now
+            elif evt_type == "usage":
+                results[i]["usage"] = data
+            elif evt_type == "web_sources":
+                results[i]["web_sources"] = data.get("sources", [])
+            elif evt_type == "error":
+                results[i]["error"] = data.get("error", "Unknown error")
+    except Exception as e:
+        for r in results:
+            r["error"] = r["error"] or str(e)
 
     # Show final results with usage and web sources
     for i in range(num_models):
+        results[i]["text"] = "".join(results[i]["parts"])
         with cols[i]:
             if results[i]["text"]:
-                placeholders[i].markdown(results[i]["text"])
+                placeholders[i].paint(results[i]["text"], cursor=False)
             elif not results[i]["error"]:
-                placeholders[i].markdown(
+                placeholders[i].tail.markdown(
                     "*No response received. Please try again.*"
                 )
+            if results[i]["error"]:
+                st.error(results[i]["error"])
             # Show web sources per model
             if results[i].get("web_sources"):
                 _render_web_sources(results[i]["web_sources"])
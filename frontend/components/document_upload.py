@@ -1,8 +1,14 @@
+from concurrent.futures import Future
+
 import streamlit as st
 
 
-def render_document_upload():
-    """File uploader in the sidebar for RAG documents."""
+def render_document_upload(documents: Future | None = None):
+    """File uploader in the sidebar for RAG documents.
+
+    ``documents`` may be an already-started ``list_documents`` call for the
+    current conversation.
+    """
     st.subheader("Documents")
 
     uploaded_files = st.file_uploader(
@@ -19,12 +25,17 @@ def render_document_upload():
             if upload_key not in st.session_state:
                 with st.spinner(f"Ingesting {uploaded_file.name}..."):
                     try:
+                        # Pass the file object itself: getvalue() would
+                        # copy the whole document before sending it
+                        uploaded_file.seek(0)
                         result = st.session_state.api_client.upload_document(
-                            file_bytes=uploaded_file.getvalue(),
+                            file=uploaded_file,
                             filename=uploaded_file.name,
                             conversation_id=st.session_state.get("conversation_id"),
+                            content_type=uploaded_file.type,
                         )
                         st.session_state[upload_key] = result
+                        documents = None  # Fetched before the upload
                         st.success(
                             f"**{result['filename']}** - "
                             f"{result['chunk_count']} chunks"
@@ -35,7 +46,10 @@ def render_document_upload():
     # Show existing documents
     try:
         conv_id = st.session_state.get("conversation_id")
-        docs = st.session_state.api_client.list_documents(conv_id)
+        docs = (
+            documents.result() if documents
+            else st.session_state.api_client.list_documents(conv_id)
+        )
         if docs:
             st.caption(f"{len(docs)} document(s) indexed")
             for doc in docs[:10]:
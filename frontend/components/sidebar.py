@@ -1,3 +1,6 @@
+import functools
+import time
+from concurrent.futures import Future
 from datetime import datetime, timezone
 
 import streamlit as st
@@ -14,6 +17,8 @@ MODELS = [
     {"id": "sonar-reasoning-pro", "name": "Sonar Reasoning Pro", "provider": "Perplexity", "cost_hint": "~$0.01/msg"},
 ]
 
+MODELS_BY_ID = {m["id"]: m for m in MODELS}
+
 PROVIDER_COLORS = {
     "OpenAI": "#10a37f",
     "Anthropic": "#d4a274",
@@ -27,13 +32,43 @@ def _provider_badge_html(provider: str) -> str:
     return f'<span class="provider-badge {css_class}">{provider}</span>'
 
 
+# Selector data derived from MODELS, built once rather than on every rerun
+_WEB_PROVIDERS = {"Perplexity", "Google"}
+_MODEL_IDS = [m["id"] for m in MODELS]
+_MODEL_INDEX = {model_id: i for i, model_id in enumerate(_MODEL_IDS)}
+_MODEL_LABELS = [
+    f"{m['name']}  {m['cost_hint']}  ({m['provider']})"
+    + (" | Web" if m["provider"] in _WEB_PROVIDERS else "")
+    for m in MODELS
+]
+_COMPARE_OPTIONS = [f"{m['name']} ({m['provider']})" for m in MODELS]
+_MODEL_BADGES = [
+    _provider_badge_html(m["provider"])
+    + (
+        ' <span style="font-size: 0.8em; color: #4CAF50;">Web search enabled</span>'
+        if m["provider"] in _WEB_PROVIDERS else ""
+    )
+    for m in MODELS
+]
+_MODEL_PROVIDERS = {m["id"]: m["provider"] for m in MODELS}
+
+# Metadata line under each conversation button, e.g. "5m ago · OpenAI"
+_META_TMPL = "{} · {}"
+
+
 def _time_ago(iso_str: str) -> str:
     """Convert ISO datetime string to relative time."""
+    # Labels have minute resolution, so results are reused within a minute
+    return _time_ago_cached(iso_str, int(time.time() // 60))
+
+
+@functools.lru_cache(maxsize=1024)
+def _time_ago_cached(iso_str: str, minute: int) -> str:
     try:
         dt = datetime.fromisoformat(iso_str.replace("Z", "+00:00"))
         if dt.tzinfo is None:
             dt = dt.replace(tzinfo=timezone.utc)
-        now = datetime.now(timezone.utc)
+        now = datetime.fromtimestamp(minute * 60, timezone.utc)
         delta = now - dt
         seconds = delta.total_seconds()
         if seconds < 60:
@@ -51,7 +86,9 @@ def _time_ago(iso_str: str) -> str:
         return ""
 
 
-def render_sidebar():
+def render_sidebar(conversations: Future | None = None):
+    """Render the sidebar; ``conversations`` may be an already-started
+    ``list_conversations`` call."""
     st.markdown(
         '<h1 style="background: linear-gradient(90deg, #667eea, #764ba2); '
         '-webkit-background-clip: text; -webkit-text-fill-color: transparent; '
@@ -60,35 +97,77 @@ def render_sidebar():
     )
     st.caption("The desire to know — multi-model AI chat")
 
-    # --- Model selector ---
-    st.markdown("**Model**")
-    _WEB_PROVIDERS = {"Perplexity", "Google"}
-    model_labels = [
-        f"{m['name']}  {m['cost_hint']}  ({m['provider']})"
-        + (" | Web" if m["provider"] in _WEB_PROVIDERS else "")
-        for m in MODELS
-    ]
-    model_ids = [m["id"] for m in MODELS]
+    _render_chat_settings()
+
+    st.divider()
+
+    # --- Conversation management ---
+    st.markdown("**Conversations**")
+    if st.button("New Conversation", use_container_width=True, type="primary"):
+        st.session_state.conversation_id = None
+        st.session_state.messages = []
+        st.session_state.system_prompt = ""
+        st.rerun()
+
+    # List existing conversations
+    try:
+        conversations = (
+            conversations.result() if conversations
+            else st.session_state.api_client.list_conversations()
+        )
+        for conv in conversations[:30]:
+            title = conv.get("title", "Untitled")[:40]
+            is_active = st.session_state.conversation_id == conv["id"]
+            time_str = _time_ago(conv.get("created_at", ""))
+            provider = _MODEL_PROVIDERS.get(conv.get("model_id", ""), "")
+
+            col1, col2 = st.columns([5, 1])
+            with col1:
+                label = f"**{title}**" if is_active else title
+                if st.button(
+                    label,
+                    key=f"conv_{conv['id']}",
+                    use_container_width=True,
+                    disabled=is_active,
+                ):
+                    st.session_state.conversation_id = conv["id"]
+                    st.session_state.messages = _load_messages(conv["id"])
+                    st.session_state.system_prompt = conv.get("system_prompt", "")
+                    st.rerun()
+                # Metadata line below the button
+                if time_str and provider:
+                    st.caption(_META_TMPL.format(time_str, provider))
+                elif time_str or provider:
+                    st.caption(time_str or provider)
+            with col2:
+                if st.button("X", key=f"del_{conv['id']}"):
+                    st.session_state.api_client.delete_conversation(conv["id"])
+                    if st.session_state.conversation_id == conv["id"]:
+                        st.session_state.conversation_id = None
+                        st.session_state.messages = []
+                    st.rerun()
+    except Exception:
+        st.caption("Backend not available. Start the FastAPI server.")
 
-    current_idx = 0
-    if st.session_state.model_id in model_ids:
-        current_idx = model_ids.index(st.session_state.model_id)
 
+# A fragment: changing a setting reruns only this block.  The settings are
+# only read from session_state when a message is sent, so the chat history
+# and conversation list don't need to be redrawn (or re-fetched) for it
+@st.fragment
+def _render_chat_settings():
+    # --- Model selector ---
+    st.markdown("**Model**")
     selected_idx = st.selectbox(
         "Select model",
         range(len(MODELS)),
-        format_func=lambda i: model_labels[i],
-        index=current_idx,
+        format_func=_MODEL_LABELS.__getitem__,
+        index=_MODEL_INDEX.get(st.session_state.model_id, 0),
         label_visibility="collapsed",
     )
-    st.session_state.model_id = model_ids[selected_idx]
+    st.session_state.model_id = _MODEL_IDS[selected_idx]
 
     # Show provider badge for selected model
-    selected_model = MODELS[selected_idx]
-    badge_html = _provider_badge_html(selected_model["provider"])
-    if selected_model["provider"] in _WEB_PROVIDERS:
-        badge_html += ' <span style="font-size: 0.8em; color: #4CAF50;">Web search enabled</span>'
-    st.markdown(badge_html, unsafe_allow_html=True)
+    st.markdown(_MODEL_BADGES[selected_idx], unsafe_allow_html=True)
 
     # --- Temperature ---
     st.session_state.temperature = st.slider(
@@ -107,15 +186,14 @@ def render_sidebar():
     )
 
     if st.session_state.compare_mode:
-        compare_options = [f"{m['name']} ({m['provider']})" for m in MODELS]
         selected_compare = st.multiselect(
             "Models to compare",
             options=range(len(MODELS)),
-            format_func=lambda i: compare_options[i],
+            format_func=_COMPARE_OPTIONS.__getitem__,
             default=[0, 2] if not st.session_state.get("compare_models") else [],
             max_selections=3,
         )
-        st.session_state.compare_models = [model_ids[i] for i in selected_compare]
+        st.session_state.compare_models = [_MODEL_IDS[i] for i in selected_compare]
 
     st.divider()
 
@@ -137,64 +215,6 @@ def render_sidebar():
                 except Exception:
                     pass
 
-    st.divider()
-
-    # --- Conversation management ---
-    st.markdown("**Conversations**")
-    if st.button("New Conversation", use_container_width=True, type="primary"):
-        st.session_state.conversation_id = None
-        st.session_state.messages = []
-        st.session_state.system_prompt = ""
-        st.rerun()
-
-    # List existing conversations
-    try:
-        conversations = st.session_state.api_client.list_conversations()
-        for conv in conversations[:30]:
-            title = conv.get("title", "Untitled")[:40]
-            is_active = st.session_state.conversation_id == conv["id"]
-            created = conv.get("created_at", "")
-            model = conv.get("model_id", "")
-            time_str = _time_ago(created)
-
-            # Find provider for this model
-            provider = ""
-            for m in MODELS:
-                if m["id"] == model:
-                    provider = m["provider"]
-                    break
-
-            col1, col2 = st.columns([5, 1])
-            with col1:
-                label = f"**{title}**" if is_active else title
-                if st.button(
-                    label,
-                    key=f"conv_{conv['id']}",
-                    use_container_width=True,
-                    disabled=is_active,
-                ):
-                    st.session_state.conversation_id = conv["id"]
-                    st.session_state.messages = _load_messages(conv["id"])
-                    st.session_state.system_prompt = conv.get("system_prompt", "")
-                    st.rerun()
-                # Metadata line below the button
-                meta_parts = []
-                if time_str:
-                    meta_parts.append(time_str)
-                if provider:
-                    meta_parts.append(provider)
-                if meta_parts:
-                    st.caption(" · ".join(meta_parts))
-            with col2:
-                if st.button("X", key=f"del_{conv['id']}"):
-                    st.session_state.api_client.delete_conversation(conv["id"])
-                    if st.session_state.conversation_id == conv["id"]:
-                        st.session_state.conversation_id = None
-                        st.session_state.messages = []
-                    st.rerun()
-    except Exception:
-        st.caption("Backend not available. Start the FastAPI server.")
-
 
 def _load_messages(conversation_id: str) -> list[dict]:
     """Load messages from backend and convert to Streamlit format."""
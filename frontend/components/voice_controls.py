@@ -1,3 +1,5 @@
+import hashlib
+
 import streamlit as st
 
 
@@ -16,17 +18,31 @@ def render_voice_controls():
     )
 
     if audio_data is not None:
-        # Only transcribe if we haven't already processed this audio
-        audio_key = f"audio_processed_{hash(audio_data.getvalue()[:100])}"
+        # Only transcribe if we haven't already processed this audio.  Keyed
+        # on a digest of the whole recording: WAV headers are near-identical,
+        # so a prefix would collide
+        audio_bytes = audio_data.getvalue()
+        digest = hashlib.blake2b(audio_bytes, digest_size=8).hexdigest()
+        audio_key = f"audio_processed_{audio_data.size}_{digest}"
         if audio_key not in st.session_state:
             st.session_state[audio_key] = True
             with st.spinner("Transcribing..."):
                 try:
-                    result = st.session_state.api_client.transcribe_audio(
-                        audio_bytes=audio_data.getvalue(),
+                    partial = st.empty()
+                    parts = []
+                    transcribed_text = ""
+                    for event in st.session_state.api_client.transcribe_audio_stream(
+                        audio_bytes=audio_bytes,
                         filename="recording.wav",
-                    )
-                    transcribed_text = result.get("text", "").strip()
+                    ):
+                        if "error" in event:
+                            raise RuntimeError(event["error"])
+                        if event["final"]:
+                            transcribed_text = event.get("text", "").strip()
+                        elif event["text"]:
+                            parts.append(event["text"])
+                            partial.caption(" ".join(parts))
+                    partial.empty()
                     if transcribed_text:
                         st.info(f"Transcribed: {transcribed_text}")
                         st.session_state.voice_transcription = transcribed_text
@@ -1,10 +1,68 @@
 """Launch both backend (FastAPI) and frontend (Streamlit) processes."""
 import os
+import signal
 import subprocess
 import sys
 import time
 from pathlib import Path
 
+import httpx
+
+# How long to wait for the backend before starting the frontend anyway
+_READY_TIMEOUT = 10.0  # seconds
+
+
+def wait_for_backend(url: str, backend: subprocess.Popen) -> bool:
+    """Poll the backend's health endpoint until it answers, with backoff.
+
+    Returns False if it didn't come up within _READY_TIMEOUT or exited.
+    """
+    start = time.monotonic()
+    delay = 0.05
+    while time.monotonic() - start < _READY_TIMEOUT:
+        if backend.poll() is not None:
+            return False
+        try:
+            httpx.get(url, timeout=0.5)
+            print(f"Backend ready after {time.monotonic() - start:.1f}s")
+            return True
+        except httpx.TransportError:
+            time.sleep(delay)
+            delay = min(delay * 2, 1.0)
+    return False
+
+
+def wait_any(procs: list[subprocess.Popen]) -> subprocess.Popen:
+    """Block until one of the processes exits and return it."""
+    for proc in procs:
+        if proc.poll() is not None:
+            return proc
+    if hasattr(os, "wait"):
+        # POSIX: sleep in the kernel until a child exits
+        pid, status = os.wait()
+        for proc in procs:
+            if proc.pid == pid:
+                proc.returncode = os.waitstatus_to_exitcode(status)
+                return proc
+    while True:
+        for proc in procs:
+            if proc.poll() is not None:
+                return proc
+        time.sleep(0.5)
+
+
+def _shutdown(procs: list[subprocess.Popen]):
+    """Terminate all still-running processes, killing any that hang."""
+    for proc in procs:
+        if proc.returncode is None:
+            proc.terminate()
+    for proc in procs:
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+
 
 def main():
     root = Path(__file__).parent
@@ -46,26 +104,41 @@ def main():
         backend_cmd.append("--reload")
 
     print(f"Starting backend (FastAPI) on http://{host}:{backend_port} ...")
-    backend = subprocess.Popen(backend_cmd, cwd=str(root))
+    # Children get their own sessions so Ctrl-C reaches only this process,
+    # which then shuts both down in order
+    backend = subprocess.Popen(backend_cmd, cwd=str(root), start_new_session=True)
+    procs = [backend]
 
-    time.sleep(2)
-
-    print(f"Starting frontend (Streamlit) on http://{host}:{frontend_port} ...")
-    frontend = subprocess.Popen(
-        [sys.executable, "-m", "streamlit", "run", str(root / "frontend" / "app.py"),
-         "--server.port", frontend_port, "--server.address", host],
-        cwd=str(root),
-    )
+    # Docker stops containers with SIGTERM; shut down as for Ctrl-C
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
 
+    exit_code = 0
     try:
-        backend.wait()
-        frontend.wait()
-    except KeyboardInterrupt:
+        probe_host = "127.0.0.1" if host == "0.0.0.0" else host
+        if not wait_for_backend(f"http://{probe_host}:{backend_port}/health", backend):
+            print("Backend not ready yet; starting the frontend anyway")
+
+        print(f"Starting frontend (Streamlit) on http://{host}:{frontend_port} ...")
+        frontend = subprocess.Popen(
+            [sys.executable, "-m", "streamlit", "run", str(root / "frontend" / "app.py"),
+             "--server.port", frontend_port, "--server.address", host],
+            cwd=str(root),
+            start_new_session=True,
+        )
+        procs.append(frontend)
+
+        # If either process dies, take the other down too and exit non-zero,
+        # so the container (or terminal) sees the failure instead of a
+        # half-running app and a restart policy can kick in
+        exited = wait_any(procs)
+        name = "Backend" if exited is backend else "Frontend"
+        print(f"{name} exited with code {exited.returncode}")
+        exit_code = exited.returncode or 1
+    except (KeyboardInterrupt, SystemExit):
         print("\nShutting down...")
-        backend.terminate()
-        frontend.terminate()
-        backend.wait()
-        frontend.wait()
+    finally:
+        _shutdown(procs)
+    sys.exit(exit_code)
 
 
 if __name__ == "__main__":
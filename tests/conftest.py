@@ -1,36 +1,85 @@
-import tempfile
-from pathlib import Path
+import asyncio
 
 import pytest
 import pytest_asyncio
 
-from backend.database import set_db_path, init_db
+from backend.config import Settings
+from backend.database import set_db_path, init_db, close_db, get_writer
+from backend.services.cost_tracker import cost_totals, daily_spend
+
+# Empties the shared test database; row_counts is reset by hand because the
+# delete triggers only decrement it
+_RESET_SQL = """
+DELETE FROM messages;
+DELETE FROM documents;
+DELETE FROM cost_log;
+DELETE FROM analytics_events;
+DELETE FROM conversations;
+UPDATE row_counts SET n = 0;
+"""
+
+
+async def reset_db():
+    """Empty the current database and drop the in-memory cost totals."""
+    async with get_writer() as db:
+        await db.executescript(_RESET_SQL)
+    # Both are keyed by database path, which is now shared between tests
+    cost_totals.invalidate()
+    daily_spend.invalidate()
 
 
 @pytest.fixture
-def temp_db_path():
-    with tempfile.NamedTemporaryFile(suffix=".db", delete=False) as f:
-        path = f.name
-    yield path
-    Path(path).unlink(missing_ok=True)
+def temp_db_path(tmp_path):
+    return str(tmp_path / "test.db")
+
+
+@pytest.fixture(scope="session")
+def _session_db_path(tmp_path_factory):
+    """A database file whose schema is created once for the whole run."""
+    path = str(tmp_path_factory.mktemp("db") / "test.db")
+
+    async def create():
+        set_db_path(path)
+        await init_db()
+        await close_db()
+
+    asyncio.run(create())
+    return path
 
 
 @pytest.fixture
 def test_settings(temp_db_path, tmp_path):
-    from backend.config import Settings
+    """Fresh settings per test; tests may change fields."""
+    return _make_settings(temp_db_path, tmp_path)
+
+
+@pytest.fixture(scope="session")
+def shared_settings(tmp_path_factory):
+    """Settings built once for fixtures that only read them.  Don't mutate."""
+    tmp_path = tmp_path_factory.mktemp("settings")
+    return _make_settings(str(tmp_path / "test.db"), tmp_path)
+
+
+def _make_settings(database_url, tmp_path):
     return Settings(
         openai_api_key="sk-test-fake",
         anthropic_api_key="sk-ant-test-fake",
         google_api_key="fake-google-key",
         perplexity_api_key="pplx-test-fake",
-        database_url=temp_db_path,
+        database_url=database_url,
         chroma_persist_dir=str(tmp_path / "chroma"),
-
+        cache_dir=str(tmp_path / "cache"),
     )
 
 
 @pytest_asyncio.fixture
-async def initialized_db(temp_db_path):
-    set_db_path(temp_db_path)
+async def initialized_db(_session_db_path):
+    """An empty database with an open pool.
+
+    The schema is already current, so init_db only opens connections.
+    """
+    set_db_path(_session_db_path)
     await init_db()
-    yield temp_db_path
+    await reset_db()
+    yield _session_db_path
+    await close_db()
@@ -1,12 +1,19 @@
+import asyncio
+import json
 import os
 
+import httpx
 import pytest
 import pytest_asyncio
 from fastapi import FastAPI
-from fastapi.testclient import TestClient
 
-from backend.database import set_db_path, init_db
-from backend.routers import health, conversations, documents, costs
+from backend.config import get_settings
+from backend.dependencies import get_llm_router, get_rag_engine
+from backend.routers import (
+    health, conversations, documents, costs, analytics, chat, suggestions,
+)
+from backend.services.conversation_service import ConversationService
+from backend.services.providers.base import StreamChunk
 
 
 def _create_test_app() -> FastAPI:
@@ -16,45 +23,86 @@ def _create_test_app() -> FastAPI:
     app.include_router(conversations.router)
     app.include_router(documents.router)
     app.include_router(costs.router)
+    app.include_router(analytics.router)
+    app.include_router(chat.router)
+    app.include_router(suggestions.router)
     return app
 
 
+class _StubLLMRouter:
+    """Stands in for LLMRouter: echoes a canned reply and records prompts."""
+
+    def __init__(self, reply=("Hello", " there")):
+        self._settings = get_settings()
+        self.reply = reply
+        self.calls: list[list[dict]] = []
+        self.chunks_sent = 0
+
+    async def stream_chat(self, messages, model_id, temperature=0.7, max_tokens=4096):
+        self.calls.append(messages)
+        for text in self.reply:
+            self.chunks_sent += 1
+            yield StreamChunk(text=text)
+        yield StreamChunk(is_final=True, input_tokens=10, output_tokens=2)
+
+
+def _sse_events(response) -> list[tuple[str, dict]]:
+    events, event = [], None
+    for line in response.text.splitlines():
+        if line.startswith("event:"):
+            event = line.split(":", 1)[1].strip()
+        elif line.startswith("data:"):
+            events.append((event, json.loads(line.split(":", 1)[1])))
+    return events
+
+
+@pytest.fixture(scope="module")
+def app():
+    return _create_test_app()
+
+
 @pytest_asyncio.fixture
-async def client(tmp_path):
-    """Each test gets a fresh database."""
-    db_path = str(tmp_path / "test.db")
-    set_db_path(db_path)
-    await init_db()
-
-    # Create data/uploads for document upload tests
-    uploads_dir = tmp_path / "uploads"
-    uploads_dir.mkdir(exist_ok=True)
-
-    app = _create_test_app()
-    with TestClient(app) as c:
+async def client(app, initialized_db):
+    """An in-process client over an emptied database and in-memory caches.
+
+    Requests run on the test's own event loop, with no thread hop.
+    """
+    # Analytics summaries and suggestions are cached in memory across requests
+    analytics._summary_cache.clear()
+    suggestions._suggestions_cache.clear()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
         yield c
 
 
 class TestHealthEndpoint:
-    def test_health_returns_200(self, client):
-        response = client.get("/health")
+    async def test_health_returns_200(self, client):
+        response = await client.get("/health")
         assert response.status_code == 200
 
-    def test_health_response_structure(self, client):
-        data = client.get("/health").json()
+    async def test_health_response_structure(self, client):
+        data = (await client.get("/health")).json()
         assert data["status"] == "healthy"
         assert "document_count" in data
         assert "conversation_count" in data
 
+    async def test_health_counts_follow_inserts_and_deletes(self, client):
+        conv_id = (await client.post("/conversations", json={"model_id": "gpt-4o"})).json()["id"]
+        await client.post("/conversations", json={"model_id": "gpt-4o"})
+        assert (await client.get("/health")).json()["conversation_count"] == 2
+
+        await client.delete(f"/conversations/{conv_id}")
+        assert (await client.get("/health")).json()["conversation_count"] == 1
+
 
 class TestConversationsEndpoint:
-    def test_list_conversations_empty(self, client):
-        response = client.get("/conversations")
+    async def test_list_conversations_empty(self, client):
+        response = await client.get("/conversations")
         assert response.status_code == 200
         assert response.json()["conversations"] == []
 
-    def test_create_conversation(self, client):
-        response = client.post(
+    async def test_create_conversation(self, client):
+        response = await client.post(
             "/conversations",
             json={"model_id": "gpt-4o", "title": "Test"},
         )
@@ -64,47 +112,287 @@ class TestConversationsEndpoint:
         assert data["title"] == "Test"
         assert data["model_id"] == "gpt-4o"
 
-    def test_create_and_list(self, client):
-        client.post("/conversations", json={"model_id": "gpt-4o"})
-        client.post("/conversations", json={"model_id": "gpt-4o-mini"})
-        response = client.get("/conversations")
+    async def test_create_and_list(self, client):
+        await client.post("/conversations", json={"model_id": "gpt-4o"})
+        await client.post("/conversations", json={"model_id": "gpt-4o-mini"})
+        response = await client.get("/conversations")
         assert len(response.json()["conversations"]) == 2
 
-    def test_delete_conversation(self, client):
-        create_resp = client.post(
+    async def test_delete_conversation(self, client):
+        create_resp = await client.post(
             "/conversations", json={"model_id": "gpt-4o"}
         )
         conv_id = create_resp.json()["id"]
-        delete_resp = client.delete(f"/conversations/{conv_id}")
+        delete_resp = await client.delete(f"/conversations/{conv_id}")
         assert delete_resp.status_code == 200
 
-        list_resp = client.get("/conversations")
+        list_resp = await client.get("/conversations")
         assert len(list_resp.json()["conversations"]) == 0
 
-    def test_get_nonexistent_conversation(self, client):
-        response = client.get("/conversations/nonexistent-id")
+    async def test_get_nonexistent_conversation(self, client):
+        response = await client.get("/conversations/nonexistent-id")
         assert response.status_code == 404
 
 
 class TestDocumentsEndpoint:
-    def test_upload_rejects_unsupported_type(self, client):
-        response = client.post(
+    async def test_upload_rejects_unsupported_type(self, client):
+        response = await client.post(
             "/documents/upload",
             files={"file": ("test.xyz", b"content", "application/octet-stream")},
         )
         assert response.status_code == 400
         assert "Unsupported" in response.json()["detail"]
 
-    def test_list_documents_empty(self, client):
-        response = client.get("/documents")
+    async def test_upload_streams_file_to_disk(self, app, client, tmp_path, monkeypatch):
+        monkeypatch.setattr(documents, "UPLOAD_DIR", tmp_path / "uploads")
+        monkeypatch.setattr(documents, "UPLOAD_CHUNK_SIZE", 4)
+        received = {}
+
+        class _StubRAGEngine:
+            async def ingest_document(self, path, filename, file_size, conversation_id):
+                received["content"] = path.read_bytes()
+                received["size"] = file_size
+                return {"id": "d1", "filename": filename, "chunk_count": 1}
+
+        app.dependency_overrides[get_rag_engine] = lambda: _StubRAGEngine()
+        try:
+            response = await client.post(
+                "/documents/upload",
+                files={"file": ("notes.txt", b"line one\nline two\n", "text/plain")},
+            )
+        finally:
+            app.dependency_overrides.clear()
+
+        assert response.status_code == 200
+        assert received == {"content": b"line one\nline two\n", "size": 18}
+        # The temp copy is removed after ingestion
+        assert list((tmp_path / "uploads").iterdir()) == []
+
+    async def test_list_documents_empty(self, client):
+        response = await client.get("/documents")
         assert response.status_code == 200
         assert response.json()["documents"] == []
 
 
 class TestCostsEndpoint:
-    def test_cost_summary_empty(self, client):
-        response = client.get("/costs/summary")
+    async def test_cost_summary_empty(self, client):
+        response = await client.get("/costs/summary")
         assert response.status_code == 200
         data = response.json()
         assert data["total_cost_usd"] == 0.0
         assert data["total_input_tokens"] == 0
+
+
+class TestAnalyticsEndpoint:
+    async def test_summary_empty(self, client):
+        response = await client.get("/analytics/summary")
+        assert response.status_code == 200
+        data = response.json()
+        assert data["period_days"] == 30
+        assert data["totals"]["conversations"] == 0
+        assert data["totals"]["cost_usd"] == 0
+        assert data["daily_spend"] == []
+
+    async def test_summary_counts_recent_activity(self, client):
+        await client.post("/conversations", json={"model_id": "gpt-4o"})
+        await client.post("/conversations", json={"model_id": "gpt-4o-mini"})
+        await client.post("/analytics/event", json={"event_type": "comparison_mode"})
+
+        data = (await client.get("/analytics/summary", params={"days": 7})).json()
+        assert data["totals"]["conversations"] == 2
+        assert sum(d["count"] for d in data["conversations_per_day"]) == 2
+        assert data["feature_events"] == [
+            {"event_type": "comparison_mode", "count": 1}
+        ]
+
+    async def test_summary_fields_selects_breakdowns(self, client):
+        data = (await client.get("/analytics/summary", params={"fields": "totals"})).json()
+        assert "totals" in data
+        assert "daily_spend" not in data
+
+        data = (await client.get(
+            "/analytics/summary", params=[("fields", "daily_spend"), ("fields", "operations")]
+        )).json()
+        assert data["daily_spend"] == []
+        assert data["operations"] == []
+        assert "model_costs" not in data
+
+    async def test_summary_cached_until_event_logged(self, client):
+        assert (await client.get("/analytics/summary")).json()["totals"]["conversations"] == 0
+
+        await client.post("/conversations", json={"model_id": "gpt-4o"})
+        assert (await client.get("/analytics/summary")).json()["totals"]["conversations"] == 0
+
+        await client.post("/analytics/event", json={"event_type": "rag_query"})
+        assert (await client.get("/analytics/summary")).json()["totals"]["conversations"] == 1
+
+
+class TestChatEndpoint:
+    @pytest.fixture
+    def llm(self, app, client):
+        stub = _StubLLMRouter()
+        app.dependency_overrides[get_llm_router] = lambda: stub
+        app.dependency_overrides[get_rag_engine] = lambda: None
+        yield stub
+        app.dependency_overrides.clear()
+
+    async def test_stream_creates_conversation_and_saves_reply(self, client, llm):
+        response = await client.post("/chat/completions", json={"message": "Hi"})
+        assert response.status_code == 200
+        events = _sse_events(response)
+        names = [e for e, _ in events]
+        assert names[0] == "conversation"
+        assert "".join(d["text"] for e, d in events if e == "token") == "Hello there"
+        assert names[-1] == "done"
+
+        conv_id = events[0][1]["conversation_id"]
+        messages = (await client.get(f"/conversations/{conv_id}/messages")).json()
+        assert [m["role"] for m in messages] == ["user", "assistant"]
+        assert messages[1]["content"] == "Hello there"
+
+    async def test_unknown_conversation_is_an_error(self, client, llm):
+        response = await client.post(
+            "/chat/completions",
+            json={"message": "Hi", "conversation_id": "no-such-conversation"},
+        )
+        assert _sse_events(response) == [("error", {"error": "Conversation not found"})]
+        assert llm.calls == []
+
+    async def test_follow_up_sends_history(self, client, llm):
+        first = _sse_events(await client.post("/chat/completions", json={"message": "Hi"}))
+        conv_id = first[0][1]["conversation_id"]
+
+        await client.post(
+            "/chat/completions",
+            json={"message": "And again", "conversation_id": conv_id},
+        )
+        prompt = llm.calls[-1]
+        assert [m["role"] for m in prompt] == ["system", "user", "assistant", "user"]
+        assert prompt[-1]["content"] == "And again"
+
+    async def test_rag_context_goes_in_user_turn(self, app, client, llm):
+        class _StubRAGEngine:
+            async def retrieve_context(self, query, conversation_id):
+                return f"context for {query}", [{"filename": "a.txt"}]
+
+        app.dependency_overrides[get_rag_engine] = lambda: _StubRAGEngine()
+        first = _sse_events(
+            await client.post("/chat/completions", json={"message": "Hi", "use_rag": True})
+        )
+        conv_id = first[0][1]["conversation_id"]
+        await client.post(
+            "/chat/completions",
+            json={"message": "More", "conversation_id": conv_id, "use_rag": True},
+        )
+
+        first_prompt, second_prompt = llm.calls[0], llm.calls[-1]
+        # System prompt and history are an unchanged prefix of the next turn
+        assert second_prompt[:2] == [first_prompt[0], {"role": "user", "content": "Hi"}]
+        assert "context for More" in second_prompt[-1]["content"]
+        assert second_prompt[-1]["content"].endswith("More")
+
+
+class TestCompareEndpoint:
+    @pytest.fixture
+    def llm(self, app, client):
+        stub = _StubLLMRouter()
+        app.dependency_overrides[get_llm_router] = lambda: stub
+        app.dependency_overrides[get_rag_engine] = lambda: None
+        yield stub
+        app.dependency_overrides.clear()
+
+    async def test_models_multiplexed_on_one_stream(self, client, llm):
+        response = await client.post(
+            "/chat/compare",
+            json={"message": "Hi", "model_ids": ["gpt-4o", "gpt-4o-mini"]},
+        )
+        assert response.status_code == 200
+        events = _sse_events(response)
+
+        for idx in (0, 1):
+            mine = [(e, d) for e, d in events if d.get("idx") == idx]
+            assert "".join(d["text"] for e, d in mine if e == "token") == "Hello there"
+            assert [e for e, _ in mine][-2:] == ["usage", "done"]
+        assert events[-1] == ("done", {"status": "complete"})
+        assert len(llm.calls) == 2
+
+    async def test_comparison_not_saved_as_conversation(self, client, llm):
+        await client.post(
+            "/chat/compare",
+            json={"message": "Hi", "model_ids": ["gpt-4o", "gpt-4o-mini"]},
+        )
+        assert (await client.get("/conversations")).json()["conversations"] == []
+
+    async def test_needs_at_least_two_models(self, client, llm):
+        response = await client.post(
+            "/chat/compare", json={"message": "Hi", "model_ids": ["gpt-4o"]}
+        )
+        assert response.status_code == 422
+
+
+class TestSuggestionsEndpoint:
+    @pytest.fixture
+    def llm(self, app, client):
+        items = ", ".join(f'"Question {i}"' for i in range(6))
+        stub = _StubLLMRouter(reply=("```json\n[", items, "]", "\n```", " trailing"))
+        app.dependency_overrides[get_llm_router] = lambda: stub
+        yield stub
+        app.dependency_overrides.clear()
+
+    async def test_fallback_without_history(self, client, llm):
+        data = (await client.get("/suggestions")).json()
+        assert data["source"] == "fallback"
+        assert llm.calls == []
+
+    async def test_stops_streaming_once_array_parses(self, client, llm):
+        await client.post("/conversations", json={"model_id": "gpt-4o", "title": "Python"})
+        await client.post("/conversations", json={"model_id": "gpt-4o", "title": "Rust"})
+
+        data = (await client.get("/suggestions")).json()
+        assert data == {
+            "suggestions": [f"Question {i}" for i in range(6)],
+            "source": "llm",
+        }
+        # The closing fence and the rest of the reply were never pulled
+        assert llm.chunks_sent == 3
+
+    async def test_repeat_requests_served_from_cache(self, client, llm):
+        await client.post("/conversations", json={"model_id": "gpt-4o", "title": "Python"})
+        await client.post("/conversations", json={"model_id": "gpt-4o", "title": "Rust"})
+
+        first = (await client.get("/suggestions")).json()
+        assert (await client.get("/suggestions")).json() == first
+        assert len(llm.calls) == 1
+
+        # A new recent topic changes the key
+        await client.post("/conversations", json={"model_id": "gpt-4o", "title": "Go"})
+        await client.get("/suggestions")
+        assert len(llm.calls) == 2
+
+    async def test_concurrent_misses_share_one_call(self, client, llm):
+        await client.post("/conversations", json={"model_id": "gpt-4o", "title": "Python"})
+        await client.post("/conversations", json={"model_id": "gpt-4o", "title": "Rust"})
+        conv_service = ConversationService()
+
+        results = await asyncio.gather(*(
+            suggestions.get_suggestions(conv_service=conv_service, llm_router=llm)
+            for _ in range(3)
+        ))
+        assert len(llm.calls) == 1
+        assert all(r == results[0] for r in results)
+        assert results[0]["source"] == "llm"
+
+    async def test_stream_sends_fallback_then_personalised(self, client, llm):
+        await client.post("/conversations", json={"model_id": "gpt-4o", "title": "Python"})
+        await client.post("/conversations", json={"model_id": "gpt-4o", "title": "Rust"})
+
+        events = [
+            (e, d) for e, d in _sse_events(await client.get("/suggestions/stream"))
+            if e == "suggestions"
+        ]
+        assert [d["source"] for _, d in events] == ["fallback", "llm"]
+        assert events[-1][1]["suggestions"] == [f"Question {i}" for i in range(6)]
+
+        # Now cached: a single event with the personalised list
+        events = _sse_events(await client.get("/suggestions/stream"))
+        assert [(e, d["source"]) for e, d in events] == [("suggestions", "llm")]
@@ -0,0 +1,23 @@
+import pytest
+
+from backend.config import _YamlSections
+
+
+class TestYamlSections:
+    def test_sections_frozen_all_the_way_down(self):
+        sections = _YamlSections.from_yaml({
+            "models": {"available": [{"id": "m", "provider": "p", "tags": ["a"]}]},
+            "pricing": {"p": {"m": {"input": 1.0}}},
+            "rag": {"chunk_size": 10},
+        })
+
+        with pytest.raises(TypeError):
+            sections.pricing_by_model["m"]["input"] = 0.0
+        with pytest.raises(TypeError):
+            sections.pricing_config["p"]["m"] = {}
+        with pytest.raises(TypeError):
+            sections.models_by_id["m"]["provider"] = "x"
+        with pytest.raises(TypeError):
+            sections.rag_config["chunk_size"] = 1
+        assert sections.models_config[0]["tags"] == ("a",)
+        assert sections.pricing_by_model["m"]["input"] == 1.0
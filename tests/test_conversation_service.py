@@ -1,9 +1,23 @@
+import sqlite3
+
 import pytest
+import pytest_asyncio
+from backend.database import (
+    set_db_path, init_db, close_db, get_db, execute_write,
+    start_writer, stop_writer, flush_writes,
+)
 from backend.services.conversation_service import ConversationService
 
 
+@pytest_asyncio.fixture
+async def convo(initialized_db):
+    """A service and the id of one freshly created conversation."""
+    service = ConversationService()
+    conv = await service.create_conversation("gpt-4o", "Original")
+    return service, conv["id"]
+
+
 class TestConversationService:
-    @pytest.mark.asyncio
     async def test_create_and_list(self, initialized_db):
         service = ConversationService()
         result = await service.create_conversation("gpt-4o", "Test Chat")
@@ -14,7 +28,6 @@ class TestConversationService:
         assert len(convos) == 1
         assert convos[0]["title"] == "Test Chat"
 
-    @pytest.mark.asyncio
     async def test_add_and_get_messages(self, initialized_db):
         service = ConversationService()
         conv = await service.create_conversation("gpt-4o")
@@ -33,45 +46,83 @@ class TestConversationService:
         assert messages[1]["role"] == "assistant"
         assert messages[1]["model_id"] == "gpt-4o"
 
-    @pytest.mark.asyncio
-    async def test_message_count(self, initialized_db):
+    async def test_get_recent_messages_limit(self, initialized_db):
         service = ConversationService()
         conv = await service.create_conversation("gpt-4o")
         conv_id = conv["id"]
 
+        for i in range(5):
+            await service.add_message(conv_id, "user", f"Message {i}")
+
+        recent = await service.get_conversation_messages(conv_id, limit=3)
+        assert [m["content"] for m in recent] == ["Message 2", "Message 3", "Message 4"]
+
+    async def test_background_add_message(self, initialized_db):
+        service = ConversationService()
+        conv = await service.create_conversation("gpt-4o")
+        start_writer()
+        try:
+            ids = [
+                await service.add_message(
+                    conv["id"], "user", f"Queued {i}", cost_usd=0.01, background=True
+                )
+                for i in range(3)
+            ]
+            await flush_writes()
+        finally:
+            await stop_writer()
+
+        messages = await service.get_conversation_messages(conv["id"])
+        assert [m["id"] for m in messages] == ids
+        updated = await service.get_conversation(conv["id"])
+        assert updated["total_cost_usd"] == pytest.approx(0.03, abs=0.001)
+
+    async def test_reads_see_queued_messages(self, convo):
+        service, conv_id = convo
+        start_writer()
+        try:
+            msg_id = await service.add_message(
+                conv_id, "assistant", "Just streamed", cost_usd=0.01, background=True
+            )
+            # No explicit flush: the reads must wait for the queue themselves
+            messages = await service.get_conversation_messages(conv_id)
+            recent = await service.get_conversation_messages(conv_id, limit=1)
+            listed = await service.list_conversations()
+        finally:
+            await stop_writer()
+
+        assert [m["id"] for m in messages] == [msg_id]
+        assert [m["id"] for m in recent] == [msg_id]
+        assert listed[0]["message_count"] == 1
+
+    async def test_message_count(self, convo):
+        service, conv_id = convo
         assert await service.get_message_count(conv_id) == 0
         await service.add_message(conv_id, "user", "Hello")
         assert await service.get_message_count(conv_id) == 1
 
-    @pytest.mark.asyncio
-    async def test_update_title(self, initialized_db):
-        service = ConversationService()
-        conv = await service.create_conversation("gpt-4o", "Original")
-        await service.update_conversation_title(conv["id"], "Updated Title")
+    async def test_update_title(self, convo):
+        service, conv_id = convo
+        await service.update_conversation_title(conv_id, "Updated Title")
 
-        updated = await service.get_conversation(conv["id"])
+        updated = await service.get_conversation(conv_id)
         assert updated["title"] == "Updated Title"
 
-    @pytest.mark.asyncio
-    async def test_update_system_prompt(self, initialized_db):
-        service = ConversationService()
-        conv = await service.create_conversation("gpt-4o")
-        await service.update_system_prompt(conv["id"], "Be concise.")
+    async def test_update_system_prompt(self, convo):
+        service, conv_id = convo
+        await service.update_system_prompt(conv_id, "Be concise.")
 
-        updated = await service.get_conversation(conv["id"])
+        updated = await service.get_conversation(conv_id)
         assert updated["system_prompt"] == "Be concise."
 
-    @pytest.mark.asyncio
-    async def test_delete_conversation(self, initialized_db):
-        service = ConversationService()
-        conv = await service.create_conversation("gpt-4o")
-        await service.add_message(conv["id"], "user", "Hello")
+    async def test_delete_conversation(self, convo):
+        service, conv_id = convo
+        await service.add_message(conv_id, "user", "Hello")
 
-        await service.delete_conversation(conv["id"])
+        await service.delete_conversation(conv_id)
         convos = await service.list_conversations()
         assert len(convos) == 0
 
-    @pytest.mark.asyncio
     async def test_cost_accumulation(self, initialized_db):
         service = ConversationService()
         conv = await service.create_conversation("gpt-4o")
@@ -89,4 +140,99 @@ class TestConversationService:
         updated = await service.get_conversation(conv_id)
         assert updated["total_input_tokens"] == 300
         assert updated["total_output_tokens"] == 150
-        assert abs(updated["total_cost_usd"] - 0.03) < 0.001
+        assert updated["total_cost_usd"] == pytest.approx(0.03, abs=0.001)
+
+    async def test_list_counts_messages_and_limits(self, initialized_db):
+        service = ConversationService()
+        older = await service.create_conversation("gpt-4o", "Older")
+        newer = await service.create_conversation("gpt-4o", "Newer")
+        await service.add_message(older["id"], "user", "Hi")
+        await service.add_message(older["id"], "assistant", "Hello")
+
+        convos = await service.list_conversations()
+        counts = {c["id"]: c["message_count"] for c in convos}
+        assert counts == {older["id"]: 2, newer["id"]: 0}
+
+        assert len(await service.list_conversations(limit=1)) == 1
+
+    async def test_migration_backfills_message_count(self, temp_db_path):
+        # A database created before conversations.message_count existed
+        with sqlite3.connect(temp_db_path) as conn:
+            conn.executescript(
+                """CREATE TABLE conversations (
+                       id TEXT PRIMARY KEY,
+                       title TEXT NOT NULL DEFAULT 'New Conversation',
+                       model_id TEXT NOT NULL,
+                       system_prompt TEXT NOT NULL DEFAULT '',
+                       created_at TEXT NOT NULL DEFAULT (datetime('now')),
+                       updated_at TEXT NOT NULL DEFAULT (datetime('now')),
+                       total_input_tokens INTEGER NOT NULL DEFAULT 0,
+                       total_output_tokens INTEGER NOT NULL DEFAULT 0,
+                       total_cost_usd REAL NOT NULL DEFAULT 0.0
+                   );
+                   CREATE TABLE messages (
+                       id TEXT PRIMARY KEY,
+                       conversation_id TEXT NOT NULL,
+                       role TEXT NOT NULL,
+                       content TEXT NOT NULL,
+                       model_id TEXT,
+                       input_tokens INTEGER DEFAULT 0,
+                       output_tokens INTEGER DEFAULT 0,
+                       cost_usd REAL DEFAULT 0.0,
+                       used_docs INTEGER DEFAULT 0,
+                       created_at TEXT NOT NULL DEFAULT (datetime('now'))
+                   );
+                   INSERT INTO conversations (id, model_id) VALUES ('c1', 'gpt-4o');
+                   INSERT INTO messages (id, conversation_id, role, content)
+                   VALUES ('m1', 'c1', 'user', 'Hi'), ('m2', 'c1', 'assistant', 'Hello');
+                   PRAGMA user_version = 1;"""
+            )
+
+        set_db_path(temp_db_path)
+        await init_db()
+        try:
+            service = ConversationService()
+            convos = await service.list_conversations()
+            assert convos[0]["message_count"] == 2
+        finally:
+            await close_db()
+
+    async def test_delete_removes_messages_and_costs(self, initialized_db):
+        service = ConversationService()
+        conv = await service.create_conversation("gpt-4o")
+        await service.add_message(conv["id"], "user", "Hello")
+        await execute_write((
+            "INSERT INTO cost_log (conversation_id, model_id, operation, cost_usd) "
+            "VALUES (?, 'gpt-4o', 'chat', 0.01)",
+            (conv["id"],),
+        ))
+
+        await service.delete_conversation(conv["id"])
+
+        assert await service.get_conversation_messages(conv["id"]) == []
+        async with get_db() as db:
+            cursor = await db.execute("SELECT COUNT(*) FROM cost_log")
+            assert (await cursor.fetchone())[0] == 0
+
+    async def test_delete_applies_queued_writes_first(self, convo, caplog):
+        service, conv_id = convo
+        start_writer()
+        try:
+            await service.add_message(conv_id, "user", "Hello", background=True)
+            await execute_write((
+                "INSERT INTO cost_log (conversation_id, model_id, operation, cost_usd) "
+                "VALUES (?, 'gpt-4o', 'chat', 0.01)",
+                (conv_id,),
+            ), background=True)
+
+            await service.delete_conversation(conv_id)
+        finally:
+            await stop_writer()
+
+        # Applied after the delete, the queued inserts would fail their
+        # foreign keys in the writer
+        assert "Background write failed" not in caplog.text
+        async with get_db() as db:
+            for table in ("messages", "cost_log"):
+                cursor = await db.execute(f"SELECT COUNT(*) FROM {table}")
+                assert (await cursor.fetchone())[0] == 0
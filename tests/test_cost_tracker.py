@@ -1,55 +1,51 @@
+import asyncio
+
 import pytest
-from backend.services.cost_tracker import CostTracker
+from backend.database import start_writer, stop_writer, flush_writes
+from backend.services.cost_tracker import CostTracker, cost_totals, daily_spend
 from backend.services.conversation_service import ConversationService
 
 
-@pytest.fixture
-def cost_tracker(test_settings):
-    return CostTracker(test_settings)
+@pytest.fixture(scope="module")
+def cost_tracker(shared_settings):
+    return CostTracker(shared_settings)
 
 
 class TestCostCalculations:
-    def test_chat_cost_gpt4o(self, cost_tracker):
-        cost = cost_tracker.calculate_chat_cost("gpt-4o", 1000, 500)
-        # 1000/1M * 2.50 + 500/1M * 10.00 = 0.0025 + 0.005 = 0.0075
-        assert abs(cost - 0.0075) < 0.0001
-
-    def test_chat_cost_gpt4o_mini(self, cost_tracker):
-        cost = cost_tracker.calculate_chat_cost("gpt-4o-mini", 10000, 5000)
-        # 10000/1M * 0.15 + 5000/1M * 0.60 = 0.0015 + 0.003 = 0.0045
-        assert abs(cost - 0.0045) < 0.0001
-
-    def test_chat_cost_claude_sonnet(self, cost_tracker):
-        cost = cost_tracker.calculate_chat_cost("claude-sonnet-4-5-20250929", 1000, 500)
-        # 1000/1M * 3.00 + 500/1M * 15.00 = 0.003 + 0.0075 = 0.0105
-        assert abs(cost - 0.0105) < 0.0001
-
-    def test_chat_cost_gemini_flash(self, cost_tracker):
-        cost = cost_tracker.calculate_chat_cost("gemini-2.0-flash", 10000, 5000)
-        # 10000/1M * 0.10 + 5000/1M * 0.40 = 0.001 + 0.002 = 0.003
-        assert abs(cost - 0.003) < 0.0001
-
-    def test_chat_cost_unknown_model(self, cost_tracker):
-        cost = cost_tracker.calculate_chat_cost("unknown-model", 1000, 500)
-        assert cost == 0.0
-
-    def test_stt_cost(self, cost_tracker):
-        cost = cost_tracker.calculate_stt_cost(1.0)
-        assert abs(cost - 0.006) < 0.001
-
-    def test_tts_cost(self, cost_tracker):
-        cost = cost_tracker.calculate_tts_cost(1000)
-        # 1000/1M * 15.00 = 0.015
-        assert abs(cost - 0.015) < 0.001
+    @pytest.mark.parametrize("model_id,input_tokens,output_tokens,cached_tokens,expected", [
+        # 1000/1M * 2.50 + 500/1M * 10.00 = 0.0025 + 0.005
+        ("gpt-4o", 1000, 500, 0, 0.0075),
+        # 10000/1M * 0.15 + 5000/1M * 0.60 = 0.0015 + 0.003
+        ("gpt-4o-mini", 10000, 5000, 0, 0.0045),
+        # 1000/1M * 3.00 + 500/1M * 15.00 = 0.003 + 0.0075
+        ("claude-sonnet-4-5-20250929", 1000, 500, 0, 0.0105),
+        # 10000/1M * 0.10 + 5000/1M * 0.40 = 0.001 + 0.002
+        ("gemini-2.0-flash", 10000, 5000, 0, 0.003),
+        # 200/1M * 2.50 + 800/1M * 1.25 + 500/1M * 10.00 = 0.0005 + 0.001 + 0.005
+        ("gpt-4o", 1000, 500, 800, 0.0065),
+        # No cached_input rate: cached tokens are billed as input
+        ("gemini-2.0-flash", 10000, 5000, 4000, 0.003),
+        ("unknown-model", 1000, 500, 0, 0.0),
+    ])
+    def test_chat_cost(
+        self, cost_tracker, model_id, input_tokens, output_tokens, cached_tokens, expected
+    ):
+        cost = cost_tracker.calculate_chat_cost(
+            model_id, input_tokens, output_tokens, cached_tokens=cached_tokens
+        )
+        assert cost == pytest.approx(expected, abs=0.0001)
 
-    def test_embedding_cost(self, cost_tracker):
-        cost = cost_tracker.calculate_embedding_cost(10000)
-        # 10000/1M * 0.02 = 0.0002
-        assert abs(cost - 0.0002) < 0.0001
+    @pytest.mark.parametrize("method,amount,expected", [
+        ("calculate_stt_cost", 1.0, 0.006),  # 1 min * 0.006
+        ("calculate_tts_cost", 1000, 0.015),  # 1000/1M * 15.00
+        ("calculate_embedding_cost", 10000, 0.0002),  # 10000/1M * 0.02
+    ])
+    def test_usage_cost(self, cost_tracker, method, amount, expected):
+        cost = getattr(cost_tracker, method)(amount)
+        assert cost == pytest.approx(expected, abs=0.0001)
 
 
 class TestCostLogging:
-    @pytest.mark.asyncio
     async def test_log_and_summarize(self, initialized_db, test_settings):
         tracker = CostTracker(test_settings)
         conv_service = ConversationService()
@@ -58,29 +54,31 @@ class TestCostLogging:
         conv = await conv_service.create_conversation("gpt-4o", "Test")
         conv_id = conv["id"]
 
-        await tracker.log_cost(
-            model_id="gpt-4o",
-            operation="chat",
-            conversation_id=conv_id,
-            input_tokens=100,
-            output_tokens=50,
-            cost_usd=0.01,
-        )
-        await tracker.log_cost(
-            model_id="gpt-4o",
-            operation="chat",
-            conversation_id=conv_id,
-            input_tokens=200,
-            output_tokens=100,
-            cost_usd=0.02,
+        # Concurrent callers queue on the single writer connection
+        await asyncio.gather(
+            tracker.log_cost(
+                model_id="gpt-4o",
+                operation="chat",
+                conversation_id=conv_id,
+                input_tokens=100,
+                output_tokens=50,
+                cost_usd=0.01,
+            ),
+            tracker.log_cost(
+                model_id="gpt-4o",
+                operation="chat",
+                conversation_id=conv_id,
+                input_tokens=200,
+                output_tokens=100,
+                cost_usd=0.02,
+            ),
         )
 
         summary = await tracker.get_cost_summary(conv_id)
-        assert abs(summary["total_cost_usd"] - 0.03) < 0.001
+        assert summary["total_cost_usd"] == pytest.approx(0.03, abs=0.001)
         assert summary["total_input_tokens"] == 300
         assert summary["total_output_tokens"] == 150
 
-    @pytest.mark.asyncio
     async def test_global_summary(self, initialized_db, test_settings):
         tracker = CostTracker(test_settings)
         conv_service = ConversationService()
@@ -88,14 +86,130 @@ class TestCostLogging:
         conv_a = await conv_service.create_conversation("gpt-4o", "A")
         conv_b = await conv_service.create_conversation("gpt-4o", "B")
 
-        await tracker.log_cost(
-            model_id="gpt-4o", operation="chat",
-            conversation_id=conv_a["id"], cost_usd=0.01
+        await asyncio.gather(
+            tracker.log_cost(
+                model_id="gpt-4o", operation="chat",
+                conversation_id=conv_a["id"], cost_usd=0.01
+            ),
+            tracker.log_cost(
+                model_id="gpt-4o", operation="chat",
+                conversation_id=conv_b["id"], cost_usd=0.02
+            ),
         )
+
+        summary = await tracker.get_cost_summary()
+        assert summary["total_cost_usd"] == pytest.approx(0.03, abs=0.001)
+
+    async def test_today_spend_tracks_logged_costs(self, initialized_db, test_settings):
+        tracker = CostTracker(test_settings)
+
+        await tracker.log_cost(model_id="gpt-4o", operation="chat", cost_usd=0.01)
+        assert await tracker.get_today_spend() == pytest.approx(0.01, abs=0.0001)
+
+        # Further costs are added to the in-memory total without re-querying
+        await tracker.log_cost(model_id="tts-1", operation="tts", cost_usd=0.02)
+        assert await tracker.get_today_spend() == pytest.approx(0.03, abs=0.0001)
+
+    async def test_today_spend_reload_includes_queued_costs(
+        self, initialized_db, test_settings
+    ):
+        tracker = CostTracker(test_settings)
+        start_writer()
+        try:
+            # Not loaded yet, so these are left to the reload
+            for _ in range(3):
+                await tracker.log_cost(
+                    model_id="gpt-4o", operation="chat", cost_usd=0.01, background=True,
+                )
+            assert await tracker.get_today_spend() == pytest.approx(0.03)
+        finally:
+            await stop_writer()
+
+    async def test_today_spend_reload_keeps_concurrent_costs(
+        self, initialized_db, test_settings
+    ):
+        tracker = CostTracker(test_settings)
+        await tracker.log_cost(model_id="gpt-4o", operation="chat", cost_usd=0.01)
+        daily_spend.invalidate()
+
+        start_writer()
+        try:
+            # Queued while the reload is reading the table, so the row lands
+            # after the read
+            reload = asyncio.ensure_future(tracker.get_today_spend())
+            await asyncio.sleep(0)
+            await tracker.log_cost(
+                model_id="gpt-4o", operation="chat", cost_usd=0.02, background=True,
+            )
+            await reload
+        finally:
+            await stop_writer()
+
+        assert await tracker.get_today_spend() == pytest.approx(0.03)
+
+    async def test_summary_reload_keeps_concurrent_costs(
+        self, initialized_db, test_settings
+    ):
+        tracker = CostTracker(test_settings)
+        await tracker.log_cost(model_id="gpt-4o", operation="chat", cost_usd=0.01)
+        cost_totals.invalidate()
+
+        start_writer()
+        try:
+            reload = asyncio.ensure_future(tracker.get_cost_summary())
+            await asyncio.sleep(0)
+            await tracker.log_cost(
+                model_id="gpt-4o", operation="chat", cost_usd=0.02, background=True,
+            )
+            await reload
+        finally:
+            await stop_writer()
+
+        summary = await tracker.get_cost_summary()
+        assert summary["total_cost_usd"] == pytest.approx(0.03)
+
+    async def test_background_costs_batched(self, initialized_db, test_settings):
+        tracker = CostTracker(test_settings)
+
+        start_writer()
+        try:
+            for _ in range(5):
+                await tracker.log_cost(
+                    model_id="gpt-4o", operation="chat",
+                    input_tokens=10, cost_usd=0.01, background=True,
+                )
+            await flush_writes()
+        finally:
+            await stop_writer()
+
+        summary = await tracker.get_cost_summary()
+        assert summary["total_cost_usd"] == pytest.approx(0.05, abs=0.001)
+        assert summary["total_input_tokens"] == 50
+
+    async def test_summary_tracks_logs_and_deletes(self, initialized_db, test_settings):
+        tracker = CostTracker(test_settings)
+        conv_service = ConversationService()
+        conv = await conv_service.create_conversation("gpt-4o", "Test")
+
+        assert (await tracker.get_cost_summary())["total_cost_usd"] == 0.0
+
+        # Logged after the totals were loaded: applied in memory
         await tracker.log_cost(
-            model_id="gpt-4o", operation="chat",
-            conversation_id=conv_b["id"], cost_usd=0.02
+            model_id="gpt-4o", operation="chat", conversation_id=conv["id"],
+            input_tokens=100, output_tokens=50, cost_usd=0.01,
         )
+        await tracker.log_cost(model_id="tts-1", operation="tts", cost_usd=0.02)
 
         summary = await tracker.get_cost_summary()
-        assert abs(summary["total_cost_usd"] - 0.03) < 0.001
+        assert summary["total_cost_usd"] == pytest.approx(0.03, abs=0.001)
+        assert [(b["operation"], b["model_id"]) for b in summary["breakdown"]] == [
+            ("chat", "gpt-4o"), ("tts", "tts-1"),
+        ]
+        conv_summary = await tracker.get_cost_summary(conv["id"])
+        assert conv_summary["total_input_tokens"] == 100
+
+        # Deleting the conversation removes its cost rows from the totals
+        await conv_service.delete_conversation(conv["id"])
+        summary = await tracker.get_cost_summary()
+        assert summary["total_cost_usd"] == pytest.approx(0.02, abs=0.001)
+        assert (await tracker.get_cost_summary(conv["id"]))["breakdown"] == []
@@ -0,0 +1,49 @@
+import asyncio
+import time
+import uuid
+
+from backend.database import get_db, get_writer, execute_write, uuid7
+
+
+class TestConnectionPragmas:
+    async def test_pooled_connections_use_wal(self, initialized_db):
+        async with get_db() as db:
+            journal_mode = (await (await db.execute("PRAGMA journal_mode")).fetchone())[0]
+            synchronous = (await (await db.execute("PRAGMA synchronous")).fetchone())[0]
+            temp_store = (await (await db.execute("PRAGMA temp_store")).fetchone())[0]
+            busy_timeout = (await (await db.execute("PRAGMA busy_timeout")).fetchone())[0]
+        assert journal_mode == "wal"
+        assert synchronous == 1  # NORMAL
+        assert temp_store == 2  # MEMORY
+        assert busy_timeout > 0
+
+
+class TestWriterConnection:
+    async def test_concurrent_writes_serialize_on_writer(self, initialized_db):
+        await asyncio.gather(*(
+            execute_write((
+                "INSERT INTO analytics_events (event_type) VALUES (?)",
+                (f"event_{i}",),
+            ))
+            for i in range(10)
+        ))
+        async with get_db() as db:
+            count = (await (await db.execute(
+                "SELECT COUNT(*) FROM analytics_events"
+            )).fetchone())[0]
+        assert count == 10
+
+    async def test_writer_is_not_a_reader(self, initialized_db):
+        async with get_writer() as writer:
+            async with get_db() as reader:
+                assert reader is not writer
+
+
+class TestUuid7:
+    def test_version_and_time_order(self):
+        first = uuid7()
+        time.sleep(0.002)
+        second = uuid7()
+        assert uuid.UUID(first).version == 7
+        assert uuid.UUID(first).variant == uuid.RFC_4122
+        assert first < second
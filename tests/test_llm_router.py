@@ -1,28 +1,34 @@
+from collections import OrderedDict
+
 import pytest
+from backend.services import llm_router as llm_router_module
 from backend.services.llm_router import LLMRouter
+from backend.services.providers.base import StreamChunk
+
+
+@pytest.fixture(scope="module")
+def llm_router(shared_settings):
+    return LLMRouter(shared_settings)
 
 
 class TestLLMRouter:
-    def test_get_provider_name(self, test_settings):
-        router = LLMRouter(test_settings)
-        assert router.get_provider_name("gpt-4o") == "openai"
-        assert router.get_provider_name("gpt-4o-mini") == "openai"
-        assert router.get_provider_name("claude-sonnet-4-5-20250929") == "anthropic"
-        assert router.get_provider_name("claude-haiku-4-5-20251001") == "anthropic"
-        assert router.get_provider_name("gemini-2.0-flash") == "google"
-        assert router.get_provider_name("gemini-1.5-pro") == "google"
-        assert router.get_provider_name("sonar-pro") == "perplexity"
-        assert router.get_provider_name("sonar") == "perplexity"
-        assert router.get_provider_name("sonar-reasoning-pro") == "perplexity"
-
-    def test_unknown_model_raises(self, test_settings):
-        router = LLMRouter(test_settings)
+    def test_get_provider_name(self, llm_router):
+        assert llm_router.get_provider_name("gpt-4o") == "openai"
+        assert llm_router.get_provider_name("gpt-4o-mini") == "openai"
+        assert llm_router.get_provider_name("claude-sonnet-4-5-20250929") == "anthropic"
+        assert llm_router.get_provider_name("claude-haiku-4-5-20251001") == "anthropic"
+        assert llm_router.get_provider_name("gemini-2.0-flash") == "google"
+        assert llm_router.get_provider_name("gemini-1.5-pro") == "google"
+        assert llm_router.get_provider_name("sonar-pro") == "perplexity"
+        assert llm_router.get_provider_name("sonar") == "perplexity"
+        assert llm_router.get_provider_name("sonar-reasoning-pro") == "perplexity"
+
+    def test_unknown_model_raises(self, llm_router):
         with pytest.raises(ValueError, match="Unknown model"):
-            router._get_provider("nonexistent-model")
+            llm_router._get_provider("nonexistent-model")
 
-    def test_get_available_models(self, test_settings):
-        router = LLMRouter(test_settings)
-        models = router.get_available_models()
+    def test_get_available_models(self, llm_router):
+        models = llm_router.get_available_models()
         # All providers have fake keys, so all models should be available
         assert len(models) == 9
         model_ids = [m["id"] for m in models]
@@ -30,3 +36,80 @@ class TestLLMRouter:
         assert "claude-sonnet-4-5-20250929" in model_ids
         assert "gemini-2.0-flash" in model_ids
         assert "sonar-pro" in model_ids
+
+
+class _StubProvider:
+    def __init__(self, name="openai", output_tokens=3):
+        self.name = name
+        self.output_tokens = output_tokens
+        self.calls = 0
+
+    def get_provider_name(self):
+        return self.name
+
+    async def stream_chat(self, messages, model, temperature=0.7, max_tokens=4096):
+        self.calls += 1
+        yield StreamChunk(text="Paris is ")
+        yield StreamChunk(text="the capital.")
+        yield StreamChunk(
+            is_final=True, input_tokens=12, output_tokens=self.output_tokens,
+            citations=[{"url": "https://a", "title": "A", "source": "x"}],
+        )
+
+
+class TestResponseCache:
+    MESSAGES = [{"role": "user", "content": "Capital of France?"}]
+
+    @pytest.fixture
+    def router(self, test_settings, monkeypatch):
+        monkeypatch.setattr(llm_router_module, "_response_cache", OrderedDict())
+        monkeypatch.setattr(llm_router_module, "_REPLAY_CHUNK_CHARS", 5)
+        router = LLMRouter(test_settings)
+        router._providers["openai"] = _StubProvider()
+        return router
+
+    async def _run(self, router, temperature=0.0, messages=MESSAGES):
+        return [
+            c async for c in router.stream_chat(messages, "gpt-4o", temperature=temperature)
+        ]
+
+    async def test_repeat_request_replayed(self, router):
+        first = await self._run(router)
+        second = await self._run(router)
+
+        assert router._providers["openai"].calls == 1
+        assert "".join(c.text for c in second) == "Paris is the capital."
+        assert all(len(c.text) <= 5 for c in second)
+        assert second[-1].is_final
+        assert second[-1].citations == first[-1].citations
+        # Replays are free
+        assert second[-1].input_tokens == second[-1].output_tokens == 0
+
+    async def test_warm_temperature_not_cached(self, router):
+        await self._run(router, temperature=0.7)
+        await self._run(router, temperature=0.7)
+        assert router._providers["openai"].calls == 2
+
+    @pytest.mark.parametrize("provider, model_id", [
+        ("perplexity", "sonar"), ("google", "gemini-2.0-flash"),
+    ])
+    async def test_web_grounded_providers_not_cached(self, router, provider, model_id):
+        stub = router._providers[provider] = _StubProvider(provider)
+        for _ in range(2):
+            [c async for c in router.stream_chat(self.MESSAGES, model_id, temperature=0.0)]
+        assert stub.calls == 2
+
+    async def test_different_messages_miss(self, router):
+        await self._run(router)
+        await self._run(router, messages=[{"role": "user", "content": "Capital of Spain?"}])
+        assert router._providers["openai"].calls == 2
+
+    async def test_partial_or_failed_responses_not_cached(self, router):
+        stream = router.stream_chat(self.MESSAGES, "gpt-4o", temperature=0.0)
+        await stream.__anext__()
+        await stream.aclose()
+
+        router._providers["openai"].output_tokens = 0
+        await self._run(router)
+        await self._run(router)
+        assert router._providers["openai"].calls == 3
@@ -1,12 +1,25 @@
 """Tests for LLM provider changes: StreamChunk citations, provider behaviors."""
 
 import asyncio
+import threading
 from dataclasses import fields
+from types import SimpleNamespace
 from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
 
+from backend.database import get_db
+from backend.services import http_client
+from backend.services.cost_tracker import CostTracker
+from backend.services.http_client import get_http_client
+from backend.services.providers import openai_provider
+from backend.services.providers.anthropic_provider import AnthropicProvider
 from backend.services.providers.base import StreamChunk
+from backend.services.providers.gemini_provider import GeminiProvider
+from backend.services.providers.openai_provider import OpenAIProvider
+from backend.services.providers.perplexity_provider import (
+    PerplexityProvider, _REQUEST_TIMEOUT,
+)
 
 
 class TestStreamChunk:
@@ -60,13 +73,11 @@ class TestPerplexityProviderConfig:
 
     def test_provider_has_timeout(self):
         """Verify the provider has a timeout configured."""
-        from backend.services.providers.perplexity_provider import _REQUEST_TIMEOUT
         assert _REQUEST_TIMEOUT > 0
         assert _REQUEST_TIMEOUT <= 300  # Reasonable upper bound
 
     def test_provider_name(self):
         """Test provider name without needing an API key."""
-        from backend.services.providers.perplexity_provider import PerplexityProvider
         provider = PerplexityProvider(api_key="fake-key")
         assert provider.get_provider_name() == "perplexity"
 
@@ -76,11 +87,169 @@ class TestGeminiProviderConfig:
 
     def test_provider_name(self):
         """Test provider name without needing an API key."""
-        from backend.services.providers.gemini_provider import GeminiProvider
         provider = GeminiProvider(api_key="fake-key")
         assert provider.get_provider_name() == "google"
 
 
+def _gemini_chunk(text=None, usage=None, candidates=None):
+    return SimpleNamespace(text=text, usage_metadata=usage, candidates=candidates)
+
+
+def _make_gemini_provider(stream):
+    """Create a GeminiProvider whose client streams from ``stream()``."""
+    provider = GeminiProvider(api_key="fake-key")
+    provider._client = MagicMock()
+    provider._client.models.generate_content_stream = lambda **kwargs: stream()
+    return provider
+
+
+class TestGeminiProviderStreaming:
+    """The sync SDK stream is bridged to the event loop chunk by chunk."""
+
+    async def test_text_yielded_before_stream_finishes(self):
+        first_seen = threading.Event()
+
+        def stream():
+            yield _gemini_chunk(text="Hello")
+            # Only continues once the consumer has the first chunk
+            assert first_seen.wait(timeout=5)
+            yield _gemini_chunk(
+                text=" world",
+                usage=SimpleNamespace(prompt_token_count=7, candidates_token_count=3),
+            )
+
+        provider = _make_gemini_provider(stream)
+        chunks = []
+        async for chunk in provider.stream_chat(SAMPLE_MESSAGES, model="gemini-2.0-flash"):
+            chunks.append(chunk)
+            first_seen.set()
+
+        assert [c.text for c in chunks[:-1]] == ["Hello", " world"]
+        assert chunks[-1].is_final is True
+        assert (chunks[-1].input_tokens, chunks[-1].output_tokens) == (7, 3)
+
+    async def test_messages_converted_to_gemini_contents(self):
+        provider = GeminiProvider(api_key="fake-key")
+        captured = {}
+
+        def generate_content_stream(model, contents, config):
+            captured.update(contents=contents, config=config)
+            return iter([_gemini_chunk(text="ok")])
+
+        provider._client = MagicMock()
+        provider._client.models.generate_content_stream = generate_content_stream
+        messages = [
+            {"role": "system", "content": "Be brief."},
+            {"role": "user", "content": "Hi"},
+            {"role": "system", "content": "Cite sources."},
+            {"role": "assistant", "content": "Hello"},
+        ]
+        [c async for c in provider.stream_chat(messages, model="gemini-2.0-flash")]
+
+        assert [(c.role, c.parts[0].text) for c in captured["contents"]] == [
+            ("user", "Hi"), ("model", "Hello"),
+        ]
+        assert captured["config"].system_instruction == ["Be brief.", "Cite sources."]
+
+    async def test_grounding_citations_deduplicated_by_url(self):
+        def grounded(*urls):
+            gm = SimpleNamespace(
+                grounding_chunks=[
+                    SimpleNamespace(web=SimpleNamespace(uri=u, title=u.upper()))
+                    for u in urls
+                ],
+                web_search_queries=None,
+            )
+            return [SimpleNamespace(grounding_metadata=gm)]
+
+        def stream():
+            yield _gemini_chunk(text="a", candidates=grounded("https://a", "https://b"))
+            yield _gemini_chunk(text="b", candidates=grounded("https://b", "", "https://c"))
+
+        provider = _make_gemini_provider(stream)
+        chunks = [c async for c in provider.stream_chat(SAMPLE_MESSAGES, model="gemini-2.0-flash")]
+
+        assert [c["url"] for c in chunks[-1].citations] == ["https://a", "https://b", "https://c"]
+        assert chunks[-1].citations[0] == {
+            "url": "https://a", "title": "HTTPS://A", "source": "google_search",
+        }
+
+    async def test_errors_propagate_to_consumer(self):
+        def stream():
+            yield _gemini_chunk(text="partial")
+            raise RuntimeError("quota exceeded")
+
+        provider = _make_gemini_provider(stream)
+        received = []
+        with pytest.raises(RuntimeError, match="quota exceeded"):
+            async for chunk in provider.stream_chat(SAMPLE_MESSAGES, model="gemini-2.0-flash"):
+                received.append(chunk.text)
+        assert received == ["partial"]
+
+    async def test_closing_early_stops_producer(self):
+        produced = []
+        finished = threading.Event()
+
+        def stream():
+            try:
+                for i in range(1000):
+                    produced.append(i)
+                    yield _gemini_chunk(text=str(i))
+            finally:
+                finished.set()
+
+        provider = _make_gemini_provider(stream)
+        gen = provider.stream_chat(SAMPLE_MESSAGES, model="gemini-2.0-flash")
+        assert (await gen.__anext__()).text == "0"
+        await gen.aclose()
+
+        assert await asyncio.to_thread(finished.wait, 5)
+        assert len(produced) < 1000
+
+
+class TestOpenAIProviderStreaming:
+    """Token deltas are coalesced into larger text chunks."""
+
+    @staticmethod
+    def _provider(deltas, finish_reason="stop"):
+        def delta(content=None, finish=None):
+            choice = SimpleNamespace(delta=SimpleNamespace(content=content), finish_reason=finish)
+            return SimpleNamespace(choices=[choice], usage=None)
+
+        async def stream():
+            for d in deltas:
+                yield delta(d)
+            yield delta(finish=finish_reason)
+            yield SimpleNamespace(
+                choices=[],
+                usage=SimpleNamespace(
+                    prompt_tokens=5, completion_tokens=9,
+                    prompt_tokens_details=SimpleNamespace(cached_tokens=4),
+                ),
+            )
+
+        provider = OpenAIProvider(api_key="fake-key")
+        provider._client = MagicMock()
+        provider._client.chat.completions.create = AsyncMock(return_value=stream())
+        return provider
+
+    async def test_deltas_coalesced(self, monkeypatch):
+        # Only the size and punctuation rules apply within the test
+        monkeypatch.setattr(openai_provider, "_FLUSH_INTERVAL", 60.0)
+        monkeypatch.setattr(openai_provider, "_FLUSH_CHARS", 8)
+        provider = self._provider(["Hel", "lo", " wor", "ld.", " a", "b", "cdefgh", " Next"])
+
+        chunks = [c async for c in provider.stream_chat(SAMPLE_MESSAGES, model="gpt-4o")]
+
+        texts = [c.text for c in chunks if c.text]
+        # First delta goes out at once; then sentence end, size, and the
+        # remainder before finish_reason
+        assert texts == ["Hel", "lo world.", " abcdefgh", " Next"]
+        assert chunks[-2].finish_reason == "stop"
+        assert chunks[-1].is_final and chunks[-1].output_tokens == 9
+        assert chunks[-1].cached_tokens == 4
+
+
 # ---------------------------------------------------------------------------
 # Mocked Perplexity provider tests
 # ---------------------------------------------------------------------------
@@ -92,52 +261,39 @@ def _make_mock_response(
     completion_tokens: int = 100,
     choices_empty: bool = False,
 ):
-    """Build a mock ChatCompletion response mimicking Perplexity non-streaming."""
-    # Mock usage
-    usage = MagicMock()
-    usage.prompt_tokens = prompt_tokens
-    usage.completion_tokens = completion_tokens
-
-    # Mock message inside choice
-    message = MagicMock()
-    message.content = content
-
-    choice = MagicMock()
-    choice.message = message
-
-    # Mock response
-    response = MagicMock()
-    response.choices = [] if choices_empty else [choice]
-    response.usage = usage
+    """Build a fake ChatCompletion response mimicking Perplexity non-streaming.
 
+    Plain namespaces: the provider only reads attributes, and unlike
+    MagicMock a missing one fails loudly.
+    """
+    usage = SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+    choice = SimpleNamespace(message=SimpleNamespace(content=content))
     # Citations can come via attribute or model_extra
-    if citations is not None:
-        response.citations = citations
-        response.model_extra = {"citations": citations}
-    else:
-        response.citations = None
-        response.model_extra = {}
+    return SimpleNamespace(
+        choices=[] if choices_empty else [choice],
+        usage=usage,
+        citations=citations,
+        model_extra={"citations": citations} if citations is not None else {},
+    )
 
-    return response
 
+@pytest.fixture(scope="module")
+def perplexity_provider():
+    """One PerplexityProvider for the module; tests swap in its client."""
+    return PerplexityProvider(api_key="fake-key")
 
-def _make_provider_with_mock(mock_response=None, side_effect=None):
-    """Create a PerplexityProvider with a mocked AsyncOpenAI client."""
-    from backend.services.providers.perplexity_provider import PerplexityProvider
-
-    provider = PerplexityProvider(api_key="fake-key")
 
+def _make_provider_with_mock(provider, mock_response=None, side_effect=None):
+    """Give ``provider`` a mocked AsyncOpenAI client and return it."""
     mock_create = AsyncMock()
     if side_effect:
         mock_create.side_effect = side_effect
     else:
         mock_create.return_value = mock_response
 
-    provider._client = MagicMock()
-    provider._client.chat = MagicMock()
-    provider._client.chat.completions = MagicMock()
-    provider._client.chat.completions.create = mock_create
-
+    provider._client = SimpleNamespace(
+        chat=SimpleNamespace(completions=SimpleNamespace(create=mock_create))
+    )
     return provider
 
 
@@ -147,11 +303,10 @@ SAMPLE_MESSAGES = [
 ]
 
 
-@pytest.mark.asyncio
 class TestPerplexityProviderHappyPath:
     """Test the non-streaming Perplexity provider with mocked responses."""
 
-    async def test_text_and_citations(self):
+    async def test_text_and_citations(self, perplexity_provider):
         """Happy path: response has text + string-URL citations."""
         mock_resp = _make_mock_response(
             content="Tesla stock is $250 today.",
@@ -159,7 +314,7 @@ class TestPerplexityProviderHappyPath:
             prompt_tokens=30,
             completion_tokens=15,
         )
-        provider = _make_provider_with_mock(mock_response=mock_resp)
+        provider = _make_provider_with_mock(perplexity_provider, mock_response=mock_resp)
 
         chunks = []
         async for chunk in provider.stream_chat(
@@ -184,7 +339,7 @@ class TestPerplexityProviderHappyPath:
         assert final_chunk.citations[0]["source"] == "perplexity"
         assert final_chunk.citations[1]["url"] == "https://reuters.com/tsla"
 
-    async def test_text_without_citations(self):
+    async def test_text_without_citations(self, perplexity_provider):
         """Response has text but no citations (some queries don't trigger search)."""
         mock_resp = _make_mock_response(
             content="The square root of 144 is 12.",
@@ -192,7 +347,7 @@ class TestPerplexityProviderHappyPath:
             prompt_tokens=20,
             completion_tokens=10,
         )
-        provider = _make_provider_with_mock(mock_response=mock_resp)
+        provider = _make_provider_with_mock(perplexity_provider, mock_response=mock_resp)
 
         chunks = []
         async for chunk in provider.stream_chat(
@@ -208,7 +363,7 @@ class TestPerplexityProviderHappyPath:
         assert chunks[1].input_tokens == 20
         assert chunks[1].output_tokens == 10
 
-    async def test_dict_citations(self):
+    async def test_dict_citations(self, perplexity_provider):
         """Citations can also come as dicts with url and title."""
         mock_resp = _make_mock_response(
             content="AI news today.",
@@ -217,7 +372,7 @@ class TestPerplexityProviderHappyPath:
                 {"url": "https://example.com/ml", "title": "ML Article"},
             ],
         )
-        provider = _make_provider_with_mock(mock_response=mock_resp)
+        provider = _make_provider_with_mock(perplexity_provider, mock_response=mock_resp)
 
         chunks = []
         async for chunk in provider.stream_chat(
@@ -231,7 +386,7 @@ class TestPerplexityProviderHappyPath:
         assert final.citations[0]["title"] == "AI Article"
         assert final.citations[1]["title"] == "ML Article"
 
-    async def test_duplicate_citation_urls_deduplicated(self):
+    async def test_duplicate_citation_urls_deduplicated(self, perplexity_provider):
         """Duplicate URLs should be deduplicated."""
         mock_resp = _make_mock_response(
             content="Some answer.",
@@ -241,7 +396,7 @@ class TestPerplexityProviderHappyPath:
                 "https://other.com/page",
             ],
         )
-        provider = _make_provider_with_mock(mock_response=mock_resp)
+        provider = _make_provider_with_mock(perplexity_provider, mock_response=mock_resp)
 
         chunks = []
         async for chunk in provider.stream_chat(
@@ -254,14 +409,13 @@ class TestPerplexityProviderHappyPath:
         assert len(final.citations) == 2  # Deduplicated from 3 to 2
 
 
-@pytest.mark.asyncio
 class TestPerplexityProviderErrors:
     """Test error handling in the Perplexity provider."""
 
-    async def test_empty_choices(self):
+    async def test_empty_choices(self, perplexity_provider):
         """Empty choices array should yield a fallback message."""
         mock_resp = _make_mock_response(choices_empty=True)
-        provider = _make_provider_with_mock(mock_response=mock_resp)
+        provider = _make_provider_with_mock(perplexity_provider, mock_response=mock_resp)
 
         chunks = []
         async for chunk in provider.stream_chat(
@@ -274,12 +428,10 @@ class TestPerplexityProviderErrors:
         assert "No response received" in chunks[0].text
         assert chunks[1].is_final is True
 
-    async def test_none_message_content(self):
+    async def test_none_message_content(self, perplexity_provider):
         """message.content is None — should yield fallback message."""
         mock_resp = _make_mock_response(content=None)
-        # Force content to be None (the helper sets it via MagicMock)
-        mock_resp.choices[0].message.content = None
-        provider = _make_provider_with_mock(mock_response=mock_resp)
+        provider = _make_provider_with_mock(perplexity_provider, mock_response=mock_resp)
 
         chunks = []
         async for chunk in provider.stream_chat(
@@ -292,9 +444,10 @@ class TestPerplexityProviderErrors:
         assert "No response received" in chunks[0].text
         assert chunks[1].is_final is True
 
-    async def test_timeout_error(self):
+    async def test_timeout_error(self, perplexity_provider):
         """asyncio.TimeoutError should yield a timeout message, not raise."""
         provider = _make_provider_with_mock(
+            perplexity_provider,
             side_effect=asyncio.TimeoutError("timed out")
         )
 
@@ -311,9 +464,10 @@ class TestPerplexityProviderErrors:
         assert chunks[1].input_tokens == 0
         assert chunks[1].output_tokens == 0
 
-    async def test_api_exception(self):
+    async def test_api_exception(self, perplexity_provider):
         """Generic API exception should yield an error message, not raise."""
         provider = _make_provider_with_mock(
+            perplexity_provider,
             side_effect=RuntimeError("API key invalid")
         )
 
@@ -329,11 +483,10 @@ class TestPerplexityProviderErrors:
         assert chunks[1].is_final is True
         assert chunks[1].input_tokens == 0
 
-    async def test_empty_string_content(self):
+    async def test_empty_string_content(self, perplexity_provider):
         """message.content is empty string — should yield fallback."""
         mock_resp = _make_mock_response(content="")
-        mock_resp.choices[0].message.content = ""
-        provider = _make_provider_with_mock(mock_response=mock_resp)
+        provider = _make_provider_with_mock(perplexity_provider, mock_response=mock_resp)
 
         chunks = []
         async for chunk in provider.stream_chat(
@@ -345,3 +498,133 @@ class TestPerplexityProviderErrors:
         assert len(chunks) == 2
         assert "No response received" in chunks[0].text
         assert chunks[1].is_final is True
+
+
+class TestAnthropicProviderCaching:
+    async def test_cache_breakpoints_and_usage(self):
+        captured = {}
+
+        class _Stream:
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *exc):
+                return False
+
+            @property
+            async def text_stream(self):
+                yield "Hi"
+
+            async def get_final_message(self):
+                return SimpleNamespace(usage=SimpleNamespace(
+                    input_tokens=20, output_tokens=5,
+                    cache_read_input_tokens=1500, cache_creation_input_tokens=80,
+                ))
+
+        def stream(**kwargs):
+            captured.update(kwargs)
+            return _Stream()
+
+        provider = AnthropicProvider(api_key="fake-key")
+        provider._client = MagicMock()
+        provider._client.messages.stream = stream
+        messages = [
+            {"role": "system", "content": "Be brief."},
+            {"role": "user", "content": "Q1"},
+            {"role": "assistant", "content": "A1"},
+            {"role": "user", "content": "Q2"},
+        ]
+        chunks = [c async for c in provider.stream_chat(messages, model="claude-haiku-4-5-20251001")]
+
+        assert captured["system"] == [
+            {"type": "text", "text": "Be brief.", "cache_control": {"type": "ephemeral"}},
+        ]
+        # The history before the new turn ends with a breakpoint
+        assert captured["messages"][1]["content"] == [
+            {"type": "text", "text": "A1", "cache_control": {"type": "ephemeral"}},
+        ]
+        assert captured["messages"][2] == {"role": "user", "content": "Q2"}
+        final = chunks[-1]
+        assert (final.input_tokens, final.cached_tokens, final.output_tokens) == (1600, 1500, 5)
+
+
+class TestSharedHttpClient:
+    def test_openai_clients_share_one_pool(self):
+        shared = get_http_client()
+        assert OpenAIProvider(api_key="fake-key")._client._client is shared
+        assert PerplexityProvider(api_key="fake-key")._client._client is shared
+
+    async def test_closed_client_replaced(self):
+        first = http_client.get_http_client()
+        await http_client.close_http_client()
+        assert first.is_closed
+        assert http_client.get_http_client() is not first
+
+
+class TestPerplexityRequestCoalescing:
+    async def test_identical_concurrent_requests_share_one_call(
+        self, perplexity_provider
+    ):
+        release = asyncio.Event()
+        mock_resp = _make_mock_response(content="Shared answer.")
+        provider = _make_provider_with_mock(perplexity_provider)
+
+        async def create(**kwargs):
+            await release.wait()
+            return mock_resp
+
+        provider._client.chat.completions.create = AsyncMock(side_effect=create)
+
+        async def run(messages):
+            return [c async for c in provider.stream_chat(messages=messages, model="sonar")]
+
+        other = [{"role": "user", "content": "Something else?"}]
+        tasks = [asyncio.ensure_future(run(m)) for m in (SAMPLE_MESSAGES, SAMPLE_MESSAGES, other)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*tasks)
+
+        assert provider._client.chat.completions.create.await_count == 2
+        assert [r[0].text for r in results] == ["Shared answer."] * 3
+
+    async def test_shared_call_billed_once(
+        self, perplexity_provider, shared_settings, initialized_db
+    ):
+        release = asyncio.Event()
+        mock_resp = _make_mock_response(prompt_tokens=50, completion_tokens=100)
+        provider = _make_provider_with_mock(perplexity_provider)
+
+        async def create(**kwargs):
+            await release.wait()
+            return mock_resp
+
+        provider._client.chat.completions.create = AsyncMock(side_effect=create)
+        tracker = CostTracker(shared_settings)
+
+        async def chat():
+            # What the chat router does with each stream's final chunk
+            async for chunk in provider.stream_chat(messages=SAMPLE_MESSAGES, model="sonar"):
+                if chunk.is_final:
+                    await tracker.log_cost(
+                        model_id="sonar", operation="chat",
+                        input_tokens=chunk.input_tokens,
+                        output_tokens=chunk.output_tokens,
+                        cost_usd=tracker.calculate_chat_cost(
+                            "sonar", chunk.input_tokens, chunk.output_tokens
+                        ),
+                    )
+
+        tasks = [asyncio.ensure_future(chat()) for _ in range(2)]
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(*tasks)
+
+        async with get_db() as db:
+            cursor = await db.execute(
+                "SELECT input_tokens, output_tokens FROM cost_log WHERE cost_usd > 0"
+            )
+            billed = await cursor.fetchall()
+        assert [tuple(r) for r in billed] == [(50, 100)]
+        assert await tracker.get_today_spend() == pytest.approx(
+            tracker.calculate_chat_cost("sonar", 50, 100)
+        )
@@ -1,65 +1,324 @@
+import asyncio
+import re
+import time
+from collections import OrderedDict
+from types import SimpleNamespace
+
+import numpy as np
 import pytest
 from unittest.mock import MagicMock
-from backend.services.rag_engine import RAGEngine
+
+
+# The RAG stack (openai, pypdf, chromadb) is imported by the fixtures rather
+# than at module level, so collecting this file stays cheap when its tests
+# are deselected
+@pytest.fixture(scope="module")
+def rag_engine_module():
+    from backend.services import rag_engine
+
+    return rag_engine
+
+
+class _NullVectorStore:
+    """Stands in for the vector store where tests never reach it."""
+
+
+@pytest.fixture(scope="module")
+def mock_vs():
+    """One vector store mock for the module, reset by each rag_engine."""
+    from backend.services.vectorstore import VectorStoreManager
+
+    return MagicMock(spec=VectorStoreManager)
 
 
 @pytest.fixture
-def rag_engine(test_settings):
-    mock_vs = MagicMock()
-    return RAGEngine(test_settings, mock_vs)
+def rag_engine(rag_engine_module, test_settings, mock_vs):
+    mock_vs.reset_mock()
+    return rag_engine_module.RAGEngine(test_settings, mock_vs)
+
+
+@pytest.fixture(scope="module")
+def shared_engine(rag_engine_module, shared_settings):
+    """An engine built once per module for chunking and loading tests,
+    which don't modify it or touch its vector store.
+
+    Tests that change its settings do so through monkeypatch.
+    """
+    return rag_engine_module.RAGEngine(shared_settings, _NullVectorStore())
+
+
+@pytest.fixture(scope="module")
+def long_hello():
+    return "Hello world. " * 200  # ~2600 chars
+
+
+@pytest.fixture(scope="module")
+def repeated_paragraphs():
+    return ("This is a sentence with some words. " * 50 + "\n\n") * 5
+
+
+# (text, check on the chunks) for inputs small enough to write inline
+_CHUNK_CASES = [
+    pytest.param("Short text.", lambda c: c == ["Short text."], id="short"),
+    pytest.param("", lambda c: c == [], id="empty"),
+    pytest.param("   \n\n  ", lambda c: c == [], id="whitespace"),
+    # Small enough overall for a single chunk
+    pytest.param(
+        "First paragraph.\n\n" * 5 + "Last paragraph.",
+        lambda c: len(c) >= 1,
+        id="paragraphs",
+    ),
+]
 
 
 class TestChunking:
-    def test_chunk_short_text(self, rag_engine):
-        chunks = rag_engine._chunk_text("Short text.")
-        assert len(chunks) == 1
-        assert chunks[0] == "Short text."
-
-    def test_chunk_empty_text(self, rag_engine):
-        chunks = rag_engine._chunk_text("")
-        assert len(chunks) == 0
-
-    def test_chunk_whitespace_only(self, rag_engine):
-        chunks = rag_engine._chunk_text("   \n\n  ")
-        assert len(chunks) == 0
-
-    def test_chunk_long_text(self, rag_engine):
-        long_text = "Hello world. " * 200  # ~2600 chars
-        chunks = rag_engine._chunk_text(long_text)
+    @pytest.mark.parametrize("text, check", _CHUNK_CASES)
+    def test_chunk(self, shared_engine, text, check):
+        assert check(shared_engine._chunk_text(text))
+
+    def test_chunk_long_text(self, shared_engine, long_hello):
+        chunks = shared_engine._chunk_text(long_hello)
+        assert len(chunks) > 1
+
+    def test_chunks_break_at_highest_priority_boundary(self, shared_engine, monkeypatch):
+        monkeypatch.setattr(shared_engine, "_chunk_size", 40)
+        monkeypatch.setattr(shared_engine, "_chunk_overlap", 0)
+        text = (
+            "First paragraph is short.\n\n"
+            "Second one has two lines\nthat together run past the limit.\n\n"
+            "Then a long sentence. And another one that pushes it over forty."
+        )
+        assert shared_engine._chunk_text(text) == [
+            "First paragraph is short.",
+            "Second one has two lines",
+            "that together run past the limit.",
+            # ". " is consumed as the separator
+            "Then a long sentence",
+            "And another one that pushes it over",
+            "forty.",
+        ]
+
+    def test_chunks_within_size_plus_overlap(self, shared_engine, monkeypatch):
+        monkeypatch.setattr(shared_engine, "_chunk_size", 50)
+        monkeypatch.setattr(shared_engine, "_chunk_overlap", 10)
+        text = ("lorem ipsum dolor sit amet. " * 40 + "\n") * 5 + "x" * 130
+        chunks = shared_engine._chunk_text(text)
+        assert all(len(c) <= 50 + 10 + 1 for c in chunks)
+        # Unbroken runs are force-split with the overlap as stride
+        assert chunks[-1].endswith("x" * 10)
+
+    def test_chunk_overlap_present(self, shared_engine, repeated_paragraphs):
+        # Text that produces multiple chunks
+        chunks = shared_engine._chunk_text(repeated_paragraphs)
         assert len(chunks) > 1
+        # Each chunk after the first starts with the previous one's tail
+        expected = chunks[0][-shared_engine._chunk_overlap:] + " "
+        assert chunks[1].startswith(expected)
 
-    def test_chunk_respects_paragraphs(self, rag_engine):
-        text = "First paragraph.\n\n" * 5 + "Last paragraph."
-        chunks = rag_engine._chunk_text(text)
-        # Should be a single chunk since total is small
-        assert len(chunks) >= 1
+    def test_chunk_throughput(self, shared_engine):
+        # ~1.3 MB chunks in tens of milliseconds; the limit only catches
+        # a regression to superlinear behaviour
+        text = "Hello world. " * 100_000
+        start = time.perf_counter()
+        chunks = shared_engine._chunk_text(text)
+        assert time.perf_counter() - start < 2.0
+        assert len(chunks) > 1000
 
-    def test_chunk_overlap_present(self, rag_engine):
-        # Create text that will produce multiple chunks
-        long_text = ("This is a sentence with some words. " * 50 + "\n\n") * 5
-        chunks = rag_engine._chunk_text(long_text)
-        if len(chunks) > 1:
-            # Second chunk should start with content from end of first chunk
-            first_tail = chunks[0][-100:]
-            assert first_tail[:50] in chunks[1][:300]
+
+_UNSUPPORTED_RE = re.compile(r"Unsupported file type")
+
+_SAMPLE_FILES = {
+    "test.txt": "Hello, this is a test document.".encode(),
+    "test.md": "# Title\n\nSome content.".encode(),
+    # Multi-byte characters at both ends of a 4 MiB document
+    "large.txt": "é start\n".encode() + b"x" * (4 * 2**20) + "\nend é".encode(),
+}
+_UNSUPPORTED_EXTS = [".xyz", ".bin", ".zip", ".exe", ".png", ".docx"]
+
+
+@pytest.fixture(scope="module")
+def sample_files(tmp_path_factory):
+    """A directory holding _SAMPLE_FILES and a test file for each of
+    _UNSUPPORTED_EXTS, written once per module."""
+    d = tmp_path_factory.mktemp("rag")
+    files = {**_SAMPLE_FILES, **{f"test{ext}": b"x" for ext in _UNSUPPORTED_EXTS}}
+    for name, content in files.items():
+        (d / name).write_bytes(content)
+    return d
 
 
 class TestFileLoading:
-    def test_load_txt_file(self, rag_engine, tmp_path):
-        txt_file = tmp_path / "test.txt"
-        txt_file.write_text("Hello, this is a test document.", encoding="utf-8")
-        text = rag_engine._load_file(txt_file)
-        assert "Hello, this is a test document." in text
-
-    def test_load_md_file(self, rag_engine, tmp_path):
-        md_file = tmp_path / "test.md"
-        md_file.write_text("# Title\n\nSome content.", encoding="utf-8")
-        text = rag_engine._load_file(md_file)
-        assert "Title" in text
-        assert "Some content." in text
-
-    def test_load_unsupported_type(self, rag_engine, tmp_path):
-        bad_file = tmp_path / "test.xyz"
-        bad_file.write_text("content")
-        with pytest.raises(ValueError, match="Unsupported file type"):
-            rag_engine._load_file(bad_file)
+    @pytest.mark.parametrize("name", ["test.txt", "test.md", "large.txt"])
+    def test_load_text_file(self, shared_engine, sample_files, name):
+        text = shared_engine._load_file(sample_files / name)
+        assert text == _SAMPLE_FILES[name].decode()
+
+    def test_pdf_text_cached_by_content(
+        self, rag_engine, tmp_path, monkeypatch, rag_engine_module
+    ):
+        parsed = []
+
+        class _FakeReader:
+            def __init__(self, stream):
+                data = stream.read()
+                parsed.append(data)
+                self.pages = [SimpleNamespace(extract_text=lambda: data.decode())]
+
+        monkeypatch.setattr(rag_engine_module, "PdfReader", _FakeReader)
+        first = tmp_path / "a.pdf"
+        first.write_bytes(b"page text")
+        copy = tmp_path / "copy.pdf"
+        copy.write_bytes(b"page text")
+        other = tmp_path / "b.pdf"
+        other.write_bytes(b"other text")
+
+        assert rag_engine._load_file(first) == "page text"
+        # Same bytes under another name: served from the cache
+        assert rag_engine._load_file(copy) == "page text"
+        assert parsed == [b"page text"]
+
+        assert rag_engine._load_file(other) == "other text"
+        assert parsed == [b"page text", b"other text"]
+
+    @pytest.mark.parametrize("ext", _UNSUPPORTED_EXTS)
+    def test_load_unsupported_type(self, shared_engine, sample_files, ext):
+        with pytest.raises(ValueError, match=_UNSUPPORTED_RE):
+            shared_engine._load_file(sample_files / f"test{ext}")
+
+
+class TestEmbedding:
+    async def test_embed_batches_concurrently_in_order(
+        self, rag_engine, monkeypatch, rag_engine_module
+    ):
+        monkeypatch.setattr(rag_engine_module, "_EMBED_BATCH_SIZE", 2)
+        in_flight = max_in_flight = 0
+
+        async def create(model, input):
+            nonlocal in_flight, max_in_flight
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            await asyncio.sleep(0)
+            in_flight -= 1
+            return SimpleNamespace(
+                data=[SimpleNamespace(embedding=[float(t)]) for t in input]
+            )
+
+        rag_engine._openai = SimpleNamespace(embeddings=SimpleNamespace(create=create))
+        embeddings = await rag_engine._embed([str(i) for i in range(5)])
+
+        assert embeddings.dtype == np.float32
+        assert embeddings.tolist() == [[0.0], [1.0], [2.0], [3.0], [4.0]]
+        assert max_in_flight == 3
+
+    def test_batches_packed_by_count_and_size(self, monkeypatch, rag_engine_module):
+        monkeypatch.setattr(rag_engine_module, "_EMBED_BATCH_SIZE", 3)
+        monkeypatch.setattr(rag_engine_module, "_EMBED_BATCH_TOKENS", 10)
+        batches = rag_engine_module._embedding_batches
+
+        assert list(batches([])) == []
+        assert list(batches(["a"] * 7)) == [["a"] * 3, ["a"] * 3, ["a"]]
+        assert list(batches(["aaaa", "bbbb", "cc", "d"])) == [["aaaa", "bbbb", "cc"], ["d"]]
+        # Non-ASCII text counts by UTF-8 bytes ("é" is 2)
+        assert list(batches(["éééé", "éé", "x"])) == [["éééé"], ["éé", "x"]]
+        # A text over the budget on its own still gets a batch
+        assert list(batches(["x" * 50, "y"])) == [["x" * 50], ["y"]]
+
+    async def test_query_embeddings_cached(
+        self, rag_engine, monkeypatch, rag_engine_module
+    ):
+        monkeypatch.setattr(rag_engine_module, "_query_embedding_cache", OrderedDict())
+        monkeypatch.setattr(rag_engine_module, "_QUERY_CACHE_SIZE", 2)
+        calls = []
+
+        async def create(model, input):
+            calls.extend(input)
+            return SimpleNamespace(data=[SimpleNamespace(embedding=[0.5, 0.25])])
+
+        rag_engine._openai = SimpleNamespace(embeddings=SimpleNamespace(create=create))
+
+        first = await rag_engine._embed_query("hi")
+        assert first.tolist() == [0.5, 0.25]
+        assert await rag_engine._embed_query("hi") is first
+        assert calls == ["hi"]
+        # Shared with the cache, so callers can't modify it
+        assert not first.flags.writeable
+
+        # Least recently used entries are evicted
+        await rag_engine._embed_query("a")
+        await rag_engine._embed_query("b")
+        await rag_engine._embed_query("hi")
+        assert calls == ["hi", "a", "b", "hi"]
+
+
+class TestRetrieval:
+    async def test_similarities_rounded_without_float32_noise(self, rag_engine):
+        async def embed_query(text):
+            return np.zeros(2, dtype=np.float32)
+
+        rag_engine._embed_query = embed_query
+        rag_engine._vs.query.return_value = {
+            "documents": [["near", "far"]],
+            "metadatas": [[{"filename": "a.txt", "chunk_index": 0}, {"filename": "a.txt"}]],
+            "distances": [[0.135, 0.9]],
+        }
+
+        context, sources = await rag_engine.retrieve_context("q")
+
+        assert [s["similarity"] for s in sources] == [0.865]
+        assert context.endswith("near")
+
+
+class TestIngest:
+    @pytest.fixture
+    def engine(self, rag_engine, monkeypatch, rag_engine_module):
+        monkeypatch.setattr(rag_engine_module, "_ADD_SHARD_SIZE", 3)
+        monkeypatch.setattr(rag_engine, "_chunk_text", lambda text: text.split())
+
+        async def create(model, input):
+            if "bad" in input:
+                raise RuntimeError("embedding failed")
+            return SimpleNamespace(
+                data=[SimpleNamespace(embedding=[float(len(t))]) for t in input]
+            )
+
+        rag_engine._openai = SimpleNamespace(embeddings=SimpleNamespace(create=create))
+        return rag_engine
+
+    async def test_chunks_stored_in_shards(self, engine, tmp_path, initialized_db):
+        doc = tmp_path / "doc.txt"
+        doc.write_text("a bb ccc dddd eeeee ffffff ggggggg")
+        result = await engine.ingest_document(doc, "doc.txt")
+
+        calls = [c.kwargs for c in engine._vs.add_chunks.call_args_list]
+        assert result["chunk_count"] == 7
+        assert [len(c["ids"]) for c in calls] == [3, 3, 1]
+        stored = sorted(
+            (m["chunk_index"], d, e)
+            for c in calls
+            for m, d, e in zip(c["metadatas"], c["documents"], c["embeddings"])
+        )
+        assert [i for i, _, _ in stored] == list(range(7))
+        assert all(e.tolist() == [float(len(d))] for _, d, e in stored)
+        assert all(m["total_chunks"] == 7 for c in calls for m in c["metadatas"])
+
+    async def test_duplicate_chunks_stored_once(self, engine, tmp_path, initialized_db):
+        doc = tmp_path / "doc.txt"
+        doc.write_text("hdr a hdr bb hdr a ccc")
+        result = await engine.ingest_document(doc, "doc.txt")
+
+        calls = [c.kwargs for c in engine._vs.add_chunks.call_args_list]
+        stored = sorted(
+            (m["chunk_index"], d) for c in calls for m, d in zip(c["metadatas"], c["documents"])
+        )
+        # Numbered over the unique chunks, in order of first occurrence
+        assert stored == [(0, "hdr"), (1, "a"), (2, "bb"), (3, "ccc")]
+        assert all(m["total_chunks"] == 4 for c in calls for m in c["metadatas"])
+        assert result["chunk_count"] == 4
+
+    async def test_failed_shard_removes_stored_chunks(self, engine, tmp_path):
+        doc = tmp_path / "doc.txt"
+        doc.write_text("a b c d bad f")
+
+        with pytest.raises(RuntimeError, match="embedding failed"):
+            await engine.ingest_document(doc, "doc.txt")
+        engine._vs.delete_by_document_id.assert_called_once()
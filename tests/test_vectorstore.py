@@ -0,0 +1,169 @@
+import sqlite3
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import chromadb
+import numpy as np
+import pytest
+
+from backend.services.vectorstore import VectorStoreManager
+
+
+@pytest.fixture
+def vs(test_settings):
+    test_settings.chroma_batch_size = 4
+    manager = VectorStoreManager(test_settings)
+    # Let the background warm-up finish so it can't race the tests' queries
+    manager._warm_up_thread.join()
+    calls = []
+    add = manager._collection.add
+
+    def counting_add(**kwargs):
+        calls.append(len(kwargs["ids"]))
+        return add(**kwargs)
+
+    manager._collection.add = counting_add
+    manager.add_calls = calls
+    return manager
+
+
+def _chunks(n, offset=0):
+    ids = [f"doc_chunk_{i}" for i in range(offset, offset + n)]
+    embeddings = np.random.default_rng(0).random((n, 8), dtype=np.float32)
+    documents = [f"text {i}" for i in range(offset, offset + n)]
+    metadatas = [{"document_id": "doc", "chunk_index": i} for i in range(offset, offset + n)]
+    return ids, embeddings, documents, metadatas
+
+
+class TestAddChunks:
+    def test_added_in_configured_windows(self, vs):
+        vs.add_chunks(*_chunks(10))
+        assert vs.add_calls == [4, 4, 2]
+        assert vs.get_document_count() == 10
+
+    def test_list_embeddings_converted_once(self, vs):
+        seen = []
+        add = vs._collection.add
+
+        def spy(**kwargs):
+            seen.append(kwargs["embeddings"])
+            return add(**kwargs)
+
+        vs._collection.add = spy
+        ids, embeddings, documents, metadatas = _chunks(5)
+        vs.add_chunks(ids, embeddings.tolist(), documents, metadatas)
+
+        assert all(e.dtype == np.float32 and e.flags.c_contiguous for e in seen)
+        result = vs.query(embeddings[0].tolist(), n_results=1)
+        assert result["ids"] == [["doc_chunk_0"]]
+
+    def test_batch_size_override(self, vs):
+        vs.add_chunks(*_chunks(10), batch_size=6)
+        assert vs.add_calls == [6, 4]
+
+    def test_streaming_adds_buffer_until_flush(self, vs):
+        ids, embeddings, documents, metadatas = _chunks(6)
+        for chunk in zip(ids, embeddings, documents, metadatas):
+            vs.add_chunk_streaming(*chunk)
+        assert vs.add_calls == [4]
+
+        vs.flush()
+        assert vs.add_calls == [4, 2]
+        assert vs.get_document_count() == 6
+
+        vs.flush()
+        assert vs.add_calls == [4, 2]
+
+
+class TestQuery:
+    def test_batch_returns_results_per_vector(self, vs):
+        ids, embeddings, documents, metadatas = _chunks(5)
+        vs.add_chunks(ids, embeddings, documents, metadatas)
+
+        result = vs.query_batch(embeddings[[3, 1]], n_results=1)
+        assert result["ids"] == [["doc_chunk_3"], ["doc_chunk_1"]]
+
+    def test_batch_honours_where(self, vs):
+        ids, embeddings, documents, metadatas = _chunks(4)
+        metadatas[2]["document_id"] = "other"
+        vs.add_chunks(ids, embeddings, documents, metadatas)
+
+        result = vs.query_batch(embeddings[:2], n_results=1, where={"document_id": "other"})
+        assert result["ids"] == [["doc_chunk_2"], ["doc_chunk_2"]]
+
+
+class TestWarmUp:
+    def _count_queries(self, vs):
+        calls = []
+        query = vs._collection.query
+
+        def counting_query(**kwargs):
+            calls.append(kwargs)
+            return query(**kwargs)
+
+        vs._collection.query = counting_query
+        return calls
+
+    def test_queries_populated_collection(self, vs):
+        vs.add_chunks(*_chunks(3))
+        calls = self._count_queries(vs)
+        vs._warm_up()
+        assert len(calls) == 1 and calls[0]["n_results"] == 1
+
+    def test_skips_empty_collection(self, vs):
+        calls = self._count_queries(vs)
+        vs._warm_up()
+        assert calls == []
+
+
+class TestDelete:
+    def _add_docs(self, vs, *doc_ids):
+        for n, doc_id in enumerate(doc_ids):
+            ids, embeddings, documents, metadatas = _chunks(3, offset=3 * n)
+            for m in metadatas:
+                m["document_id"] = doc_id
+            vs.add_chunks(ids, embeddings, documents, metadatas)
+
+    def test_delete_several_documents_at_once(self, vs):
+        self._add_docs(vs, "a", "b", "c")
+        vs.delete_by_document_ids(["a", "c", "a"])
+        remaining = vs.collection.get()["metadatas"]
+        assert {m["document_id"] for m in remaining} == {"b"}
+
+    def test_delete_single_document(self, vs):
+        self._add_docs(vs, "a", "b")
+        vs.delete_by_document_id("b")
+        assert vs.get_document_count() == 3
+
+    def test_delete_nothing(self, vs):
+        self._add_docs(vs, "a")
+        vs.delete_by_document_ids([])
+        assert vs.get_document_count() == 3
+
+
+class TestFastWrites:
+    def test_wal_enabled_when_configured(self, test_settings):
+        test_settings.chroma_fast_writes = True
+        manager = VectorStoreManager(test_settings)
+        manager.add_chunks(*_chunks(3))
+
+        db = Path(test_settings.chroma_persist_dir) / "chroma.sqlite3"
+        conn = sqlite3.connect(db)
+        try:
+            assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        finally:
+            conn.close()
+        assert manager.get_document_count() == 3
+
+
+class TestServerMode:
+    def test_http_client_used_in_server_mode(self, test_settings, monkeypatch):
+        http_client = MagicMock()
+        monkeypatch.setattr(chromadb, "HttpClient", http_client)
+        test_settings.chroma_mode = "server"
+        test_settings.chroma_host = "chroma.internal"
+
+        manager = VectorStoreManager(test_settings)
+
+        http_client.assert_called_once_with(host="chroma.internal", port=8001)
+        assert manager.collection is http_client.return_value.get_or_create_collection.return_value
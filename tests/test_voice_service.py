@@ -0,0 +1,142 @@
+import io
+import wave
+
+import numpy as np
+import pytest
+
+from backend.services.voice_service import VoiceService, _split_phrases, _split_wav
+
+RATE = 16000
+
+
+def _wav(samples: np.ndarray) -> bytes:
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(RATE)
+        w.writeframes(samples.astype("<i2").tobytes())
+    return buf.getvalue()
+
+
+def _frames(wav_bytes: bytes) -> int:
+    with wave.open(io.BytesIO(wav_bytes)) as w:
+        return w.getnframes()
+
+
+class TestSplitWav:
+    def test_short_recording_not_split(self):
+        assert _split_wav(_wav(np.full(5 * RATE, 1000))) is None
+
+    def test_just_over_one_window_not_split(self):
+        # The quietest spot is at the 20 s mark, so a cut there would leave
+        # a clip too short for Whisper
+        samples = np.full(20 * RATE + 1, 8000)
+        samples[int(19.96 * RATE):] = 0
+        assert _split_wav(_wav(samples)) is None
+
+    def test_no_tiny_last_window(self):
+        # The first cut lands at 18.01 s, leaving 20 s and 50 frames whose
+        # quietest spot is at the end
+        samples = np.full(int(38.01 * RATE) + 50, 8000)
+        samples[18 * RATE:int(18.3 * RATE)] = 0
+        samples[int(37.97 * RATE):] = 0
+        segments = _split_wav(_wav(samples))
+
+        assert len(segments) == 2
+        assert min(_frames(s) for s in segments) >= RATE
+        assert sum(_frames(s) for s in segments) == len(samples)
+
+    def test_non_wav_not_split(self):
+        assert _split_wav(b"ID3\x03not a wav") is None
+
+    def test_cuts_land_in_pauses(self):
+        samples = np.full(45 * RATE, 8000)
+        # Silence at 18.5-18.7 s, inside the search range before the 20 s mark
+        samples[int(18.5 * RATE):int(18.7 * RATE)] = 0
+        segments = _split_wav(_wav(samples))
+
+        assert len(segments) == 3
+        first = _frames(segments[0])
+        assert 18.5 * RATE <= first <= 18.7 * RATE
+        assert sum(_frames(s) for s in segments) == len(samples)
+
+
+class TestTranscribeStream:
+    @pytest.fixture
+    def service(self, test_settings):
+        service = VoiceService(test_settings)
+        calls = []
+
+        async def fake_transcribe(audio_bytes, filename="recording.wav"):
+            calls.append(_frames(audio_bytes))
+            n = len(calls)
+            return {"text": f" part{n} ", "audio_duration_seconds": 1.5}
+
+        service.transcribe = fake_transcribe
+        service.calls = calls
+        return service
+
+    async def test_yields_windows_in_order_then_final(self, service):
+        events = [e async for e in service.transcribe_stream(_wav(np.full(50 * RATE, 100)))]
+
+        assert [e["text"] for e in events] == ["part1", "part2", "part3", "part1 part2 part3"]
+        assert [e["final"] for e in events] == [False, False, False, True]
+        assert events[-1]["audio_duration_seconds"] == 4.5
+
+    async def test_short_recording_single_request(self, service):
+        events = [e async for e in service.transcribe_stream(_wav(np.zeros(RATE)))]
+
+        assert len(service.calls) == 1
+        assert events[-1]["final"] is True
+        assert events[-1]["audio_duration_seconds"] == 1.5
+
+
+class TestSplitPhrases:
+    def test_short_text_single_phrase(self):
+        assert _split_phrases("Hello there. How are you?") == ["Hello there. How are you?"]
+
+    def test_sentences_grouped_up_to_limit(self):
+        sentence = "x" * 90 + "."
+        phrases = _split_phrases(" ".join([sentence] * 5))
+        assert phrases == [f"{sentence} {sentence}"] * 2 + [sentence]
+
+    def test_long_sentence_kept_whole(self):
+        sentence = "word " * 60 + "end."
+        assert _split_phrases(sentence) == [sentence.strip()]
+
+
+class TestSynthesizeStream:
+    @pytest.fixture
+    def service(self, test_settings):
+        service = VoiceService(test_settings)
+        service._tts_format = "mp3"
+        service.requests = []
+
+        async def fake_stream(text, voice, chunk_size):
+            service.requests.append(text)
+            yield b"A"
+            yield b"B"
+
+        async def fake_fetch(text, voice):
+            service.requests.append(text)
+            return text[:3].encode()
+
+        service._stream_phrase = fake_stream
+        service._fetch_phrase = fake_fetch
+        return service
+
+    async def test_phrases_yielded_in_order(self, service):
+        text = " ".join(f"{c * 150}." for c in "pqr")
+        chunks = [c async for c in service.synthesize_stream(text)]
+
+        assert chunks == [b"A", b"B", b"qqq", b"rrr"]
+        assert sorted(service.requests) == sorted(_split_phrases(text))
+
+    async def test_non_mp3_single_request(self, service):
+        service._tts_format = "wav"
+        text = " ".join(f"{c * 150}." for c in "pqr")
+        chunks = [c async for c in service.synthesize_stream(text)]
+
+        assert chunks == [b"A", b"B"]
+        assert service.requests == [text]